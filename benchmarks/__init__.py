@@ -0,0 +1,3 @@
+"""
+Benchmark and capacity-planning tools for Dicto
+"""
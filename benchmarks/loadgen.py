@@ -0,0 +1,427 @@
+"""
+Load generator for Dicto capacity planning
+Replays recordings against a running instance, ramps concurrency and
+recommends worker/replica counts from the resulting saturation curve
+"""
+
+import argparse
+import io
+import json
+import math
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class RequestResult:
+    latency: float
+    ok: bool
+    status: int
+
+
+@dataclass
+class StageResult:
+    concurrency: int
+    elapsed: float
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def completed(self) -> int:
+        return len(self.latencies) + self.errors
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.completed if self.completed else 0.0
+
+    def percentile(self, pct: float) -> float:
+        return percentile(self.latencies, pct)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "throughput_rps": round(self.throughput, 3),
+            "p50_s": round(self.percentile(50), 3),
+            "p95_s": round(self.percentile(95), 3),
+            "p99_s": round(self.percentile(99), 3),
+            "error_rate": round(self.error_rate, 4),
+        }
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile, 0.0 for an empty sample"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def sample_durations(
+    count: int,
+    median_s: float = 45.0,
+    sigma: float = 1.0,
+    min_s: float = 3.0,
+    max_s: float = 900.0,
+    rng: Optional[random.Random] = None,
+) -> List[float]:
+    """Draw recording lengths from a clamped log-normal distribution.
+
+    Voice notes are mostly short with a long tail of meeting-length
+    recordings, which a log-normal around the median captures well.
+    """
+    rng = rng or random.Random()
+    mu = math.log(median_s)
+    return [min(max_s, max(min_s, rng.lognormvariate(mu, sigma))) for _ in range(count)]
+
+
+def synthesize_recording(duration_s: float) -> bytes:
+    """Build a webm recording of the given length (requires ffmpeg)"""
+    from pydub.generators import Sine, WhiteNoise
+
+    duration_ms = int(duration_s * 1000)
+    tone = Sine(220).to_audio_segment(duration=duration_ms, volume=-20)
+    noise = WhiteNoise().to_audio_segment(duration=duration_ms, volume=-40)
+    buffer = io.BytesIO()
+    tone.overlay(noise).export(buffer, format="webm")
+    return buffer.getvalue()
+
+
+class RecordingPool:
+    """Pre-built upload payloads keyed by duration bucket"""
+
+    def __init__(self, payloads: List[Tuple[float, bytes, str]], rng: Optional[random.Random] = None):
+        if not payloads:
+            raise ValueError("RecordingPool needs at least one recording")
+        self.payloads = payloads
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_directory(cls, directory: Path, rng: Optional[random.Random] = None) -> "RecordingPool":
+        payloads = []
+        for path in sorted(directory.iterdir()):
+            if path.is_file():
+                payloads.append((0.0, path.read_bytes(), path.name))
+        return cls(payloads, rng)
+
+    @classmethod
+    def synthetic(
+        cls,
+        durations: Sequence[float],
+        bucket_s: float = 15.0,
+        synthesize: Callable[[float], bytes] = synthesize_recording,
+        rng: Optional[random.Random] = None,
+    ) -> "RecordingPool":
+        """Bucket the sampled durations so each distinct length is encoded once"""
+        cache: Dict[float, bytes] = {}
+        payloads = []
+        for duration in durations:
+            bucket = max(bucket_s, round(duration / bucket_s) * bucket_s)
+            if bucket not in cache:
+                cache[bucket] = synthesize(bucket)
+            payloads.append((bucket, cache[bucket], f"loadgen_{int(bucket)}s.webm"))
+        return cls(payloads, rng)
+
+    def pick(self) -> Tuple[float, bytes, str]:
+        return self.rng.choice(self.payloads)
+
+
+def encode_multipart(field_name: str, filename: str, data: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+        "Content-Type: audio/webm\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    return head + data + tail, f"multipart/form-data; boundary={boundary}"
+
+
+def post_recording(url: str, payload: Tuple[float, bytes, str], timeout: float) -> RequestResult:
+    _, data, filename = payload
+    body, content_type = encode_multipart("audio", filename, data)
+    req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = 0
+    latency = time.perf_counter() - start
+    return RequestResult(latency=latency, ok=200 <= status < 300, status=status)
+
+
+def run_stage(
+    send: Callable[[], RequestResult],
+    concurrency: int,
+    duration_s: float,
+    max_requests: Optional[int] = None,
+) -> StageResult:
+    """Keep `concurrency` requests in flight for `duration_s` seconds"""
+    result = StageResult(concurrency=concurrency, elapsed=0.0)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration_s
+    issued = 0
+
+    def claim() -> bool:
+        nonlocal issued
+        with lock:
+            if time.perf_counter() >= deadline:
+                return False
+            if max_requests is not None and issued >= max_requests:
+                return False
+            issued += 1
+            return True
+
+    def worker() -> None:
+        while claim():
+            outcome = send()
+            with lock:
+                if outcome.ok:
+                    result.latencies.append(outcome.latency)
+                else:
+                    result.errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def ramp_levels(start: int, stop: int, factor: float = 2.0) -> List[int]:
+    levels = []
+    level = max(1, start)
+    while level <= stop:
+        levels.append(level)
+        level = max(level + 1, int(level * factor))
+    return levels
+
+
+def find_knee(
+    stages: Sequence[StageResult],
+    latency_slo_s: float,
+    max_error_rate: float = 0.01,
+    slo_percentile: float = 95,
+) -> Optional[StageResult]:
+    """Highest-throughput stage that still meets the latency SLO and error budget"""
+    healthy = [
+        s for s in stages
+        if s.latencies
+        and s.percentile(slo_percentile) <= latency_slo_s
+        and s.error_rate <= max_error_rate
+    ]
+    if not healthy:
+        return None
+    return max(healthy, key=lambda s: (s.throughput, -s.concurrency))
+
+
+def recommend(
+    knee: Optional[StageResult],
+    server_workers: int,
+    target_rps: float,
+    cpu_per_pod: float,
+    memory_per_pod_mb: float,
+    memory_per_worker_mb: float,
+    workers_per_cpu: float = 4.0,
+) -> Dict[str, float]:
+    """Turn the measured knee into workers-per-pod and replica counts.
+
+    Workers are bounded by memory (decoded PCM dominates) and by CPU, where
+    `workers_per_cpu` > 1 reflects that most request time is spent waiting
+    on upstream APIs rather than burning CPU.
+    """
+    if knee is None or knee.throughput <= 0:
+        return {"error": "no stage met the SLO; lower the starting concurrency or relax --slo"}
+
+    busy_workers = min(knee.concurrency, server_workers)
+    rps_per_worker = knee.throughput / busy_workers
+    memory_limited = max(1, int(memory_per_pod_mb // memory_per_worker_mb))
+    cpu_limited = max(1, int(cpu_per_pod * workers_per_cpu))
+    workers_per_pod = min(memory_limited, cpu_limited)
+    rps_per_pod = rps_per_worker * workers_per_pod
+    replicas = max(1, math.ceil(target_rps / rps_per_pod)) if target_rps > 0 else 1
+    return {
+        "knee_concurrency": knee.concurrency,
+        "knee_throughput_rps": round(knee.throughput, 3),
+        "rps_per_worker": round(rps_per_worker, 3),
+        "workers_per_pod": workers_per_pod,
+        "workers_limited_by": "memory" if memory_limited <= cpu_limited else "cpu",
+        "rps_per_pod": round(rps_per_pod, 3),
+        "replicas": replicas,
+    }
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    transcription_latency_s = 0.5
+    transcription_latency_per_mb_s = 1.0
+    chat_latency_s = 1.0
+    error_rate = 0.0
+
+    def log_message(self, format: str, *args: object) -> None:  # silence per-request logging
+        pass
+
+    def _reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self) -> bool:
+        if random.random() < self.error_rate:
+            self._reply(500, b'{"error": {"message": "injected failure"}}', "application/json")
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        self._reply(200, b'{"object": "list", "data": []}', "application/json")
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self._maybe_fail():
+            return
+        if self.path.endswith("/audio/transcriptions"):
+            time.sleep(self.transcription_latency_s + self.transcription_latency_per_mb_s * length / 1e6)
+            self._reply(200, b"This is a synthetic load test transcript.", "text/plain")
+        elif self.path.endswith("/chat/completions"):
+            time.sleep(self.chat_latency_s)
+            body = {
+                "id": "chatcmpl-loadgen",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4o-mini",
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "## Load Test ##\n- Synthetic summary"},
+                }],
+            }
+            self._reply(200, json.dumps(body).encode(), "application/json")
+        else:
+            self._reply(404, b'{"error": {"message": "not found"}}', "application/json")
+
+
+def serve_fake_openai(port: int, transcription_latency_s: float, chat_latency_s: float,
+                      error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start a fake OpenAI API; point Dicto at it with OPENAI_BASE_URL=http://host:port/v1"""
+    handler = type("FakeOpenAIHandler", (_FakeOpenAIHandler,), {
+        "transcription_latency_s": transcription_latency_s,
+        "chat_latency_s": chat_latency_s,
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def format_table(stages: Sequence[StageResult]) -> str:
+    header = f"{'conc':>5} {'done':>6} {'rps':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'err%':>6}"
+    rows = [header]
+    for s in stages:
+        rows.append(
+            f"{s.concurrency:>5} {s.completed:>6} {s.throughput:>8.2f} "
+            f"{s.percentile(50):>7.2f} {s.percentile(95):>7.2f} {s.percentile(99):>7.2f} "
+            f"{100 * s.error_rate:>6.1f}"
+        )
+    return "\n".join(rows)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Ramp load against Dicto and recommend pod sizing")
+    parser.add_argument("--url", default="http://localhost:5005", help="Base URL of the Dicto instance")
+    parser.add_argument("--audio-dir", type=Path, help="Replay recordings from this directory instead of synthesising")
+    parser.add_argument("--median-length", type=float, default=45.0, help="Median synthetic recording length (s)")
+    parser.add_argument("--length-sigma", type=float, default=1.0, help="Log-normal sigma for recording lengths")
+    parser.add_argument("--max-length", type=float, default=600.0, help="Longest synthetic recording (s)")
+    parser.add_argument("--samples", type=int, default=50, help="Number of recording lengths to sample")
+    parser.add_argument("--start", type=int, default=1, help="Starting concurrency")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Highest concurrency to try")
+    parser.add_argument("--stage-seconds", type=float, default=60.0, help="Duration of each ramp stage")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout (s)")
+    parser.add_argument("--slo", type=float, default=30.0, help="p95 latency SLO in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error budget per stage")
+    parser.add_argument("--server-workers", type=int, default=1, help="Gunicorn workers on the target pod")
+    parser.add_argument("--target-rps", type=float, default=1.0, help="Peak request rate to size for")
+    parser.add_argument("--cpu", type=float, default=1.0, help="CPU cores per pod")
+    parser.add_argument("--memory", type=float, default=1024.0, help="Memory per pod (MB)")
+    parser.add_argument("--memory-per-worker", type=float, default=256.0, help="Peak memory per worker (MB)")
+    parser.add_argument("--fake-openai-port", type=int, help="Also serve a fake OpenAI API on this port")
+    parser.add_argument("--fake-transcription-latency", type=float, default=0.5)
+    parser.add_argument("--fake-chat-latency", type=float, default=1.0)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    parser.add_argument("--json", type=Path, help="Write the curve and recommendation to this file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    rng = random.Random(args.seed)
+
+    if args.fake_openai_port:
+        serve_fake_openai(args.fake_openai_port, args.fake_transcription_latency,
+                          args.fake_chat_latency, args.fake_error_rate)
+        print(f"Fake OpenAI API on http://0.0.0.0:{args.fake_openai_port}/v1 "
+              "(start Dicto with OPENAI_BASE_URL pointing here)")
+
+    if args.audio_dir:
+        pool = RecordingPool.from_directory(args.audio_dir, rng)
+    else:
+        durations = sample_durations(args.samples, args.median_length, args.length_sigma,
+                                     max_s=args.max_length, rng=rng)
+        pool = RecordingPool.synthetic(durations, rng=rng)
+
+    endpoint = args.url.rstrip("/") + "/api/process-audio"
+    stages = []
+    for level in ramp_levels(args.start, args.max_concurrency):
+        stage = run_stage(lambda: post_recording(endpoint, pool.pick(), args.timeout), level, args.stage_seconds)
+        stages.append(stage)
+        print(format_table([stage]).splitlines()[-1], flush=True)
+        if stage.error_rate > 0.5:
+            print("Error rate above 50%, stopping ramp")
+            break
+
+    knee = find_knee(stages, args.slo, args.max_error_rate)
+    recommendation = recommend(knee, args.server_workers, args.target_rps, args.cpu,
+                               args.memory, args.memory_per_worker)
+
+    print()
+    print(format_table(stages))
+    print()
+    print(json.dumps(recommendation, indent=2))
+    if "workers_per_pod" in recommendation:
+        print(f"\nSet WEB_CONCURRENCY={recommendation['workers_per_pod']} and "
+              f"replicas: {recommendation['replicas']} in k8s/deployment-prod.yaml")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "curve": [s.summary() for s in stages],
+            "recommendation": recommendation,
+            "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Full-text search benchmark
+Fills a scratch note store with synthetic notes and reports query latency
+percentiles for the FTS5 index
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from benchmarks.loadgen import percentile
+from website.note_store import NoteStore
+
+WORDS = (
+    "project meeting deadline budget client design review launch roadmap hiring "
+    "invoice research prototype feedback marketing sprint release customer support "
+    "training workshop strategy analytics dashboard migration database backup travel "
+    "doctor appointment groceries birthday holiday garden recipe podcast book idea"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    vocabulary = WORDS + [f"term{i}" for i in range(5000)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words)) + "."
+
+
+def populate(store: NoteStore, count: int, owners: int, rng: random.Random, batch: int = 5000) -> None:
+    for start in range(0, count, batch):
+        with store.transaction():
+            for _ in range(min(batch, count - start)):
+                summary = f"## {synthetic_text(rng, 6)} ##\n- {synthetic_text(rng, 30)}"
+                store.save(synthetic_text(rng, 250), summary, summary, owner=f"owner{rng.randrange(owners)}")
+        print(f"  {min(start + batch, count)}/{count} notes", flush=True)
+
+
+def run_queries(store: NoteStore, queries: List[str], limit: int, owner: str) -> List[float]:
+    """Latency in ms of each page fetched (first page, plus the second when there is one)"""
+    latencies = []
+    for query in queries:
+        cursor = None
+        for _ in range(2):
+            start = time.perf_counter()
+            page = store.search(query, owner=owner, limit=limit, cursor=cursor)
+            latencies.append((time.perf_counter() - start) * 1000)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+    return latencies
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark note search latency")
+    parser.add_argument("--notes", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--owners", type=int, default=1,
+                        help="Spread the notes over this many owners (1, the worst case, puts them all in one)")
+    parser.add_argument("--db", type=Path, help="Reuse (or create) this database instead of a temp file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    db_path = args.db or Path(tempfile.mkdtemp()) / "search_bench.sqlite3"
+    store = NoteStore(str(db_path))
+
+    existing = store._connect().execute("SELECT count(*) FROM notes").fetchone()[0]
+    if existing < args.notes:
+        print(f"Populating {db_path} with {args.notes - existing} notes...")
+        populate(store, args.notes - existing, args.owners, rng)
+
+    queries = []
+    for _ in range(args.queries):
+        words = rng.sample(WORDS, rng.choice([1, 2, 3]))
+        if rng.random() < 0.3:
+            words[-1] = words[-1][:3]  # prefix query, as typed
+        queries.append(" ".join(words))
+
+    latencies = run_queries(store, queries, args.limit, owner="owner0")
+    print(f"{args.notes} notes over {args.owners} owner(s), {len(queries)} queries, {len(latencies)} pages")
+    for pct in (50, 95, 99):
+        print(f"  p{pct}: {percentile(latencies, pct):.2f} ms")
+    print(f"  max: {max(latencies):.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
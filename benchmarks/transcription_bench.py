@@ -0,0 +1,107 @@
+"""
+Transcription backend benchmark
+Real-time factor of the local CPU backend across thread counts, compared
+with the hosted OpenAI Whisper latency on the same recordings
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from website.transcription_backends import LocalWhisperBackend, TranscriptionBackend
+
+
+def audio_duration_s(path: Path) -> float:
+    from pydub import AudioSegment
+
+    return len(AudioSegment.from_file(str(path))) / 1000
+
+
+def time_backend(
+    backend: TranscriptionBackend,
+    files: Sequence[Path],
+    durations: Dict[Path, float],
+    repeats: int = 1,
+    clock: Callable[[], float] = time.perf_counter,
+) -> Dict[str, float]:
+    """Mean latency and real-time factor (processing time / audio time)"""
+    latencies: List[float] = []
+    rtfs: List[float] = []
+    for _ in range(repeats):
+        for path in files:
+            start = clock()
+            backend.transcribe(str(path))
+            elapsed = clock() - start
+            latencies.append(elapsed)
+            if durations.get(path):
+                rtfs.append(elapsed / durations[path])
+    return {
+        "mean_latency_s": round(statistics.mean(latencies), 3),
+        "max_latency_s": round(max(latencies), 3),
+        "rtf": round(statistics.mean(rtfs), 4) if rtfs else 0.0,
+    }
+
+
+def bench_local(files: Sequence[Path], durations: Dict[Path, float], thread_counts: Sequence[int],
+                model_size: str, compute_type: str, repeats: int) -> List[Dict[str, float]]:
+    rows = []
+    for threads in thread_counts:
+        backend = LocalWhisperBackend(model_size=model_size, compute_type=compute_type, cpu_threads=threads)
+        load_start = time.perf_counter()
+        backend.warm_up()
+        load_s = time.perf_counter() - load_start
+        row = {"backend": "local", "threads": threads, "load_s": round(load_s, 2)}
+        row.update(time_backend(backend, files, durations, repeats))
+        rows.append(row)
+        print(json.dumps(row), flush=True)
+    return rows
+
+
+def bench_hosted(files: Sequence[Path], durations: Dict[Path, float], repeats: int) -> Dict[str, float]:
+    from openai import OpenAI
+
+    from website.resilience import RetryPolicy
+    from website.transcription_backends import OpenAIWhisperBackend
+
+    backend = OpenAIWhisperBackend(OpenAI(max_retries=0), RetryPolicy(max_retries=0))
+    row = {"backend": "openai", "threads": 0}
+    row.update(time_backend(backend, files, durations, repeats))
+    print(json.dumps(row), flush=True)
+    return row
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark local vs hosted transcription")
+    parser.add_argument("files", nargs="+", type=Path, help="Audio files to transcribe")
+    parser.add_argument("--threads", default="1,2,4,8", help="Comma-separated CPU thread counts")
+    parser.add_argument("--model", default=os.getenv("LOCAL_WHISPER_MODEL", "base"))
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--skip-local", action="store_true")
+    parser.add_argument("--hosted", action="store_true", help="Also time the OpenAI API (needs OPENAI_API_KEY)")
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    durations = {path: audio_duration_s(path) for path in args.files}
+    print(f"{len(args.files)} files, {sum(durations.values()):.1f}s of audio")
+
+    results = []
+    if not args.skip_local:
+        thread_counts = [int(t) for t in args.threads.split(",") if t]
+        results.extend(bench_local(args.files, durations, thread_counts, args.model,
+                                   args.compute_type, args.repeats))
+    if args.hosted:
+        results.append(bench_hosted(args.files, durations, args.repeats))
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@
 #!/bin/bash
   echo "Deploying Dicto to Kubernetes..."
   eval $(minikube docker-env)
-  docker build -t dicto:latest .
+  docker build --build-arg MARKED_SHA256="${MARKED_SHA256:?set MARKED_SHA256 (see README)}" -t dicto:latest .
   kubectl apply -f k8s/secret.yaml
   kubectl apply -f k8s/deployment-local.yaml
   kubectl apply -f k8s/service.yaml
@@ -11,6 +11,111 @@ from werkzeug.datastructures import FileStorage
 from io import BytesIO
 
 from website import create_app
+from website import dedup
+from website import latency
+from website import memory_budget
+from website import model_routing
+from website import note_store
+from website import owners
+from website import recording_sessions
+from website import resilience
+from website import saturation
+from website import scratch
+from website import vector_index
+
+
+@pytest.fixture(autouse=True)
+def isolated_note_store(tmp_path, monkeypatch) -> note_store.NoteStore:
+    """Point the note store at a per-test database"""
+    store = note_store.NoteStore(str(tmp_path / "notes.sqlite3"))
+    monkeypatch.setattr(note_store, "_store", store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def isolated_vector_index(tmp_path, monkeypatch) -> vector_index.VectorIndex:
+    """Point the similarity index at a per-test directory with the local embedder"""
+    embedder = vector_index.HashingEmbedder(dim=64)
+    index = vector_index.VectorIndex(str(tmp_path / "vectors"), embedder.dim)
+    monkeypatch.setattr(vector_index, "_embedder", embedder)
+    monkeypatch.setattr(vector_index, "_index", index)
+    return index
+
+
+@pytest.fixture(autouse=True)
+def isolated_single_flight(tmp_path, monkeypatch) -> dedup.SingleFlight:
+    """Keep request deduplication state per test"""
+    flight = dedup.SingleFlight(str(tmp_path / "dedup.sqlite3"))
+    monkeypatch.setattr(dedup, "_flight", flight)
+    return flight
+
+
+@pytest.fixture(autouse=True)
+def isolated_decode_budget(tmp_path, monkeypatch) -> memory_budget.MemoryBudget:
+    """Keep decode memory reservations per test"""
+    budget = memory_budget.MemoryBudget(str(tmp_path / "decode_memory.sqlite3"), capacity_bytes=512 * memory_budget.MIB)
+    monkeypatch.setattr(memory_budget, "_budget", budget)
+    return budget
+
+
+@pytest.fixture(autouse=True)
+def isolated_latency(tmp_path, monkeypatch) -> latency.LatencyRecorder:
+    """Keep rolling latency histograms per test, flushed only on demand"""
+    recorder = latency.LatencyRecorder(str(tmp_path / "latency"), flush_interval_s=0)
+    monkeypatch.setattr(latency, "_recorder", recorder)
+    return recorder
+
+
+@pytest.fixture(autouse=True)
+def isolated_saturation(tmp_path, monkeypatch) -> saturation.SaturationBoard:
+    """Keep pod occupancy counters per test"""
+    board = saturation.SaturationBoard(
+        str(tmp_path / "saturation"), capacities={"decode": 2, "transcription": 8, "summarization": 8}
+    )
+    monkeypatch.setattr(saturation, "_board", board)
+    return board
+
+
+@pytest.fixture(autouse=True)
+def isolated_recording_sessions(tmp_path, monkeypatch) -> recording_sessions.RecordingSessionStore:
+    """Keep segmented recording sessions per test"""
+    store = recording_sessions.RecordingSessionStore(str(tmp_path / "sessions.sqlite3"))
+    monkeypatch.setattr(recording_sessions, "_sessions", store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def isolated_circuit_breakers(monkeypatch) -> dict:
+    """Start every test with all upstream circuits closed"""
+    breakers: dict = {}
+    monkeypatch.setattr(resilience, "_breakers", breakers)
+    return breakers
+
+
+@pytest.fixture(autouse=True)
+def isolated_model_router(monkeypatch) -> model_routing.ModelRouter:
+    """Route between two fake models with no latency or error history"""
+    router = model_routing.ModelRouter(
+        [model_routing.ModelOption("small-model", 16_000), model_routing.ModelOption("large-model", 1_000_000)]
+    )
+    monkeypatch.setattr(model_routing, "_router", router)
+    return router
+
+
+@pytest.fixture(autouse=True)
+def isolated_scratch(tmp_path, monkeypatch) -> scratch.ScratchSpace:
+    """Keep temp audio files in a per-test scratch directory, without the reaper thread"""
+    space = scratch.ScratchSpace(str(tmp_path / "scratch"), quota_bytes=64 * scratch.MIB, reap_interval_s=0)
+    monkeypatch.setattr(scratch, "_scratch", space)
+    return space
+
+
+@pytest.fixture(autouse=True)
+def isolated_assets(tmp_path, monkeypatch) -> str:
+    """Build static assets into a per-test directory instead of the source tree"""
+    out_dir = str(tmp_path / "assets")
+    monkeypatch.setenv("ASSET_DIR", out_dir)
+    return out_dir
 
 
 @pytest.fixture
@@ -29,10 +134,21 @@ def app() -> Generator[Flask, None, None]:
     yield test_app
 
 
+TEST_OWNER_TOKEN = "test-owner-token-0123456789"
+
+
 @pytest.fixture
 def client(app: Flask) -> FlaskClient:
-    """Create a test client for the Flask app"""
-    return app.test_client()
+    """Create a test client for the Flask app, sending a fixed owner cookie"""
+    test_client = app.test_client()
+    test_client.set_cookie(owners.OWNER_COOKIE, TEST_OWNER_TOKEN)
+    return test_client
+
+
+@pytest.fixture
+def client_owner() -> str:
+    """Owner key of the notes the test client can see"""
+    return owners.owner_key(TEST_OWNER_TOKEN)
 
 
 @pytest.fixture
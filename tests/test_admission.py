@@ -0,0 +1,215 @@
+"""
+Tests for per-stage admission control and load shedding
+"""
+import json
+import threading
+import time
+
+import pytest
+from flask.testing import FlaskClient
+
+from website import admission, views
+from website.admission import Job, Overloaded, StageLimiter, limit_stage, scheduled_as
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def queue_up(limiter, name, order, **kwargs):
+    """Start a thread that waits for a slot and records when it gets one"""
+    expected = limiter.queued + 1
+    thread = threading.Thread(
+        target=lambda: (limiter.acquire(**kwargs), order.append(name)), daemon=True
+    )
+    thread.start()
+    wait_for(lambda: limiter.queued == expected)
+
+
+def drain(limiter, order, count):
+    """Release the busy slot count times, letting one queued request in each time"""
+    for served in range(1, count + 1):
+        limiter.release(0.1)
+        wait_for(lambda: len(order) == served)
+
+
+class TestStageLimiter:
+    """Test concurrency limiting and shedding decisions"""
+
+    def test_admits_up_to_max_concurrent(self):
+        """Test free slots are granted without queueing"""
+        limiter = StageLimiter("test", max_concurrent=2, max_queue=0, wait_budget_s=1)
+
+        assert limiter.acquire() == 0.0
+        assert limiter.acquire() == 0.0
+        assert limiter.in_flight == 2
+
+    def test_rejects_when_queue_full(self):
+        """Test a full queue sheds immediately"""
+        limiter = StageLimiter("test", max_concurrent=1, max_queue=0, wait_budget_s=10)
+        limiter.acquire()
+
+        with pytest.raises(Overloaded) as excinfo:
+            limiter.acquire()
+        assert excinfo.value.reason == "queue_full"
+
+    def test_rejects_when_estimated_wait_exceeds_budget(self):
+        """Test shedding based on estimated wait rather than queue length"""
+        limiter = StageLimiter("test", max_concurrent=1, max_queue=10, wait_budget_s=5,
+                               initial_service_s=20)
+        limiter.acquire()
+
+        with pytest.raises(Overloaded) as excinfo:
+            limiter.acquire()
+        assert excinfo.value.reason == "wait_budget"
+        assert excinfo.value.retry_after_header == "20"
+
+    def test_queued_request_runs_after_release(self):
+        """Test a queued request gets the slot once it is released"""
+        limiter = StageLimiter("test", max_concurrent=1, max_queue=1, wait_budget_s=5,
+                               initial_service_s=0.1)
+        limiter.acquire()
+        waited = []
+
+        thread = threading.Thread(target=lambda: waited.append(limiter.acquire()))
+        thread.start()
+        time.sleep(0.05)
+        assert limiter.queued == 1
+        limiter.release(0.1)
+        thread.join(timeout=2)
+
+        assert waited and waited[0] > 0
+        assert limiter.in_flight == 1
+        assert limiter.queued == 0
+
+    def test_service_time_ewma(self):
+        """Test the service-time estimate tracks observed durations"""
+        limiter = StageLimiter("test", max_concurrent=1, max_queue=0, wait_budget_s=1,
+                               initial_service_s=1.0, ewma_alpha=0.5)
+        with limiter.admit():
+            pass
+
+        assert limiter.in_flight == 0
+        assert limiter.service_s < 1.0
+
+
+class TestFairScheduling:
+    """Test per-client fair queueing and the fast lane"""
+
+    def limiter(self, **kwargs):
+        options = dict(max_concurrent=1, max_queue=20, wait_budget_s=30, initial_service_s=0.01,
+                       fast_lane_max_cost=60)
+        options.update(kwargs)
+        limiter = StageLimiter("test", **options)
+        limiter.acquire()
+        return limiter
+
+    def test_clients_interleave(self):
+        """A client arriving behind another's backlog is served next, not last"""
+        limiter = self.limiter()
+        order = []
+        for i in range(3):
+            queue_up(limiter, f"a{i}", order, client="a", cost=600)
+        queue_up(limiter, "b0", order, client="b", cost=600)
+        drain(limiter, order, 4)
+        assert order == ["a0", "b0", "a1", "a2"]
+
+    def test_fast_lane_overtakes_long_recordings(self):
+        """A short recording doesn't wait behind queued long ones"""
+        limiter = self.limiter()
+        order = []
+        for i in range(3):
+            queue_up(limiter, f"long{i}", order, client="a", cost=3600)
+        queue_up(limiter, "short", order, client="b", cost=30)
+        drain(limiter, order, 4)
+        assert order.index("short") <= 1
+
+    def test_bulk_lane_is_not_starved(self):
+        """The bulk lane still gets turns while the fast lane is busy"""
+        limiter = self.limiter(fast_lane_weight=3)
+        order = []
+        queue_up(limiter, "long", order, client="a", cost=3600)
+        for i in range(6):
+            queue_up(limiter, f"short{i}", order, client=f"c{i}", cost=10)
+        drain(limiter, order, 7)
+        assert order.index("long") <= 3
+
+    def test_weights(self):
+        """A client with twice the weight gets twice the turns"""
+        limiter = self.limiter()
+        order = []
+        for i in range(4):
+            queue_up(limiter, "heavy", order, client="heavy", cost=600, weight=2)
+        for i in range(4):
+            queue_up(limiter, "light", order, client="light", cost=600)
+        drain(limiter, order, 6)
+        assert order.count("heavy") == 4
+        assert order.count("light") == 2
+
+    def test_client_queue_cap(self):
+        """One client can't take every queue place"""
+        limiter = self.limiter(max_queue_per_client=2)
+        order = []
+        queue_up(limiter, "a0", order, client="a")
+        queue_up(limiter, "a1", order, client="a")
+        with pytest.raises(Overloaded) as excinfo:
+            limiter.acquire(client="a")
+        assert excinfo.value.reason == "client_queue_full"
+        queue_up(limiter, "b0", order, client="b")
+        drain(limiter, order, 3)
+
+    def test_timed_out_request_leaves_queue(self):
+        """A request that gives up is skipped when slots free up"""
+        limiter = self.limiter(wait_budget_s=0.1, initial_service_s=0.001)
+        with pytest.raises(Overloaded) as excinfo:
+            limiter.acquire(client="a")
+        assert excinfo.value.reason == "timeout"
+        assert limiter.queued == 0
+        limiter.release(0.001)
+        assert limiter.acquire(client="b") == 0.0
+
+    def test_stage_runs_as_current_job(self, monkeypatch):
+        """limit_stage schedules on behalf of the job set by scheduled_as"""
+        seen = []
+        limiter = StageLimiter("decode", max_concurrent=1, max_queue=0, wait_budget_s=1)
+        monkeypatch.setattr(limiter, "acquire", lambda client, cost, weight: seen.append((client, cost)))
+        monkeypatch.setitem(admission.stage_limiters, "decode", limiter)
+
+        with scheduled_as(Job("alice", 42.0)):
+            limit_stage("decode")(lambda: None)()
+        assert seen == [("alice", 42.0)]
+
+    @pytest.mark.parametrize("forwarded, trusted_hops, expected", [
+        ("198.51.100.1, 203.0.113.7", "1", "203.0.113.7"),
+        ("198.51.100.1, 203.0.113.7, 10.0.0.2", "2", "203.0.113.7"),
+        ("203.0.113.7", "3", "203.0.113.7"),
+    ])
+    def test_client_id_from_trusted_hop(self, app, monkeypatch, forwarded, trusted_hops, expected):
+        """Clients are identified by the X-Forwarded-For entry our proxies added, not ones they sent"""
+        monkeypatch.setenv("CLIENT_ID_HEADER", "X-Forwarded-For")
+        monkeypatch.setenv("CLIENT_ID_TRUSTED_HOPS", trusted_hops)
+        with app.test_request_context(headers={"X-Forwarded-For": forwarded}):
+            assert views._client_id() == expected
+
+
+class TestLoadShedding:
+    """Test the API surfaces overload as 429"""
+
+    def test_process_audio_returns_429(self, client: FlaskClient, mock_audio_file, monkeypatch):
+        """Test a saturated decode stage returns 429 with Retry-After"""
+        busy = StageLimiter("decode", max_concurrent=1, max_queue=0, wait_budget_s=1,
+                            initial_service_s=3)
+        busy.in_flight = 1
+        monkeypatch.setitem(admission.stage_limiters, "decode", busy)
+
+        response = client.post('/api/process-audio',
+                               data={'audio': mock_audio_file},
+                               content_type='multipart/form-data')
+
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '3'
+        data = json.loads(response.get_data(as_text=True))
+        assert 'error' in data
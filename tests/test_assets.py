@@ -0,0 +1,100 @@
+"""
+Tests for fingerprinted static assets and compressed responses
+"""
+import gzip
+import json
+import os
+
+from website import assets
+from website.assets import build_assets, minify_css, minify_js
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class TestMinify:
+    """Test the minifiers keep what matters"""
+
+    def test_css_keeps_strings(self):
+        """Comments and whitespace go; quoted strings are untouched"""
+        source = "/* c */\n.a  {\n  content: \"a  ;  b\";\n  color:  red;\n}\n"
+        assert minify_css(source) == '.a{content:"a  ;  b";color:red}'
+
+    def test_js_keeps_lines_and_templates(self):
+        """Indentation and comment lines go; line breaks and template literals stay"""
+        source = "// header\nfunction f() {\n    const s = `a\n    b`;\n\n    return s\n}\n"
+        assert minify_js(source) == "function f() {\nconst s = `a\n    b`;\nreturn s\n}\n"
+
+
+class TestBuild:
+    """Test hashed, precompressed output"""
+
+    def test_hashed_and_compressed(self, tmp_path):
+        """Each file gets a content hash in its name and a gzip copy"""
+        write(str(tmp_path / "static/css/style.css"), ".a {\n  color: red;\n}\n")
+        manifest = build_assets(str(tmp_path / "static"), str(tmp_path / "dist"))
+        target = manifest["css/style.css"]
+        assert target.startswith("css/style.") and target.endswith(".css")
+        with gzip.open(tmp_path / "dist" / (target + ".gz")) as f:
+            assert f.read() == b".a{color:red}"
+        with open(tmp_path / "dist/manifest.json") as f:
+            assert json.load(f) == manifest
+
+    def test_hash_follows_content(self, tmp_path):
+        """Changing a file changes its name; rebuilding the same content keeps it"""
+        path = str(tmp_path / "static/js/app.js")
+        write(path, "let a = 1\n")
+        first = build_assets(str(tmp_path / "static"), str(tmp_path / "dist"))["js/app.js"]
+        assert build_assets(str(tmp_path / "static"), str(tmp_path / "dist"))["js/app.js"] == first
+        write(path, "let a = 2\n")
+        assert build_assets(str(tmp_path / "static"), str(tmp_path / "dist"))["js/app.js"] != first
+
+
+class TestServing:
+    """Test asset URLs, cache headers and content negotiation"""
+
+    def test_pages_link_hashed_assets(self, client, app):
+        """Templates point at the fingerprinted files"""
+        manifest = app.extensions["dicto_assets"]
+        html = client.get("/").get_data(as_text=True)
+        assert f"/assets/{manifest.mapping['css/style.css']}" in html
+        assert f"/assets/{manifest.mapping['js/script.js']}" in html
+
+    def test_immutable_and_encoded(self, client, app):
+        """Assets are cached for a year and served precompressed when accepted"""
+        url = f"/assets/{app.extensions['dicto_assets'].mapping['css/style.css']}"
+        plain = client.get(url)
+        assert plain.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+        assert "Content-Encoding" not in plain.headers
+        encoded = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert encoded.headers["Content-Encoding"] in ("gzip", "br")
+        assert "Accept-Encoding" in encoded.headers["Vary"]
+        if encoded.headers["Content-Encoding"] == "gzip":
+            assert gzip.decompress(encoded.data) == plain.data
+
+    def test_unknown_asset(self, client):
+        """Paths outside the build are not served"""
+        assert client.get("/assets/nope.css").status_code == 404
+        assert client.get("/assets/../../app.py").status_code == 404
+
+
+class TestJsonCompression:
+    """Test compression of dynamic JSON responses"""
+
+    def test_large_json_compressed(self, client, monkeypatch):
+        """JSON above the threshold is gzipped for clients that accept it"""
+        monkeypatch.setattr(assets, "ENCODINGS", [("gzip", ".gz")])
+        monkeypatch.setattr(assets, "MIN_COMPRESS_BYTES", 10)
+        response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "status" in json.loads(gzip.decompress(response.data))
+
+    def test_uncompressed_without_accept_encoding(self, client, monkeypatch):
+        """Clients that don't ask get plain JSON"""
+        monkeypatch.setattr(assets, "MIN_COMPRESS_BYTES", 10)
+        response = client.get("/health")
+        assert "Content-Encoding" not in response.headers
+        assert "status" in response.get_json()
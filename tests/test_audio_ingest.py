@@ -0,0 +1,190 @@
+"""
+Tests for streaming audio ingest
+"""
+import hashlib
+import os
+import sys
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+from flask import jsonify
+
+from website import audio_ingest
+from website.audio_ingest import EmptyUpload, TranscodeError, UnsupportedFormat, UploadTooLarge, stream_transcode
+
+COPY_SCRIPT = (
+    "import shutil, sys; "
+    "source = sys.stdin.buffer if sys.argv[1] == 'pipe:0' else open(sys.argv[1], 'rb'); "
+    "shutil.copyfileobj(source, open(sys.argv[2], 'wb'))"
+)
+OGG = b"OggS" + b"\x00" * 60
+
+
+def copy_command(output_path, speed=1.5, input_path="pipe:0", input_format=None):
+    """Stand-in for ffmpeg that copies its input to the output unchanged"""
+    return [sys.executable, "-c", COPY_SCRIPT, input_path, output_path]
+
+
+def chunked(data, size=65536):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestStreamTranscode:
+    """Test piping uploads into the decoder"""
+
+    def test_streams_input_and_hashes(self, tmp_path):
+        """Every byte reaches the process and the digest matches"""
+        data = b"x" * 300_000
+        output = tmp_path / "out"
+        stats = stream_transcode(chunked(data), copy_command(str(output)), max_bytes=10**6)
+        assert output.read_bytes() == data
+        assert stats.sha256 == hashlib.sha256(data).hexdigest()
+        assert stats.bytes_read == len(data)
+        assert stats.peak_rss_bytes > 0
+
+    def test_size_cap_enforced_while_streaming(self, tmp_path):
+        """Oversized uploads are cut off once the cap is crossed"""
+        with pytest.raises(UploadTooLarge):
+            stream_transcode(chunked(b"x" * 200_000), copy_command(str(tmp_path / "out")), max_bytes=100_000)
+
+    def test_empty_upload_spawns_nothing(self):
+        """An empty body is rejected before starting a decoder"""
+        with pytest.raises(EmptyUpload):
+            audio_ingest.ingest(BytesIO(b""), max_bytes=10)
+
+    def test_decoder_failure(self):
+        """A failing decoder surfaces its stderr"""
+        command = [sys.executable, "-c", "import sys; sys.stderr.write('bad input'); sys.exit(1)"]
+        with pytest.raises(TranscodeError, match="bad input"):
+            stream_transcode(chunked(b"x" * 200_000), command, max_bytes=10**6)
+
+    def test_ingest_removes_output_on_failure(self, monkeypatch, isolated_scratch):
+        """No temp file is left behind when the upload is rejected"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", copy_command)
+        with pytest.raises(UploadTooLarge):
+            audio_ingest.ingest(BytesIO(OGG * 40), max_bytes=1000)
+        assert isolated_scratch.usage().files == 0
+
+    def test_ffmpeg_command_reads_stdin(self):
+        """ffmpeg decodes from the pipe and applies the speed-up"""
+        command = audio_ingest.ffmpeg_command("/tmp/out.webm", speed=1.5)
+        assert command[command.index("-i") + 1] == "pipe:0"
+        assert "atempo=1.5" in command
+        assert command[-1] == "/tmp/out.webm"
+
+
+class TestFormats:
+    """Test content sniffing and the passthrough fast path"""
+
+    @pytest.mark.parametrize("head, name", [
+        (b"\x1a\x45\xdf\xa3\x9f\x42\x82\x84webm", "webm"),
+        (b"OggS\x00\x02", "ogg"),
+        (b"RIFF\x24\x00\x00\x00WAVEfmt ", "wav"),
+        (b"fLaC\x00\x00", "flac"),
+        (b"ID3\x04\x00", "mp3"),
+        (b"\xff\xfb\x90\x64", "mp3"),
+        (b"\xff\xf1\x50\x80", "aac"),
+        (b"\x00\x00\x00\x20ftypM4A \x00\x00", "m4a"),
+        (b"\x00\x00\x00\x18ftypmp42\x00\x00", "mp4"),
+        (b"caff\x00\x01", "caf"),
+        (b"#!AMR\n", "amr"),
+    ])
+    def test_sniff_format(self, head, name):
+        """Containers are recognised from their leading bytes"""
+        assert audio_ingest.sniff_format(head).name == name
+
+    def test_unknown_format(self):
+        """Arbitrary bytes are rejected before any decoding"""
+        with pytest.raises(UnsupportedFormat):
+            audio_ingest.ingest(BytesIO(b"not audio" * 20), max_bytes=10**6)
+
+    def test_passthrough_when_no_transform(self, monkeypatch):
+        """Accepted formats are stored untouched when speed-up is off"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", lambda *a, **k: ["/nonexistent/ffmpeg"])
+        result = audio_ingest.ingest(BytesIO(OGG * 10), max_bytes=10**6, speed=1.0, accepted_formats={"ogg"})
+        try:
+            assert not result.transcoded
+            assert result.path.endswith(".ogg")
+            with open(result.path, "rb") as f:
+                assert f.read() == OGG * 10
+        finally:
+            os.unlink(result.path)
+
+    def test_transcodes_formats_backend_rejects(self, monkeypatch):
+        """Formats outside the backend's list are converted"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", copy_command)
+        amr = b"#!AMR\n" + b"\x00" * 100
+        result = audio_ingest.ingest(BytesIO(amr), max_bytes=10**6, speed=1.0, accepted_formats={"ogg"})
+        os.unlink(result.path)
+        assert result.transcoded
+        assert result.format == "amr"
+
+    def test_oversized_passthrough_is_transcoded(self, monkeypatch):
+        """Files over the backend's upload limit are re-encoded"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", copy_command)
+        result = audio_ingest.ingest(BytesIO(OGG * 10), max_bytes=10**6, speed=1.0,
+                                     accepted_formats={"ogg"}, passthrough_max_bytes=100)
+        os.unlink(result.path)
+        assert result.transcoded
+
+    def test_mp4_is_spooled_before_decoding(self, monkeypatch):
+        """MP4-family uploads are decoded from a file, not a pipe"""
+        commands = []
+
+        def record(output_path, speed=1.5, input_path="pipe:0", input_format=None):
+            commands.append(input_path)
+            return copy_command(output_path, speed, input_path, input_format)
+
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", record)
+        m4a = b"\x00\x00\x00\x20ftypM4A " + b"\x00" * 100
+        result = audio_ingest.ingest(BytesIO(m4a), max_bytes=10**6)
+        with open(result.path, "rb") as f:
+            assert f.read() == m4a
+        os.unlink(result.path)
+        assert commands[0].endswith(".m4a")
+        assert not os.path.exists(commands[0])
+
+    def test_no_filter_without_speed_up(self):
+        """Transforms are only added when enabled"""
+        command = audio_ingest.ffmpeg_command("/tmp/out.webm", speed=1.0)
+        assert "-filter:a" not in command
+
+
+class TestStreamingEndpoint:
+    """Test raw audio bodies on /api/process-audio"""
+
+    def test_raw_body_is_streamed(self, client, monkeypatch):
+        """A raw audio body skips form parsing and reaches the pipeline"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", copy_command)
+        with patch("website.views.transcribe", return_value="hello") as transcribe, \
+                patch("website.views.process_with_LLM", side_effect=lambda t: jsonify({"transcript": t})):
+            response = client.post("/api/process-audio", data=OGG * 100, content_type="audio/webm")
+        assert response.status_code == 200
+        assert response.get_json() == {"transcript": "hello"}
+        assert not os.path.exists(transcribe.call_args[0][0])
+
+    def test_oversized_stream_rejected(self, client, monkeypatch):
+        """The streaming cap applies instead of MAX_CONTENT_LENGTH"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command", copy_command)
+        monkeypatch.setattr("website.process_audio.UPLOAD_MAX_BYTES", 1000)
+        response = client.post("/api/process-audio", data=OGG * 100, content_type="audio/webm")
+        assert response.status_code == 413
+
+    def test_undecodable_stream(self, client, monkeypatch):
+        """Decoder failures are reported as bad requests"""
+        monkeypatch.setattr(audio_ingest, "ffmpeg_command",
+                            lambda *args, **kwargs: [sys.executable, "-c", "import sys; sys.exit(1)"])
+        response = client.post("/api/process-audio", data=OGG * 100, content_type="audio/webm")
+        assert response.status_code == 400
+
+    def test_empty_body(self, client):
+        """An empty raw body is rejected up front"""
+        response = client.post("/api/process-audio", data=b"", content_type="audio/webm")
+        assert response.status_code == 400
+
+    def test_unsupported_format(self, client):
+        """Bytes that are not a known audio container are rejected"""
+        response = client.post("/api/process-audio", data=b"not audio" * 100, content_type="audio/webm")
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Unsupported audio format"
@@ -0,0 +1,182 @@
+"""
+Tests for single-flight deduplication of process-audio requests
+"""
+import json
+import threading
+import time
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+from flask import jsonify
+
+from website.dedup import FlightTimeout, IdempotencyConflict, SingleFlight, StoredResponse, content_key
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def flight(tmp_path, clock):
+    return SingleFlight(str(tmp_path / "dedup.sqlite3"), lease_s=60, result_ttl_s=300, clock=clock)
+
+
+class TestSingleFlight:
+    """Test claiming, replay and takeover"""
+
+    def test_first_claim_owns(self, flight):
+        """The first request for a key runs the computation"""
+        assert flight.claim("k", "f") == ("owner", None)
+        assert flight.claim("k", "f") == ("wait", None)
+
+    def test_completed_result_replays(self, flight):
+        """Later requests get the stored response without recomputing"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return StoredResponse(200, '{"summary": "s"}')
+
+        assert flight.run("k", "f", compute, wait_timeout_s=1)[1] == "owner"
+        response, outcome = flight.run("k", "f", compute, wait_timeout_s=1)
+        assert outcome == "replayed"
+        assert response.body == '{"summary": "s"}'
+        assert len(calls) == 1
+
+    def test_failures_are_not_shared(self, flight):
+        """An error response releases the key so a retry runs again"""
+        flight.run("k", "f", lambda: StoredResponse(500, "{}"), wait_timeout_s=1)
+        assert flight.claim("k", "f")[0] == "owner"
+
+    def test_exception_releases_key(self, flight):
+        """A crashing computation does not block the key"""
+        def compute():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            flight.run("k", "f", compute, wait_timeout_s=1)
+        assert flight.claim("k", "f")[0] == "owner"
+
+    def test_key_reused_for_other_content(self, flight):
+        """An Idempotency-Key bound to one recording rejects another"""
+        flight.claim("idem:abc", "sha256:one")
+        with pytest.raises(IdempotencyConflict):
+            flight.claim("idem:abc", "sha256:two")
+
+    def test_expired_lease_is_taken_over(self, flight, clock):
+        """A claim left by a dead worker expires"""
+        flight.claim("k", "f")
+        clock.now += 61
+        assert flight.claim("k", "f")[0] == "owner"
+
+    def test_results_expire(self, flight, clock):
+        """Stored responses are only replayed for the TTL"""
+        flight.run("k", "f", lambda: StoredResponse(200, "{}"), wait_timeout_s=1)
+        clock.now += 301
+        assert flight.claim("k", "f")[0] == "owner"
+
+    def test_response_ttl_overrides_default(self, flight, clock):
+        """A response can ask to be replayed for less than the TTL"""
+        flight.run("k", "f", lambda: StoredResponse(200, "{}", ttl_s=5), wait_timeout_s=1)
+        assert flight.claim("k", "f")[0] == "done"
+        clock.now += 6
+        assert flight.claim("k", "f")[0] == "owner"
+
+    def test_waiter_times_out(self, tmp_path, clock):
+        """A duplicate gives up when the owner takes too long"""
+        def sleep(seconds):
+            clock.now += seconds
+
+        flight = SingleFlight(str(tmp_path / "d.sqlite3"), clock=clock, sleep=sleep)
+        flight.claim("k", "f")
+        with pytest.raises(FlightTimeout):
+            flight.run("k", "f", lambda: StoredResponse(200, "{}"), wait_timeout_s=1)
+
+    def test_concurrent_duplicates_share_one_run(self, tmp_path):
+        """Threads with separate connections attach to a single computation"""
+        flight = SingleFlight(str(tmp_path / "d.sqlite3"), poll_interval_s=0.01)
+        calls = []
+        outcomes = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return StoredResponse(200, '{"ok": true}')
+
+        def request():
+            outcomes.append(flight.run("k", "f", compute, wait_timeout_s=5)[1])
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert sorted(outcomes) == ["joined"] * 4 + ["owner"]
+
+
+class TestProcessAudioDedup:
+    """Test deduplication on the endpoint"""
+
+    def post(self, client, data=b"audio-bytes" * 200, key=None):
+        headers = {"Idempotency-Key": key} if key else {}
+        return client.post(
+            "/api/process-audio",
+            data={"audio": (BytesIO(data), "recording.webm")},
+            content_type="multipart/form-data",
+            headers=headers,
+        )
+
+    def test_identical_upload_runs_pipeline_once(self, app, client, tmp_path):
+        """Resending the same recording replays the first response"""
+        with patch("website.views.speed_up_audio", return_value=str(tmp_path / "x.mp3")) as speed_up, \
+                patch("website.views.transcribe", return_value="hello"), \
+                patch("website.views.process_with_LLM",
+                      side_effect=lambda t: jsonify({"transcript": t, "summary": "s"})):
+            first = self.post(client)
+            second = self.post(client)
+        assert speed_up.call_count == 1
+        assert first.status_code == second.status_code == 200
+        assert json.loads(second.data) == json.loads(first.data)
+        assert second.headers["Idempotent-Replayed"] == "true"
+
+    def test_idempotency_key_conflict(self, client, tmp_path):
+        """Reusing a key for different audio is rejected"""
+        with patch("website.views.speed_up_audio", return_value=str(tmp_path / "x.mp3")), \
+                patch("website.views.transcribe", return_value="hello"), \
+                patch("website.views.process_with_LLM", side_effect=lambda t: jsonify({"summary": "s"})):
+            assert self.post(client, b"one" * 500, key="abc").status_code == 200
+            assert self.post(client, b"two" * 500, key="abc").status_code == 422
+
+    def test_errors_are_retried(self, client):
+        """A failed run is not replayed to the retry"""
+        with patch("website.views.speed_up_audio", side_effect=RuntimeError("decode failed")) as speed_up:
+            assert self.post(client).status_code == 500
+            assert self.post(client).status_code == 500
+        assert speed_up.call_count == 2
+
+    def test_summary_pending_not_replayed(self, client, tmp_path, monkeypatch):
+        """A transcript-only response is not replayed to a later retry"""
+        monkeypatch.setenv("DEDUP_PENDING_TTL_S", "0")
+        with patch("website.views.speed_up_audio", return_value=str(tmp_path / "x.mp3")) as speed_up, \
+                patch("website.views.transcribe", return_value="hello"), \
+                patch("website.views.process_with_LLM",
+                      side_effect=lambda t: jsonify({"transcript": t, "status": "summary_pending"})):
+            assert self.post(client).status_code == 200
+            retry = self.post(client)
+        assert speed_up.call_count == 2
+        assert "Idempotent-Replayed" not in retry.headers
+
+    def test_content_key_is_stable(self):
+        """The same bytes always hash to the same key"""
+        assert content_key(b"abc") == content_key(b"abc") != content_key(b"abd")
@@ -0,0 +1,163 @@
+"""
+Tests for the batch transcription CLI
+"""
+import io
+import itertools
+import json
+import threading
+
+import pytest
+
+from website import importer
+from website.admission import Overloaded
+from website.audio_ingest import IngestResult
+
+OGG = b"OggS" + b"\x00" * 60
+
+
+class FakePipeline:
+    def __init__(self, tmp_path, fail_on=()):
+        self.tmp_path = tmp_path
+        self.fail_on = set(fail_on)
+        self.transcribed = []
+        self.stored = []
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def prepare(self, f):
+        data = f.read()
+        path = self.tmp_path / f"prepared-{next(self.counter)}"
+        path.write_bytes(data)
+        return IngestResult(path=str(path), sha256="", bytes_read=len(data))
+
+    def transcribe(self, path):
+        text = open(path, "rb").read().decode("latin-1")
+        if any(marker in text for marker in self.fail_on):
+            raise RuntimeError("upstream error")
+        with self.lock:
+            self.transcribed.append(path)
+        return "hello"
+
+    def summarize(self, transcript, metadata=None, store=True):
+        with self.lock:
+            self.stored.append(store)
+        return {"transcript": transcript, "summary": "## Memo ##", "note_id": "n1" if store else None}
+
+    def as_pipeline(self):
+        return importer.Pipeline(prepare=self.prepare, transcribe=self.transcribe, summarize=self.summarize)
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    folder = tmp_path / "memos"
+    folder.mkdir()
+    paths = []
+    for i in range(5):
+        path = folder / f"memo{i}.ogg"
+        path.write_bytes(OGG + f"memo{i}".encode())
+        paths.append(path)
+    return paths
+
+
+class TestBatch:
+    """Test the parallel, resumable batch run"""
+
+    def test_processes_all_files(self, tmp_path, recordings):
+        """Every recording goes through each stage once"""
+        pipeline = FakePipeline(tmp_path)
+        manifest = importer.Manifest(tmp_path / "manifest.jsonl")
+        progress = importer.Progress(len(recordings), out=io.StringIO())
+        ok, failed = importer.run_batch(recordings, pipeline.as_pipeline(), manifest,
+                                        decode_workers=2, api_workers=3, progress=progress)
+        assert (ok, failed) == (5, 0)
+        assert len(pipeline.transcribed) == 5
+        assert progress.done == 5
+
+    def test_resumes_from_manifest(self, tmp_path, recordings):
+        """A rerun skips files already recorded as done"""
+        manifest_path = tmp_path / "manifest.jsonl"
+        importer.run_batch(recordings[:3], FakePipeline(tmp_path).as_pipeline(), importer.Manifest(manifest_path),
+                           progress=importer.Progress(3, out=io.StringIO()))
+        with open(manifest_path, "a") as f:
+            f.write('{"key": "truncated')  # a crash mid-write
+        rerun = FakePipeline(tmp_path)
+        ok, _ = importer.run_batch(recordings, rerun.as_pipeline(), importer.Manifest(manifest_path),
+                                   progress=importer.Progress(2, out=io.StringIO()))
+        assert ok == 2
+        assert len(rerun.transcribed) == 2
+
+    def test_failures_are_retried_on_rerun(self, tmp_path, recordings):
+        """Failed files are recorded but not marked done"""
+        manifest_path = tmp_path / "manifest.jsonl"
+        ok, failed = importer.run_batch(recordings, FakePipeline(tmp_path, fail_on=["memo1"]).as_pipeline(),
+                                        importer.Manifest(manifest_path),
+                                        progress=importer.Progress(5, out=io.StringIO()))
+        assert (ok, failed) == (4, 1)
+        assert len(importer.Manifest(manifest_path).done) == 4
+
+    def test_jsonl_output_skips_note_store(self, tmp_path, recordings):
+        """--jsonl writes one result per file instead of storing notes"""
+        pipeline = FakePipeline(tmp_path)
+        out = io.StringIO()
+        importer.run_batch(recordings, pipeline.as_pipeline(), importer.Manifest(tmp_path / "m.jsonl"),
+                           jsonl=out, progress=importer.Progress(5, out=io.StringIO()))
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert len(rows) == 5
+        assert {row["path"] for row in rows} == {str(path) for path in recordings}
+        assert pipeline.stored == [False] * 5
+
+    def test_prepared_files_are_removed(self, tmp_path, recordings):
+        """Intermediate audio is cleaned up after each file"""
+        pipeline = FakePipeline(tmp_path)
+        importer.run_batch(recordings, pipeline.as_pipeline(), importer.Manifest(tmp_path / "m.jsonl"),
+                           progress=importer.Progress(5, out=io.StringIO()))
+        assert not list(tmp_path.glob("prepared-*"))
+
+    def test_overloaded_stage_is_waited_out(self, monkeypatch):
+        """Admission rejections are retried after their Retry-After"""
+        monkeypatch.setattr(importer.time, "sleep", lambda seconds: None)
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise Overloaded("transcription", 0.1, "queue_full")
+            return "ok"
+
+        assert importer._retry_overloaded(flaky) == "ok"
+
+
+class TestDiscovery:
+    """Test finding recordings"""
+
+    def test_finds_recordings_by_content(self, tmp_path):
+        """Audio is found by its bytes, whatever the extension"""
+        (tmp_path / "memo.m4a").write_bytes(b"\x00\x00\x00\x20ftypM4A " + b"\x00" * 50)
+        (tmp_path / "nested").mkdir()
+        (tmp_path / "nested" / "renamed.dat").write_bytes(OGG)
+        (tmp_path / "notes.txt").write_text("not audio")
+        (tmp_path / ".DS_Store").write_bytes(OGG)
+        found = {path.name: audio_format.name for path, audio_format in importer.find_recordings([tmp_path])}
+        assert found == {"memo.m4a": "m4a", "renamed.dat": "ogg"}
+
+    def test_glob_patterns(self, tmp_path, recordings):
+        """Glob patterns expand, including ** recursion"""
+        paths = importer.expand_paths([str(tmp_path / "**" / "memo[12].ogg")])
+        assert [path.name for path in paths] == ["memo1.ogg", "memo2.ogg"]
+
+    def test_dry_run(self, tmp_path, capsys):
+        """--dry-run lists recordings without processing them"""
+        (tmp_path / "a.ogg").write_bytes(OGG)
+        assert importer.main([str(tmp_path), "--dry-run"]) == 0
+        assert "ogg" in capsys.readouterr().out
+
+    def test_progress_line(self):
+        """Throughput is reported as files/min with an ETA"""
+        now = [0.0]
+        progress = importer.Progress(10, out=io.StringIO(), clock=lambda: now[0])
+        now[0] = 60.0
+        for _ in range(5):
+            progress.update(True, 1_000_000)
+        assert "5/10 files" in progress.line()
+        assert "5.0 files/min" in progress.line()
+        assert "eta 60s" in progress.line()
@@ -0,0 +1,153 @@
+"""
+Tests for the rolling latency histograms behind /metrics-dashboard
+"""
+import json
+import os
+
+import pytest
+
+from website.admission import limit_stage
+from website.latency import (
+    BUCKET_COUNT,
+    LatencyRecorder,
+    bucket_index,
+    bucket_value,
+    percentile,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def recorder_in(directory, clock, **kwargs):
+    return LatencyRecorder(str(directory), window_s=60, slot_s=5, flush_interval_s=0, clock=clock, **kwargs)
+
+
+class TestBuckets:
+    """Test the log-linear bucket layout"""
+
+    @pytest.mark.parametrize("micros", [0, 1, 63, 64, 1000, 123_456, 9_999_999, 2 ** 31])
+    def test_relative_error(self, micros):
+        """A bucket's midpoint is within ~3% of any value in it"""
+        value = bucket_value(bucket_index(micros))
+        assert abs(value - micros) <= max(0.5, micros / 32)
+
+    def test_indices_are_monotonic_and_bounded(self):
+        """Larger values never map to smaller buckets, and all fit the fixed layout"""
+        indices = [bucket_index(2 ** exp + offset) for exp in range(40) for offset in (0, 1)]
+        assert indices == sorted(indices)
+        assert max(indices) == BUCKET_COUNT - 1
+
+    def test_percentile(self):
+        """Percentiles walk the cumulative counts"""
+        counts = {bucket_index(10_000): 90, bucket_index(500_000): 9, bucket_index(2_000_000): 1}
+        assert percentile(counts, 100, 50) == pytest.approx(0.01, rel=0.03)
+        assert percentile(counts, 100, 95) == pytest.approx(0.5, rel=0.03)
+        assert percentile(counts, 100, 99) == pytest.approx(0.5, rel=0.03)
+        assert percentile({}, 0, 99) == 0.0
+
+
+class TestRecorder:
+    """Test rolling windows and cross-worker aggregation"""
+
+    def test_summary(self, tmp_path, clock):
+        """Percentiles, throughput and error rate over the window"""
+        recorder = recorder_in(tmp_path, clock)
+        clock.now = 1000.0
+        for _ in range(9):
+            recorder.record("stage:decode", 0.1)
+        recorder.record("stage:decode", 2.0, error=True)
+        clock.now = 1059.0
+        series = recorder.summary()["series"]["stage:decode"]
+        assert series["count"] == 10
+        assert series["error_rate"] == 0.1
+        assert series["p50_s"] == pytest.approx(0.1, rel=0.03)
+        assert series["max_s"] == pytest.approx(2.0, rel=0.03)
+        assert series["throughput_per_s"] == pytest.approx(10 / 59, rel=0.01)
+
+    def test_old_slots_leave_the_window(self, tmp_path, clock):
+        """Samples older than the window are no longer reported"""
+        recorder = recorder_in(tmp_path, clock)
+        recorder.record("stage:decode", 5.0)
+        clock.now += 61
+        recorder.record("stage:decode", 0.2)
+        series = recorder.summary()["series"]["stage:decode"]
+        assert series["count"] == 1
+        assert series["max_s"] == pytest.approx(0.2, rel=0.03)
+
+    def test_slot_reuse_resets_counts(self, tmp_path, clock):
+        """A ring slot is cleared before it is reused for a later period"""
+        recorder = recorder_in(tmp_path, clock)
+        for step in range(30):
+            clock.now = 1000.0 + step * 5
+            recorder.record("stage:decode", 0.05)
+        assert recorder.summary()["series"]["stage:decode"]["count"] == 12
+
+    def test_merges_workers(self, tmp_path, clock):
+        """Every worker's sidecar file on the pod is merged"""
+        here = recorder_in(tmp_path, clock)
+        here.record("endpoint:views.home", 0.01)
+        other = {
+            "pid": 999999, "written": clock.now, "slot_s": 5,
+            "series": {"endpoint:views.home": [[int(clock.now // 5), 3, 1, {str(bucket_index(20_000)): 3}]]},
+        }
+        (tmp_path / "999999.json").write_text(json.dumps(other))
+        summary = here.summary()
+        assert summary["workers"] == 2
+        assert summary["series"]["endpoint:views.home"]["count"] == 4
+        assert summary["series"]["endpoint:views.home"]["error_rate"] == 0.25
+
+    def test_removes_dead_workers(self, tmp_path, clock):
+        """Files not written for two windows are deleted"""
+        stale = {"pid": 999999, "written": clock.now - 500, "slot_s": 5, "series": {}}
+        (tmp_path / "999999.json").write_text(json.dumps(stale))
+        recorder_in(tmp_path, clock).summary()
+        assert not os.path.exists(tmp_path / "999999.json")
+
+    def test_series_limit(self, tmp_path, clock):
+        """Series past the limit are not recorded"""
+        recorder = recorder_in(tmp_path, clock, max_series=2)
+        for name in ("a", "b", "c"):
+            recorder.record(name, 0.01)
+        assert set(recorder.summary()["series"]) == {"a", "b"}
+
+    def test_measure_counts_exceptions_as_errors(self, tmp_path, clock):
+        """A block that raises is recorded as an error"""
+        recorder = recorder_in(tmp_path, clock)
+        with pytest.raises(ValueError):
+            with recorder.measure("stage:x"):
+                raise ValueError("boom")
+        assert recorder.summary()["series"]["stage:x"]["error_rate"] == 1.0
+
+
+class TestDashboard:
+    """Test request and stage recording feeding the dashboard"""
+
+    def test_stages_are_recorded(self, isolated_latency):
+        """limit_stage records each stage's service time"""
+        limit_stage("decode")(lambda: None)()
+        assert isolated_latency.summary()["series"]["stage:decode"]["count"] == 1
+
+    def test_endpoints_are_recorded(self, client, isolated_latency):
+        """Requests are recorded by endpoint, 5xx as errors"""
+        client.get("/")
+        client.post("/api/export-pdf", data="not json", content_type="application/json")
+        data = client.get("/metrics-dashboard/latency").get_json()
+        assert data["series"]["endpoint:views.home"]["count"] == 1
+        assert data["series"]["endpoint:views.export_pdf"]["error_rate"] == 1.0
+        assert "endpoint:views.latency_summary" not in data["series"]
+
+    def test_dashboard_page(self, client):
+        """The dashboard polls the latency summary"""
+        response = client.get("/metrics-dashboard")
+        assert b"/metrics-dashboard/latency" in response.data
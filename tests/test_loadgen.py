@@ -0,0 +1,132 @@
+"""
+Tests for the capacity-planning load generator
+"""
+import json
+import random
+import urllib.request
+
+from benchmarks.loadgen import (
+    RecordingPool,
+    RequestResult,
+    StageResult,
+    find_knee,
+    percentile,
+    ramp_levels,
+    recommend,
+    run_stage,
+    sample_durations,
+    serve_fake_openai,
+)
+
+
+class TestRecordingLengths:
+    """Test the recording-length distribution"""
+
+    def test_durations_are_clamped(self):
+        """Test sampled durations stay inside the configured bounds"""
+        durations = sample_durations(500, median_s=30, sigma=2.0, min_s=5, max_s=120,
+                                     rng=random.Random(1))
+
+        assert len(durations) == 500
+        assert min(durations) >= 5
+        assert max(durations) <= 120
+
+    def test_synthetic_pool_encodes_each_bucket_once(self):
+        """Test that equal-length buckets share one encoded payload"""
+        calls = []
+
+        def fake_synthesize(duration):
+            calls.append(duration)
+            return b"x" * int(duration)
+
+        pool = RecordingPool.synthetic([14, 16, 31, 44], bucket_s=15, synthesize=fake_synthesize)
+
+        assert sorted(calls) == [15, 30, 45]
+        assert len(pool.payloads) == 4
+
+
+class TestSaturationCurve:
+    """Test stage execution and knee detection"""
+
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentile on a small sample"""
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+
+        assert percentile(values, 50) == 5
+        assert percentile(values, 95) == 10
+        assert percentile([], 95) == 0.0
+
+    def test_ramp_levels_double(self):
+        """Test concurrency ramp doubles up to the maximum"""
+        assert ramp_levels(1, 16) == [1, 2, 4, 8, 16]
+
+    def test_run_stage_counts_errors(self):
+        """Test run_stage records latencies and errors separately"""
+        outcomes = iter([True, False] * 10)
+
+        def send():
+            return RequestResult(latency=0.01, ok=next(outcomes), status=200)
+
+        stage = run_stage(send, concurrency=2, duration_s=5, max_requests=20)
+
+        assert stage.completed == 20
+        assert stage.errors == 10
+        assert stage.error_rate == 0.5
+
+    def test_knee_is_best_stage_within_slo(self):
+        """Test the knee is the highest-throughput stage meeting the SLO"""
+        fast = StageResult(concurrency=2, elapsed=10, latencies=[1.0] * 20)
+        faster = StageResult(concurrency=4, elapsed=10, latencies=[2.0] * 40)
+        saturated = StageResult(concurrency=8, elapsed=10, latencies=[9.0] * 41)
+
+        knee = find_knee([fast, faster, saturated], latency_slo_s=5.0)
+
+        assert knee is faster
+
+    def test_knee_none_when_all_stages_fail_slo(self):
+        """Test no knee is reported when every stage breaches the SLO"""
+        slow = StageResult(concurrency=1, elapsed=10, latencies=[20.0] * 5)
+
+        assert find_knee([slow], latency_slo_s=5.0) is None
+
+
+class TestRecommendation:
+    """Test worker and replica sizing"""
+
+    def test_memory_bounds_workers(self):
+        """Test workers per pod are limited by the memory budget"""
+        knee = StageResult(concurrency=4, elapsed=10, latencies=[1.0] * 20)
+
+        result = recommend(knee, server_workers=4, target_rps=5, cpu_per_pod=2,
+                           memory_per_pod_mb=1024, memory_per_worker_mb=256)
+
+        assert result["rps_per_worker"] == 0.5
+        assert result["workers_per_pod"] == 4
+        assert result["workers_limited_by"] == "memory"
+        assert result["replicas"] == 3
+
+    def test_no_knee_reports_error(self):
+        """Test recommendation explains when nothing met the SLO"""
+        result = recommend(None, 1, 1, 1, 1024, 256)
+
+        assert "error" in result
+
+
+class TestFakeOpenAI:
+    """Test the bundled fake OpenAI endpoint"""
+
+    def test_chat_completion_shape(self):
+        """Test the fake server returns a chat completion payload"""
+        server = serve_fake_openai(0, transcription_latency_s=0, chat_latency_s=0)
+        try:
+            port = server.server_address[1]
+            req = urllib.request.Request(
+                f"http://127.0.0.1:{port}/v1/chat/completions",
+                data=b"{}", method="POST", headers={"Content-Type": "application/json"},
+            )
+            with urllib.request.urlopen(req, timeout=5) as response:
+                body = json.loads(response.read())
+        finally:
+            server.shutdown()
+
+        assert body["choices"][0]["message"]["content"].startswith("## ")
@@ -0,0 +1,92 @@
+"""
+Tests for the per-pod decode memory budget
+"""
+import pytest
+
+from website.admission import Overloaded
+from website.memory_budget import (
+    DECODE_BASE_BYTES,
+    DECODE_WINDOW_BYTES,
+    MemoryBudget,
+    estimate_decode_memory,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def budget(tmp_path, clock):
+    return MemoryBudget(str(tmp_path / "budget.sqlite3"), capacity_bytes=100, wait_budget_s=1.0,
+                        lease_s=60, clock=clock, sleep=clock.sleep)
+
+
+class TestMemoryBudget:
+    """Test reservations against the shared budget"""
+
+    def test_reservations_fit(self, budget):
+        """Reservations are granted until the capacity is used"""
+        first = budget.try_reserve(60)
+        assert first is not None
+        assert budget.try_reserve(50) is None
+        assert budget.try_reserve(40) is not None
+        assert budget.reserved() == 100
+
+    def test_release_frees_budget(self, budget):
+        """Leaving the context returns the bytes"""
+        with budget.reserve(80):
+            assert budget.reserved() == 80
+        assert budget.reserved() == 0
+
+    def test_sheds_when_budget_exhausted(self, budget):
+        """A decode that can't fit within the wait budget is rejected"""
+        budget.try_reserve(90)
+        with pytest.raises(Overloaded) as excinfo:
+            with budget.reserve(20):
+                pass
+        assert excinfo.value.reason == "memory_budget"
+
+    def test_oversized_request_runs_alone(self, budget):
+        """A request bigger than the budget is admitted when nothing else runs"""
+        assert budget.try_reserve(500) is not None
+        assert budget.try_reserve(1) is None
+
+    def test_shared_across_instances(self, tmp_path, clock):
+        """Workers opening the same database share one budget"""
+        path = str(tmp_path / "shared.sqlite3")
+        first = MemoryBudget(path, capacity_bytes=100, clock=clock)
+        second = MemoryBudget(path, capacity_bytes=100, clock=clock)
+        first.try_reserve(70)
+        assert second.try_reserve(40) is None
+
+    def test_expired_reservations_reclaimed(self, budget, clock):
+        """Memory held by a killed worker returns after the lease"""
+        budget.try_reserve(90)
+        clock.now += 61
+        assert budget.try_reserve(90) is not None
+
+
+class TestEstimate:
+    """Test decoded-size estimates"""
+
+    def test_small_upload_reserves_less(self):
+        """Short recordings reserve little beyond the decoder itself"""
+        assert estimate_decode_memory(100_000) < estimate_decode_memory(10_000_000)
+
+    def test_estimate_is_bounded(self):
+        """Frame-based decoding caps the estimate for long recordings"""
+        assert estimate_decode_memory(10**10) == DECODE_BASE_BYTES + DECODE_WINDOW_BYTES
+        assert estimate_decode_memory(None) == DECODE_BASE_BYTES + DECODE_WINDOW_BYTES
@@ -0,0 +1,149 @@
+"""
+Tests for per-stage memory metrics and the tracemalloc admin endpoints
+"""
+import tracemalloc
+
+import pytest
+from prometheus_client import REGISTRY
+
+from website import create_app, memory_profiling
+from website.memory_profiling import SnapshotStore, track_memory
+
+ADMIN = {"Authorization": "Bearer secret"}
+
+
+def sample(name, stage):
+    return REGISTRY.get_sample_value(name, {"stage": stage}) or 0
+
+
+@pytest.fixture(autouse=True)
+def no_tracing():
+    """Leave tracemalloc as we found it (off)"""
+    yield
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+@pytest.fixture
+def snapshot_store(monkeypatch):
+    store = SnapshotStore(keep=3)
+    monkeypatch.setattr(memory_profiling, "_snapshots", store)
+    return store
+
+
+@pytest.fixture
+def admin_client(monkeypatch, snapshot_store):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    app = create_app()
+    app.config["TESTING"] = True
+    return app.test_client()
+
+
+def allocate_blocks():
+    return [bytearray(1024) for _ in range(2000)]
+
+
+class TestTrackMemory:
+    """Test per-stage memory metrics"""
+
+    def test_records_peak_and_growth(self):
+        """Every call observes peak RSS and RSS growth for its stage"""
+        before = sample("dicto_stage_peak_rss_bytes_count", "test-rss")
+        track_memory("test-rss")(lambda: None)()
+        assert sample("dicto_stage_peak_rss_bytes_count", "test-rss") == before + 1
+        assert sample("dicto_stage_rss_growth_bytes_count", "test-rss") >= 1
+        assert REGISTRY.get_sample_value("dicto_worker_peak_rss_bytes") > 0
+
+    def test_allocations_only_when_tracing(self):
+        """Net allocations are recorded only while tracemalloc is on"""
+        kept = []
+        stage = track_memory("test-alloc")(lambda: kept.append(allocate_blocks()))
+        stage()
+        assert sample("dicto_stage_allocated_bytes_count", "test-alloc") == 0
+
+        tracemalloc.start()
+        stage()
+        assert sample("dicto_stage_allocated_bytes_count", "test-alloc") == 1
+        assert sample("dicto_stage_allocated_bytes_sum", "test-alloc") >= 2000 * 1024
+
+    def test_records_failed_stages(self):
+        """A stage that raises is still measured"""
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            track_memory("test-fail")(fail)()
+        assert sample("dicto_stage_peak_rss_bytes_count", "test-fail") == 1
+
+
+class TestSnapshotStore:
+    """Test tracemalloc snapshots and diffs"""
+
+    def test_diff_points_at_allocating_line(self, snapshot_store):
+        """The biggest growth between snapshots is attributed to the allocating line"""
+        base_id, base = snapshot_store.take()
+        kept = allocate_blocks()
+        snapshot_id, snapshot = snapshot_store.take()
+        diff = snapshot_store.diff(snapshot, base)
+        assert snapshot_store.previous(snapshot_id) == base_id
+        assert "test_memory_profiling.py" in diff[0]["location"]
+        assert diff[0]["size_diff_bytes"] >= 2000 * 1024
+        assert len(kept) == 2000
+
+    def test_keeps_latest(self, snapshot_store):
+        """Only the configured number of snapshots are held"""
+        ids = [snapshot_store.take()[0] for _ in range(4)]
+        assert snapshot_store.get(ids[0]) is None
+        assert snapshot_store.get(ids[-1]) is not None
+
+    def test_clear_stops_on_demand_tracing(self, snapshot_store):
+        """Tracing started for a snapshot stops when snapshots are cleared"""
+        snapshot_store.take()
+        assert tracemalloc.is_tracing()
+        snapshot_store.clear()
+        assert not tracemalloc.is_tracing()
+        assert snapshot_store.status()["snapshots"] == []
+
+    def test_clear_keeps_boot_tracing(self, snapshot_store):
+        """Tracing enabled at boot is left running"""
+        tracemalloc.start()
+        snapshot_store.take()
+        snapshot_store.clear()
+        assert tracemalloc.is_tracing()
+
+
+class TestMemoryAdmin:
+    """Test the /admin/memory endpoints"""
+
+    def test_requires_token(self, admin_client):
+        """Snapshots need the admin token"""
+        assert admin_client.post("/admin/memory/snapshots").status_code == 401
+
+    def test_snapshot_and_diff(self, admin_client):
+        """Two snapshots can be diffed by file and line"""
+        first = admin_client.post("/admin/memory/snapshots", headers=ADMIN)
+        assert first.status_code == 201
+        kept = allocate_blocks()
+        second = admin_client.post("/admin/memory/snapshots?limit=5", headers=ADMIN)
+        assert len(second.get_json()["top"]) <= 5
+
+        response = admin_client.get(f"/admin/memory/snapshots/{second.get_json()['id']}/diff", headers=ADMIN)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["base"] == first.get_json()["id"]
+        assert any("test_memory_profiling.py" in entry["location"] for entry in data["diff"])
+        assert len(kept) == 2000
+
+        status = admin_client.delete("/admin/memory/snapshots", headers=ADMIN).get_json()
+        assert status["tracing"] is False
+
+    def test_diff_without_base(self, admin_client):
+        """Diffing the only snapshot is a 404"""
+        snapshot_id = admin_client.post("/admin/memory/snapshots", headers=ADMIN).get_json()["id"]
+        response = admin_client.get(f"/admin/memory/snapshots/{snapshot_id}/diff", headers=ADMIN)
+        assert response.status_code == 404
+
+    def test_rejects_unknown_grouping(self, admin_client):
+        """group_by must be a tracemalloc grouping"""
+        response = admin_client.post("/admin/memory/snapshots?group_by=module", headers=ADMIN)
+        assert response.status_code == 400
@@ -0,0 +1,199 @@
+"""
+Tests for latency-aware summarization model routing
+"""
+import pytest
+from prometheus_client import REGISTRY
+
+from website import process_audio
+from website.model_routing import ModelOption, ModelRouter, parse_models, summary_max_tokens
+from website.rate_limit import RateLimited, estimate_tokens
+from website.resilience import RetryPolicy
+from website.summarization import ChunkSummaryCache
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeCompletion:
+    def __init__(self, content):
+        self.choices = [type("Choice", (), {"message": type("Message", (), {"content": content})()})()]
+
+
+def router(**kwargs):
+    return ModelRouter([ModelOption("a", 16_000), ModelOption("b", 16_000), ModelOption("long", 1_000_000)],
+                       **kwargs)
+
+
+class TestRouter:
+    """Test candidate ordering from prompt size and live health"""
+
+    def test_untried_models_follow_preference(self):
+        """Without history the configured order is kept"""
+        assert router().candidates(100, 300) == ["a", "b", "long"]
+
+    def test_primary_first_then_fastest(self):
+        """The healthy primary stays first; latency EWMA orders the rest"""
+        models = router()
+        for name, latency in (("a", 3.0), ("b", 1.0), ("long", 2.0)):
+            models.record(name, latency, error=False)
+        assert models.candidates(100, 300) == ["a", "b", "long"]
+        assert REGISTRY.get_sample_value("dicto_model_routes_total", {"model": "a", "reason": "primary"}) >= 1
+
+    def test_long_prompt_prefers_large_context(self):
+        """Past the threshold a prompt goes to the largest context even when smaller ones fit"""
+        models = ModelRouter([ModelOption("a", 128_000), ModelOption("long", 1_000_000)], long_prompt_tokens=32_000)
+        models.record("a", 1.0, error=False)
+        models.record("long", 5.0, error=False)
+        assert models.candidates(1_000, 300) == ["a", "long"]
+        assert models.candidates(40_000, 600) == ["long", "a"]
+        assert REGISTRY.get_sample_value("dicto_model_routes_total", {"model": "long", "reason": "long_prompt"}) >= 1
+
+    def test_long_prompts_need_context(self):
+        """Models the prompt does not fit are left out"""
+        assert router().candidates(50_000, 600) == ["long"]
+        assert REGISTRY.get_sample_value("dicto_model_routes_total", {"model": "long", "reason": "context"}) >= 1
+
+    def test_degraded_model_moves_last(self):
+        """A model whose error EWMA crosses the threshold is only a last resort"""
+        models = router(alpha=0.3)
+        for name, latency in (("a", 1.0), ("b", 2.0), ("long", 3.0)):
+            models.record(name, latency, error=False)
+        models.record("a", 0.1, error=True)
+        assert models.candidates(100, 300)[0] == "a"
+        models.record("a", 0.1, error=True)
+        assert models.candidates(100, 300) == ["b", "long", "a"]
+        assert REGISTRY.get_sample_value("dicto_model_routes_total", {"model": "b", "reason": "fallback"}) >= 1
+
+    def test_idle_models_are_probed(self):
+        """A model left uncalled for the probe interval is tried first once, then ranking resumes"""
+        now = [0.0]
+        models = router(probe_interval_s=60, clock=lambda: now[0])
+        for name, latency in (("a", 1.0), ("b", 3.0), ("long", 2.0)):
+            models.record(name, latency, error=False)
+        assert models.candidates(100, 300)[0] == "a"
+
+        now[0] = 61.0
+        assert models.candidates(100, 300) == ["long", "a", "b"]
+        assert models.candidates(100, 300) == ["b", "a", "long"]
+        assert models.candidates(100, 300) == ["a", "long", "b"]
+        assert REGISTRY.get_sample_value("dicto_model_routes_total", {"model": "b", "reason": "probe"}) >= 1
+
+    def test_degraded_model_recovers_through_probes(self):
+        """Successful probes bring a degraded primary back to the front"""
+        now = [0.0]
+        models = router(alpha=0.5, probe_interval_s=60, clock=lambda: now[0])
+        models.record("a", 1.0, error=True)
+        models.record("a", 1.0, error=True)
+        models.record("b", 2.0, error=False)
+        models.record("long", 3.0, error=False)
+        assert models.candidates(100, 300)[0] == "b"
+
+        while models.candidates(100, 300)[0] != "a":
+            now[0] += 61
+        models.record("a", 1.0, error=False)
+        models.record("a", 1.0, error=False)
+        assert models.rank(100, 300)[0] == "a"
+
+    def test_ewma(self):
+        """The first sample seeds the latency average, later ones move it by alpha"""
+        models = router(alpha=0.5)
+        models.record("a", 2.0, error=False)
+        models.record("a", 4.0, error=False)
+        assert models.health()["a"] == {"latency_s": 3.0, "error_rate": 0.0, "samples": 2}
+
+    def test_max_tokens_scale_with_transcript(self):
+        """Short transcripts get short allowances, long ones are capped"""
+        assert summary_max_tokens(100) == 150
+        assert summary_max_tokens(2000) == 400
+        assert summary_max_tokens(100_000) == 600
+
+    def test_parse_models(self):
+        """SUMMARY_MODELS lists name:context pairs"""
+        assert parse_models("x:1000, y") == [ModelOption("x", 1000), ModelOption("y", 128_000)]
+        with pytest.raises(ValueError):
+            parse_models(" , ")
+
+
+class TestRoutedCompletions:
+    """Test summarization calls falling back between models"""
+
+    @pytest.fixture(autouse=True)
+    def no_backoff(self, monkeypatch):
+        monkeypatch.setattr(process_audio, "summarization_policy", RetryPolicy(backoff_base_s=0, backoff_max_s=0))
+
+    def test_retry_moves_to_next_model(self, monkeypatch, isolated_model_router):
+        """A failed attempt is retried on the next candidate and counted against the first"""
+        calls = []
+
+        def request(model, system_prompt, user_content, max_tokens, timeout):
+            calls.append(model)
+            if model == "small-model":
+                raise FakeAPIError(503)
+            return FakeCompletion("summary")
+
+        monkeypatch.setattr(process_audio, "_request_completion", request)
+        assert process_audio._complete("system", "hello", max_tokens=150) == "summary"
+        assert calls == ["small-model", "large-model"]
+        assert isolated_model_router.health()["small-model"]["error_rate"] > 0
+        assert REGISTRY.get_sample_value(
+            "dicto_model_fallbacks_total", {"from_model": "small-model", "to_model": "large-model"}) >= 1
+
+    def test_rate_limited_model_is_skipped(self, monkeypatch, isolated_model_router):
+        """A model out of local budget is passed over without counting as an error"""
+        calls = []
+
+        def request(model, system_prompt, user_content, max_tokens, timeout):
+            calls.append(model)
+            if model == "small-model":
+                raise RateLimited(f"{model}:tokens", 60.0, "upstream_budget")
+            return FakeCompletion("summary")
+
+        monkeypatch.setattr(process_audio, "_request_completion", request)
+        assert process_audio._complete("system", "hello", max_tokens=150) == "summary"
+        assert calls == ["small-model", "large-model"]
+        assert isolated_model_router.health()["small-model"]["error_rate"] == 0
+
+    def test_summary_allowance_follows_transcript(self, app, monkeypatch):
+        """Short transcripts are summarized with a small completion allowance"""
+        seen = []
+        monkeypatch.setattr(process_audio, "_request_completion",
+                            lambda model, system, user, max_tokens, timeout: seen.append(max_tokens)
+                            or FakeCompletion("## Title ##\n- point"))
+        with app.app_context():
+            process_audio.summarize_transcript("A short note about lunch.", store=False)
+        assert seen == [150]
+
+    def test_note_names_serving_model(self, monkeypatch, isolated_note_store):
+        """Note metadata records the model that wrote the summary, not the preferred one"""
+        def request(model, system_prompt, user_content, max_tokens, timeout):
+            if model == "small-model":
+                raise FakeAPIError(503)
+            return FakeCompletion("## Title ##\n- point")
+
+        monkeypatch.setattr(process_audio, "_request_completion", request)
+        result = process_audio.summarize_transcript("A short note about lunch.")
+
+        assert isolated_note_store.get(result["note_id"]).metadata["summary_model"] == "large-model"
+
+    def test_map_reduce_allowances_follow_length(self, monkeypatch, tmp_path):
+        """Chunk and reduce calls get completion allowances sized like other summaries"""
+        seen = []
+
+        def request(model, system_prompt, user_content, max_tokens, timeout):
+            seen.append((system_prompt, max_tokens))
+            return FakeCompletion("- part")
+
+        monkeypatch.setattr(process_audio, "_request_completion", request)
+        monkeypatch.setattr(process_audio, "CHUNK_TOKENS", 100)
+        monkeypatch.setattr(process_audio, "get_chunk_cache",
+                            lambda: ChunkSummaryCache(str(tmp_path / "cache.sqlite3")))
+        transcript = " ".join(f"This is sentence number {i} of the recording." for i in range(1000))
+
+        process_audio.summarize_map_reduce(transcript)
+
+        chunk_allowances = {tokens for prompt, tokens in seen if prompt == process_audio.CHUNK_SYSTEM_PROMPT}
+        assert chunk_allowances == {summary_max_tokens(100)}
+        assert (process_audio.SUMMARY_SYSTEM_PROMPT, summary_max_tokens(estimate_tokens(transcript))) in seen
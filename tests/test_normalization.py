@@ -0,0 +1,81 @@
+"""
+Tests for transcript normalization
+"""
+from unittest.mock import patch
+
+import pytest
+
+from website.normalization import normalize_transcript
+
+
+class TestNormalizeTranscript:
+    """Test disfluency removal"""
+
+    @pytest.mark.parametrize("raw, expected", [
+        ("Um, I think we should ship it.", "I think we should ship it."),
+        ("We need, uh, more time.", "We need, more time."),
+        ("The the plan is simple.", "The plan is simple."),
+        ("It was that that that one.", "It was that one."),
+        ("We should, we should go tomorrow.", "We should go tomorrow."),
+        ("I was- I was going to call.", "I was going to call."),
+        ("She was go- going home.", "She was going home."),
+        ("Hmm. Okay   then.", "Okay then."),
+    ])
+    def test_disfluencies_removed(self, raw, expected):
+        """Fillers, false starts and repetitions are stripped"""
+        assert normalize_transcript(raw).text == expected
+
+    @pytest.mark.parametrize("text", [
+        "Call me on 555 555 1234.",
+        "Meet in room four four two.",
+        "It was a 1 1 split.",
+        "The code is twenty twenty, then oh oh seven.",
+    ])
+    def test_repeated_numbers_kept(self, text):
+        """Repeated digits and number words are facts, not stutters"""
+        assert normalize_transcript(text).text == text
+
+    @pytest.mark.parametrize("text", [
+        "The price is 10- 100 dollars.",
+        "Plan A- a better plan.",
+        "I know that that is wrong.",
+        "She had had enough.",
+        "What it is is a bug.",
+        "Hmm.",
+    ])
+    def test_meaning_kept(self, text):
+        """Number ranges, case changes, grammatical doubles and lone fillers are left as said"""
+        assert normalize_transcript(text).text == text
+
+    def test_content_words_kept(self):
+        """Words that merely contain filler sounds survive"""
+        text = "Buy an umbrella, hummus and a well-known brand of ahi tuna."
+        assert normalize_transcript(text).text == text
+
+    def test_reports_token_reduction(self):
+        """The result carries before/after token estimates"""
+        result = normalize_transcript("Um, um, so, uh, the the the meeting, uh, is is on Friday.")
+        assert result.tokens_after < result.tokens_before
+        assert 0 < result.reduction < 1
+
+    def test_empty_transcript(self):
+        """Nothing to normalize is not an error"""
+        result = normalize_transcript("")
+        assert result.text == ""
+        assert result.reduction == 0.0
+
+
+class TestSummaryPrompt:
+    """Test the normalization stage in the summarization pipeline"""
+
+    def test_prompt_uses_normalized_transcript(self, app, isolated_note_store):
+        """The LLM sees the cleaned text while the note keeps the original"""
+        from website import process_audio
+
+        raw = "Um, the the budget is, uh, approved."
+        with app.app_context(), \
+                patch.object(process_audio, "NORMALIZE_TRANSCRIPTS", True), \
+                patch.object(process_audio, "_complete", return_value="## Budget ##") as complete:
+            result = process_audio.summarize_transcript(raw)
+        assert "the budget is, approved." in complete.call_args[0][1]
+        assert isolated_note_store.get(result["note_id"]).transcript == raw
@@ -0,0 +1,117 @@
+"""
+Tests for the persistent note store and id-based export
+"""
+import json
+import sqlite3
+
+from flask.testing import FlaskClient
+
+from website import process_audio
+from website.note_store import NoteStore
+
+
+class TestNoteStore:
+    """Test saving and loading notes"""
+
+    def test_round_trip(self, isolated_note_store, sample_transcript, sample_summary):
+        """Test a saved note loads back unchanged"""
+        note = isolated_note_store.save(sample_transcript, sample_summary, "plain", {"model": "m"})
+
+        loaded = isolated_note_store.get(note.id)
+
+        assert loaded.transcript == sample_transcript
+        assert loaded.summary == sample_summary
+        assert loaded.plain_text == "plain"
+        assert loaded.metadata == {"model": "m"}
+
+    def test_content_is_compressed(self, tmp_path):
+        """Test text columns are stored compressed"""
+        store = NoteStore(str(tmp_path / "notes.sqlite3"))
+        transcript = "repeat after me " * 1000
+        note = store.save(transcript, "summary", "summary")
+
+        conn = sqlite3.connect(str(tmp_path / "notes.sqlite3"))
+        stored = conn.execute("SELECT transcript FROM notes WHERE id = ?", (note.id,)).fetchone()[0]
+
+        assert len(stored) < len(transcript) / 10
+
+    def test_missing_note(self, isolated_note_store):
+        """Test unknown ids return None"""
+        assert isolated_note_store.get("missing") is None
+
+    def test_artifacts_deleted_with_note(self, isolated_note_store):
+        """Test cached artifacts go away with their note"""
+        note = isolated_note_store.save("t", "s", "s")
+        isolated_note_store.put_artifact(note.id, "pdf", b"%PDF")
+
+        assert isolated_note_store.get_artifact(note.id, "pdf") == b"%PDF"
+        assert isolated_note_store.delete(note.id)
+        assert isolated_note_store.get_artifact(note.id, "pdf") is None
+
+    def test_index_failure_keeps_note(self, isolated_note_store, monkeypatch):
+        """Test a note whose embedding fails is still saved and its id returned"""
+        def fail(*args):
+            raise RuntimeError("embeddings unavailable")
+
+        monkeypatch.setattr(process_audio, "index_note", fail)
+
+        note_id = process_audio._store_note("t", "s", "s", {})
+
+        assert note_id is not None
+        assert isolated_note_store.get(note_id).summary == "s"
+
+
+class TestNoteRoutes:
+    """Test note retrieval and export by id"""
+
+    def test_get_note(self, client: FlaskClient, isolated_note_store, client_owner, sample_summary):
+        """Test a stored note is returned as JSON"""
+        note = isolated_note_store.save("transcript", sample_summary, "plain", owner=client_owner)
+
+        response = client.get(f'/api/notes/{note.id}')
+
+        assert response.status_code == 200
+        data = json.loads(response.get_data(as_text=True))
+        assert data['note_id'] == note.id
+        assert data['summary'] == sample_summary
+
+    def test_get_missing_note(self, client: FlaskClient):
+        """Test unknown note ids return 404"""
+        response = client.get('/api/notes/nope')
+
+        assert response.status_code == 404
+
+    def test_export_by_id_caches_pdf(self, client: FlaskClient, isolated_note_store, client_owner, sample_summary):
+        """Test exporting by note id renders once and reuses the artifact"""
+        note = isolated_note_store.save("transcript", sample_summary, "plain", owner=client_owner)
+
+        first = client.post('/api/export-pdf', json={'note_id': note.id})
+        second = client.get(f'/api/notes/{note.id}/pdf')
+
+        assert first.status_code == 200
+        assert first.content_type == 'application/pdf'
+        assert second.get_data() == first.get_data()
+        assert isolated_note_store.get_artifact(note.id, "pdf") == first.get_data()
+
+    def test_export_unknown_id(self, client: FlaskClient):
+        """Test exporting an unknown note id returns 404"""
+        response = client.post('/api/export-pdf', json={'note_id': 'nope'})
+
+        assert response.status_code == 404
+
+    def test_other_owners_notes_hidden(self, client: FlaskClient, isolated_note_store, sample_summary):
+        """Test notes saved by another owner (or none) are not found"""
+        for owner in ("someone-else", ""):
+            note = isolated_note_store.save("transcript", sample_summary, "plain", owner=owner)
+
+            assert client.get(f'/api/notes/{note.id}').status_code == 404
+            assert client.get(f'/api/notes/{note.id}/pdf').status_code == 404
+            assert client.post('/api/export-pdf', json={'note_id': note.id}).status_code == 404
+
+    def test_owner_cookie_issued(self, app):
+        """Test a client without an owner token gets one as an HttpOnly cookie"""
+        response = app.test_client().get('/')
+
+        cookie = response.headers["Set-Cookie"]
+        assert cookie.startswith("dicto_owner=")
+        assert "HttpOnly" in cookie
@@ -0,0 +1,145 @@
+"""
+Tests for opt-in request profiling and the admin profile listing
+"""
+import json
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from website import create_app
+from website.profiling import (
+    PROFILE_HEADER,
+    ProfileConfig,
+    StackSampler,
+    install_profiling,
+    to_collapsed,
+    to_speedscope,
+)
+
+ADMIN = {"Authorization": "Bearer secret"}
+PROFILE = {PROFILE_HEADER: "t0ken"}
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def profiled_app(tmp_path, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    app = create_app()
+    app.config["TESTING"] = True
+    install_profiling(app, ProfileConfig(directory=str(tmp_path / "profiles"), token="t0ken", interval_s=0.001))
+    return app
+
+
+class TestSampler:
+    """Test stack sampling and output formats"""
+
+    def test_samples_target_thread(self):
+        """Sampled stacks include the function that was running"""
+        sampler = StackSampler(threading.get_ident(), interval_s=0.001).start()
+        busy(0.05)
+        sampler.stop()
+        assert sum(sampler.samples.values()) > 0
+        assert any(frame[0] == "busy" for stack in sampler.samples for frame in stack)
+
+    def test_collapsed_format(self):
+        """One line per stack, root first, with a count"""
+        samples = Counter({(("main", "/app/a.py", 1), ("work", "/app/b.py", 5)): 3})
+        assert to_collapsed(samples) == "main (a.py:1);work (b.py:5) 3\n"
+
+    def test_speedscope_format(self):
+        """Frames are shared and stacks weighted by sample time"""
+        samples = Counter({
+            (("main", "a.py", 1), ("work", "b.py", 5)): 3,
+            (("main", "a.py", 1),): 1,
+        })
+        profile = to_speedscope(samples, "GET /", 0.01)
+        assert len(profile["shared"]["frames"]) == 2
+        assert profile["profiles"][0]["weights"] == pytest.approx([0.03, 0.01])
+        assert profile["profiles"][0]["endValue"] == pytest.approx(0.04)
+
+
+class TestRequestProfiling:
+    """Test the request hooks"""
+
+    def test_not_installed_without_config(self, monkeypatch):
+        """No hooks are registered when PROFILE_DIR is unset"""
+        monkeypatch.delenv("PROFILE_DIR", raising=False)
+        app = create_app()
+        assert "dicto_profiles" not in app.extensions
+        assert not any(getattr(f, "__name__", "") == "start_profile"
+                       for funcs in app.before_request_funcs.values() for f in funcs)
+
+    def test_header_enables_profile(self, profiled_app):
+        """A request with the profile header gets a profile written"""
+        client = profiled_app.test_client()
+        response = client.get("/", headers=PROFILE)
+        profile_id = response.headers["X-Dicto-Profile-Id"]
+        listing = client.get("/admin/profiles", headers=ADMIN).get_json()["profiles"]
+        assert listing[0]["id"] == profile_id
+        assert listing[0]["path"] == "/"
+        download = client.get(f"/admin/profiles/{listing[0]['file']}", headers=ADMIN)
+        assert download.status_code == 200
+        assert json.loads(download.data)["profiles"][0]["type"] == "sampled"
+
+    def test_unprofiled_requests_untouched(self, profiled_app):
+        """Without the header or sampling nothing is recorded"""
+        client = profiled_app.test_client()
+        response = client.get("/")
+        assert "X-Dicto-Profile-Id" not in response.headers
+        assert client.get("/admin/profiles", headers=ADMIN).get_json()["profiles"] == []
+
+    def test_token_required_when_configured(self):
+        """With PROFILE_TOKEN set, only the matching header value profiles"""
+        config = ProfileConfig(directory="unused", token="t0ken")
+        assert not config.wants("1", "views.home")
+        assert config.wants("t0ken", "views.home")
+
+    def test_header_ignored_without_token(self):
+        """Without PROFILE_TOKEN only sampling profiles, whatever the header says"""
+        assert not ProfileConfig(directory="unused").wants("1", "views.home")
+        assert not ProfileConfig(directory="unused").wants("", "views.home")
+        assert ProfileConfig(directory="unused", sample_rate=1.0).wants("1", "views.process_audio")
+
+    def test_sampling_rate_limited_to_endpoints(self):
+        """Random sampling only applies to the configured endpoints"""
+        config = ProfileConfig(directory="unused", sample_rate=1.0)
+        assert config.wants(None, "views.process_audio")
+        assert not config.wants(None, "views.home")
+
+    def test_pruned_to_max_files(self, tmp_path, monkeypatch):
+        """Old profiles are deleted beyond the retention count"""
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        app = create_app()
+        install_profiling(app, ProfileConfig(directory=str(tmp_path / "p"), token="t0ken", max_files=2,
+                                             output_format="collapsed"))
+        client = app.test_client()
+        for _ in range(4):
+            client.get("/", headers=PROFILE)
+            time.sleep(0.002)  # profile ids sort by millisecond
+        assert len(client.get("/admin/profiles", headers=ADMIN).get_json()["profiles"]) == 2
+
+
+class TestAdminAuth:
+    """Test admin endpoint protection"""
+
+    def test_disabled_without_token(self, client, monkeypatch):
+        """Admin routes are hidden unless ADMIN_TOKEN is set"""
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/admin/profiles").status_code == 404
+
+    def test_wrong_token_rejected(self, client, monkeypatch):
+        """A bad bearer token gets 401"""
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        assert client.get("/admin/profiles", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+    def test_path_traversal_refused(self, profiled_app):
+        """Only files inside the profile directory are served"""
+        client = profiled_app.test_client()
+        assert client.get("/admin/profiles/..%2f..%2fetc%2fpasswd", headers=ADMIN).status_code == 404
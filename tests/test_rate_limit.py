@@ -0,0 +1,122 @@
+"""
+Tests for the shared upstream rate limiter
+"""
+import pytest
+
+from website.rate_limit import (
+    ModelBudget,
+    ModelRateLimiter,
+    RateLimited,
+    TokenBucketLimiter,
+    estimate_tokens,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "buckets.sqlite3")
+
+
+class TestTokenBucket:
+    """Test SQLite-backed token buckets"""
+
+    def test_full_bucket_admits_without_wait(self, db_path, clock):
+        """Test a fresh bucket starts at capacity"""
+        limiter = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+
+        assert limiter.acquire("k", 5, capacity=10, per_second=1, max_wait_s=0) == 0.0
+
+    def test_deficit_becomes_wait(self, db_path, clock):
+        """Test overdrawing the bucket returns the time to refill"""
+        sleeps = []
+        limiter = TokenBucketLimiter(db_path, sleep=sleeps.append, clock=clock)
+        limiter.acquire("k", 10, capacity=10, per_second=2, max_wait_s=10)
+
+        wait = limiter.acquire("k", 4, capacity=10, per_second=2, max_wait_s=10)
+
+        assert wait == 2.0
+        assert sleeps == [2.0]
+
+    def test_refills_over_time(self, db_path, clock):
+        """Test tokens accrue with elapsed time"""
+        limiter = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        limiter.acquire("k", 10, capacity=10, per_second=1, max_wait_s=0)
+        clock.now += 5
+
+        assert limiter.acquire("k", 5, capacity=10, per_second=1, max_wait_s=0) == 0.0
+
+    def test_rejects_when_wait_too_long(self, db_path, clock):
+        """Test RateLimited is raised and nothing is reserved"""
+        limiter = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        limiter.acquire("k", 10, capacity=10, per_second=1, max_wait_s=0)
+
+        with pytest.raises(RateLimited):
+            limiter.acquire("k", 5, capacity=10, per_second=1, max_wait_s=1)
+        clock.now += 10
+        assert limiter.acquire("k", 10, capacity=10, per_second=1, max_wait_s=0) == 0.0
+
+    def test_budget_shared_across_instances(self, db_path, clock):
+        """Test separate limiters (as in separate workers) share one budget"""
+        worker_a = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        worker_b = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        worker_a.acquire("k", 10, capacity=10, per_second=1, max_wait_s=0)
+
+        assert worker_b.acquire("k", 1, capacity=10, per_second=1, max_wait_s=5) == 1.0
+
+
+class TestModelRateLimiter:
+    """Test per-model RPM/TPM budgets"""
+
+    def test_tokens_budget_applies(self, db_path, clock):
+        """Test a large prompt waits on the tokens-per-minute bucket"""
+        limiter = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        models = ModelRateLimiter(limiter, {"m": ModelBudget(rpm=600, tpm=600)}, max_wait_s=120)
+        models.acquire("m", tokens=600)
+
+        assert models.acquire("m", tokens=60) == pytest.approx(6.0)
+
+    def test_rejected_tokens_refund_request_slot(self, db_path, clock):
+        """Test a call rejected on tokens gives its request slot back"""
+        limiter = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        models = ModelRateLimiter(limiter, {"m": ModelBudget(rpm=2, tpm=600)}, max_wait_s=1)
+        models.acquire("m", tokens=600)
+
+        for _ in range(3):
+            with pytest.raises(RateLimited):
+                models.acquire("m", tokens=600)
+
+        assert limiter.reserve("m:requests", 1, capacity=2, per_second=2 / 60, max_wait_s=0) == 0.0
+
+    def test_unknown_model_is_unlimited(self, db_path, clock):
+        """Test models without a budget are not throttled"""
+        limiter = TokenBucketLimiter(db_path, sleep=lambda s: None, clock=clock)
+        models = ModelRateLimiter(limiter, {}, max_wait_s=0)
+
+        assert models.acquire("other", tokens=10_000) == 0.0
+
+    def test_budget_from_env(self, monkeypatch):
+        """Test model budgets read normalised env var names"""
+        monkeypatch.setenv("RATE_LIMIT_GPT_4O_MINI_TPM", "1234")
+
+        budget = ModelBudget.from_env("gpt-4o-mini", rpm=10, tpm=99)
+
+        assert budget.rpm == 10
+        assert budget.tpm == 1234
+
+    def test_estimate_tokens(self):
+        """Test token estimate from transcript length"""
+        assert estimate_tokens("a" * 400) == 100
+        assert estimate_tokens("") == 1
@@ -0,0 +1,181 @@
+"""
+Tests for segmented recordings summarized incrementally
+"""
+import os
+import tempfile
+
+import pytest
+
+from website import process_audio
+from website.audio_ingest import IngestResult
+from website.process_audio import NoSpeechDetected
+from website.recording_sessions import RecordingSessionStore, SegmentOutOfOrder, SessionNotFound
+
+SESSION = "3f2b8c1e-0000-4000-8000-000000000001"
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fake_ingest(stream, expected_bytes=None):
+    """Store the body as-is; its bytes are the 'speech'"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as f:
+        f.write(stream.read())
+    return IngestResult(path=f.name, sha256="", bytes_read=0)
+
+
+def fake_transcribe(path):
+    with open(path) as f:
+        text = f.read()
+    if text == "silence":
+        raise NoSpeechDetected("No speech detected in audio")
+    return text
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Fake decode and transcription; model calls are recorded and answered by prompt kind"""
+    calls = []
+
+    def complete(system_prompt, user_content, max_tokens):
+        calls.append((system_prompt, user_content))
+        if system_prompt == process_audio.SUMMARY_SYSTEM_PROMPT:
+            return "## Final ##\n- done"
+        return f"notes {len(calls)}"
+
+    monkeypatch.setattr("website.views.ingest_audio_stream", fake_ingest)
+    monkeypatch.setattr("website.views.transcribe", fake_transcribe)
+    monkeypatch.setattr(process_audio, "_complete", complete)
+    monkeypatch.setattr(process_audio, "index_note", lambda *args: None)
+    return calls
+
+
+def post_segment(client, seq, text, session=SESSION):
+    return client.post(f"/api/recordings/{session}/segments/{seq}", data=text.encode(), content_type="audio/webm")
+
+
+class TestSessionStore:
+    """Test ordered, idempotent segment application"""
+
+    def test_appends_in_order(self, tmp_path):
+        """Segments extend the transcript and replace the notes"""
+        store = RecordingSessionStore(str(tmp_path / "s.sqlite3"))
+        assert store.check_next("s", 0) is None
+        store.append("s", 0, "one", "n1")
+        session = store.append("s", 1, "two", "n2")
+        assert (session.next_seq, session.transcript, session.notes) == (2, "one two", "n2")
+        assert store.get("s").transcript == "one two"
+
+    def test_rejects_gaps_and_repeats(self, tmp_path):
+        """A skipped or repeated segment reports the one expected"""
+        store = RecordingSessionStore(str(tmp_path / "s.sqlite3"))
+        store.append("s", 0, "one", "n1")
+        for seq in (0, 2):
+            with pytest.raises(SegmentOutOfOrder) as excinfo:
+                store.append("s", seq, "x", "x")
+            assert excinfo.value.expected_seq == 1
+        assert store.get("s").transcript == "one"
+
+    def test_abandoned_sessions_expire(self, tmp_path):
+        """Idle sessions are gone after the TTL"""
+        clock = FakeClock()
+        store = RecordingSessionStore(str(tmp_path / "s.sqlite3"), ttl_s=60, clock=clock)
+        store.append("s", 0, "one", "n1")
+        clock.now += 61
+        assert store.get("s") is None
+        store.append("other", 0, "x", "x")
+        assert store.check_next("s", 0) is None
+
+    def test_sessions_belong_to_their_owner(self, tmp_path):
+        """Another owner can neither see nor extend a session"""
+        store = RecordingSessionStore(str(tmp_path / "s.sqlite3"))
+        store.append("s", 0, "one", "n1", owner="alice")
+        assert store.get("s", owner="bob") is None
+        with pytest.raises(SessionNotFound):
+            store.check_next("s", 1, owner="bob")
+        with pytest.raises(SessionNotFound):
+            store.append("s", 1, "two", "n2", owner="bob")
+        store.delete("s", owner="bob")
+        assert store.get("s", owner="alice").transcript == "one"
+
+
+class TestSegmentEndpoints:
+    """Test folding segments as they arrive and the final delta call"""
+
+    def test_segments_fold_into_notes(self, client, pipeline):
+        """Each segment is folded into the notes from the previous ones"""
+        first = post_segment(client, 0, "first part")
+        assert first.status_code == 200
+        assert first.get_json()["next_seq"] == 1
+        second = post_segment(client, 1, "second part").get_json()
+        assert second["notes"] == "notes 2"
+        system_prompt, user_content = pipeline[1]
+        assert system_prompt == process_audio.ROLLING_SYSTEM_PROMPT
+        assert "notes 1" in user_content and "second part" in user_content
+
+    def test_finish_uses_notes_and_last_segment(self, client, pipeline, isolated_note_store,
+                                                isolated_recording_sessions):
+        """The final call sees only the notes and the last segment; the note keeps the full transcript"""
+        post_segment(client, 0, "first part")
+        post_segment(client, 1, "second part")
+        response = client.post(f"/api/recordings/{SESSION}/finish/2", data=b"last part", content_type="audio/webm")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["summary"] == "## Final ##\n- done"
+        assert data["transcript"] == "first part second part last part"
+
+        system_prompt, user_content = pipeline[-1]
+        assert system_prompt == process_audio.SUMMARY_SYSTEM_PROMPT
+        assert "notes 2" in user_content and "last part" in user_content
+        assert "first part" not in user_content
+        assert isolated_note_store.get(data["note_id"]).transcript == "first part second part last part"
+        assert isolated_recording_sessions.get(SESSION) is None
+
+    def test_finish_without_last_segment(self, client, pipeline):
+        """Stop right after a segment boundary sends no audio with finish"""
+        post_segment(client, 0, "only part")
+        response = client.post(f"/api/recordings/{SESSION}/finish/1")
+        assert response.status_code == 200
+        assert response.get_json()["transcript"] == "only part"
+
+    def test_finish_is_idempotent(self, client, pipeline):
+        """A retried finish replays the summary"""
+        post_segment(client, 0, "only part")
+        first = client.post(f"/api/recordings/{SESSION}/finish/1")
+        again = client.post(f"/api/recordings/{SESSION}/finish/1")
+        assert again.status_code == 200
+        assert again.get_json() == first.get_json()
+        assert again.headers.get("Idempotent-Replayed") == "true"
+
+    def test_other_owners_session_not_found(self, client, pipeline, isolated_recording_sessions):
+        """A session id taken by another owner can't be extended or finished"""
+        isolated_recording_sessions.append(SESSION, 0, "first part", "n1", owner="someone-else")
+        assert post_segment(client, 1, "hijack").status_code == 404
+        assert client.post(f"/api/recordings/{SESSION}/finish/1").status_code == 404
+        assert pipeline == []
+        assert isolated_recording_sessions.get(SESSION).transcript == "first part"
+
+    def test_out_of_order_segment(self, client, pipeline):
+        """A gap is refused with the expected segment number"""
+        response = post_segment(client, 1, "too soon")
+        assert response.status_code == 409
+        assert response.get_json()["expected_seq"] == 0
+
+    def test_silent_segment(self, client, pipeline):
+        """A silent segment advances the session without a model call"""
+        response = post_segment(client, 0, "silence")
+        assert response.status_code == 200
+        assert response.get_json()["next_seq"] == 1
+        assert pipeline == []
+
+    def test_rejects_bad_requests(self, client, pipeline):
+        """Segments need a valid session id and an audio body"""
+        assert post_segment(client, 0, "x", session="../etc").status_code in (400, 404)
+        assert client.post(f"/api/recordings/{SESSION}/segments/0", data={}).status_code == 400
+        assert client.post(f"/api/recordings/{SESSION}/finish/0").status_code == 400
+        assert not os.path.exists(f"data/{SESSION}")
@@ -0,0 +1,336 @@
+"""
+Tests for upstream retries, deadlines and hedging
+"""
+import io
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+from website import process_audio, resilience
+from website.resilience import (
+    AttemptTimeout,
+    CircuitBreaker,
+    CircuitOpen,
+    DeadlineExceeded,
+    LatencyWindow,
+    RetryPolicy,
+    backoff_delay,
+    call_with_resilience,
+    circuit_breaker,
+    is_retryable,
+    latency_window,
+    retry_after,
+)
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(headers or {})
+
+
+def flaky(failures, result="ok"):
+    """Return a callable that raises the given errors before succeeding"""
+    errors = list(failures)
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+class TestRetryClassification:
+    """Test which failures are retried and how long to wait"""
+
+    def test_rate_limit_and_server_errors_are_retryable(self):
+        """Test 429 and 5xx responses are retried"""
+        assert is_retryable(FakeAPIError(429))
+        assert is_retryable(FakeAPIError(503))
+        assert is_retryable(TimeoutError())
+
+    def test_client_errors_are_not_retryable(self):
+        """Test 4xx validation errors fail immediately"""
+        assert not is_retryable(FakeAPIError(400))
+        assert not is_retryable(ValueError("bad input"))
+
+    def test_retry_after_headers(self):
+        """Test Retry-After and retry-after-ms are parsed"""
+        assert retry_after(FakeAPIError(429, {"retry-after": "3"})) == 3.0
+        assert retry_after(FakeAPIError(429, {"retry-after-ms": "250"})) == 0.25
+        assert retry_after(FakeAPIError(429)) is None
+
+    def test_backoff_is_capped(self):
+        """Test jittered backoff never exceeds the configured maximum"""
+        policy = RetryPolicy(backoff_base_s=1.0, backoff_max_s=4.0)
+
+        assert backoff_delay(10, policy, rng=lambda lo, hi: hi) == 4.0
+        assert backoff_delay(1, policy, rng=lambda lo, hi: hi) == 2.0
+
+
+class TestCallWithResilience:
+    """Test the retry loop and deadline handling"""
+
+    def test_retries_then_succeeds(self):
+        """Test transient failures are retried until success"""
+        fn = flaky([FakeAPIError(500), FakeAPIError(502)])
+        sleeps = []
+
+        result = call_with_resilience("test-retry", fn, RetryPolicy(max_retries=3), sleep=sleeps.append)
+
+        assert result == "ok"
+        assert len(fn.calls) == 3
+        assert len(sleeps) == 2
+
+    def test_respects_retry_after(self):
+        """Test the wait is at least what Retry-After asks for"""
+        fn = flaky([FakeAPIError(429, {"retry-after": "2"})])
+        sleeps = []
+
+        call_with_resilience("test-retry-after", fn, RetryPolicy(backoff_max_s=0.1), sleep=sleeps.append)
+
+        assert sleeps == [2.0]
+
+    def test_gives_up_after_max_retries(self):
+        """Test the last error is raised once retries are exhausted"""
+        fn = flaky([FakeAPIError(500)] * 5)
+
+        with pytest.raises(FakeAPIError):
+            call_with_resilience("test-exhaust", fn, RetryPolicy(max_retries=2), sleep=lambda s: None)
+        assert len(fn.calls) == 3
+
+    def test_non_retryable_raises_immediately(self):
+        """Test non-retryable errors are not retried"""
+        fn = flaky([FakeAPIError(400)])
+
+        with pytest.raises(FakeAPIError):
+            call_with_resilience("test-fatal", fn, RetryPolicy(), sleep=lambda s: None)
+        assert len(fn.calls) == 1
+
+    def test_deadline_stops_retries(self):
+        """Test a retry that would overrun the deadline raises DeadlineExceeded"""
+        fn = flaky([FakeAPIError(429, {"retry-after": "30"})])
+
+        with pytest.raises(DeadlineExceeded):
+            call_with_resilience("test-deadline", fn, RetryPolicy(deadline_s=5), sleep=lambda s: None)
+
+    def test_attempt_timeout_bounded_by_deadline(self):
+        """Test each attempt receives a timeout no larger than the deadline"""
+        fn = flaky([])
+
+        call_with_resilience("test-timeout", fn, RetryPolicy(deadline_s=2, attempt_timeout_s=60))
+
+        assert fn.calls[0] <= 2
+
+    def test_policy_from_env(self, monkeypatch):
+        """Test policies read their settings from prefixed env vars"""
+        monkeypatch.setenv("WIDGET_MAX_RETRIES", "7")
+        monkeypatch.setenv("WIDGET_HEDGE_PERCENTILE", "95")
+
+        policy = RetryPolicy.from_env("widget", deadline_s=10)
+
+        assert policy.max_retries == 7
+        assert policy.hedge_percentile == 95
+        assert policy.deadline_s == 10
+
+
+class TestHedging:
+    """Test hedged requests for stragglers"""
+
+    def test_latency_window_percentile(self):
+        """Test percentile over the sliding window"""
+        window = LatencyWindow(size=10)
+        for value in range(1, 11):
+            window.record(value / 10)
+
+        assert window.percentile(50) == 0.6
+        assert len(window) == 10
+
+    def test_hedge_wins_against_straggler(self):
+        """Test a duplicate request answers when the first one stalls"""
+        window = latency_window("test-hedge")
+        for _ in range(20):
+            window.record(0.01)
+        release = threading.Event()
+        calls = []
+
+        def fn(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                release.wait(timeout=2)  # primary straggles
+                return "primary"
+            return "hedge"
+
+        policy = RetryPolicy(hedge_percentile=95, hedge_min_samples=20, attempt_timeout_s=5)
+        start = time.monotonic()
+        result = call_with_resilience("test-hedge", fn, policy)
+        release.set()
+
+        assert result == "hedge"
+        assert len(calls) == 2
+        assert time.monotonic() - start < 1
+
+    def test_timed_out_hedged_attempt_is_retried(self):
+        """Test a hedged attempt that times out is retried within the deadline"""
+        window = latency_window("test-hedge-timeout")
+        for _ in range(20):
+            window.record(0.01)
+        release = threading.Event()
+        calls = []
+
+        def fn(timeout):
+            calls.append(timeout)
+            if len(calls) <= 2:
+                release.wait(timeout=2)  # primary and hedge both stall
+                return "late"
+            return "ok"
+
+        policy = RetryPolicy(hedge_percentile=95, hedge_min_samples=20, attempt_timeout_s=0.2,
+                             deadline_s=5, backoff_base_s=0.01)
+        result = call_with_resilience("test-hedge-timeout", fn, policy, sleep=lambda s: None)
+        release.set()
+
+        assert result == "ok"
+        assert len(calls) == 3
+        assert is_retryable(AttemptTimeout("attempt"))
+        assert not is_retryable(DeadlineExceeded("deadline"))
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    """Test failing fast while an upstream is down"""
+
+    def breaker(self, clock, **kwargs):
+        return CircuitBreaker("test", min_calls=4, window=10, reset_timeout_s=30, clock=clock, **kwargs)
+
+    def test_opens_on_failure_rate(self):
+        """Test the circuit opens once half the recent calls failed"""
+        breaker = self.breaker(FakeClock())
+        for success in (True, False, True):
+            breaker.record(success)
+        assert breaker.state == "closed"
+        breaker.record(False)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen) as excinfo:
+            breaker.before_call()
+        assert excinfo.value.retry_after_s == 30
+
+    def test_half_open_probe(self):
+        """Test one probe goes out after the reset timeout and its outcome decides the state"""
+        clock = FakeClock()
+        breaker = self.breaker(clock)
+        for _ in range(4):
+            breaker.record(False)
+        clock.now += 30
+        assert breaker.allows_calls()
+        breaker.before_call()
+        assert breaker.state == "half_open"
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+        breaker.record(False)
+        assert breaker.state == "open"
+
+        clock.now += 30
+        breaker.before_call()
+        breaker.record(True)
+        assert breaker.state == "closed"
+        breaker.before_call()
+
+    def test_slow_calls_count_as_failures(self):
+        """Test successful calls slower than slow_call_s count against the upstream"""
+        breaker = self.breaker(FakeClock(), slow_call_s=10)
+        for _ in range(4):
+            breaker.record(True, duration_s=12)
+        assert breaker.state == "open"
+
+    def test_call_with_resilience_fails_fast(self):
+        """Test an open circuit rejects calls without running them; client errors don't trip it"""
+        for _ in range(5):
+            with pytest.raises(FakeAPIError):
+                call_with_resilience("test-fatal-breaker", flaky([FakeAPIError(400)]), RetryPolicy())
+        assert circuit_breaker("test-fatal-breaker").state == "closed"
+
+        for _ in range(5):
+            with pytest.raises(FakeAPIError):
+                call_with_resilience("test-breaker", flaky([FakeAPIError(503)]), RetryPolicy(max_retries=0))
+        fn = flaky([])
+        with pytest.raises(CircuitOpen):
+            call_with_resilience("test-breaker", fn, RetryPolicy())
+        assert fn.calls == []
+        assert REGISTRY.get_sample_value("dicto_circuit_state", {"call": "test-breaker"}) == 2
+
+    def test_breaker_from_env(self, monkeypatch):
+        """Test breakers read their settings from prefixed env vars"""
+        monkeypatch.setenv("WIDGET_BREAKER_RESET_TIMEOUT_S", "5")
+        assert CircuitBreaker.from_env("widget").reset_timeout_s == 5
+
+
+class TestDegradedSummaries:
+    """Test transcript-only responses while summarization is down, and backfill"""
+
+    def open_summarization(self):
+        breaker = circuit_breaker("summarization")
+        for _ in range(breaker.min_calls):
+            breaker.record(False)
+
+    def test_transcript_only_while_open(self, app, monkeypatch, isolated_note_store):
+        """Test the transcript is saved and returned without waiting on the model"""
+        monkeypatch.setattr(process_audio, "_request_completion",
+                            lambda *args: pytest.fail("summarization was called"))
+        self.open_summarization()
+
+        with app.app_context():
+            data = process_audio.process_with_LLM("hello there").get_json()
+
+        assert data["status"] == "summary_pending"
+        assert data["transcript"] == "hello there"
+        assert data["retry_after_s"] > 0
+        assert isolated_note_store.get(data["note_id"]).metadata["summary_pending"] is True
+
+    def test_backfill(self, app, monkeypatch, isolated_note_store):
+        """Test pending notes get their summary once the upstream is back"""
+        self.open_summarization()
+        with app.app_context():
+            note_id = process_audio.process_with_LLM("hello there").get_json()["note_id"]
+        monkeypatch.setattr(process_audio, "_complete", lambda *args, **kwargs: "## Title ##\n- point")
+        monkeypatch.setattr(resilience, "_breakers", {})
+
+        assert process_audio.backfill_summaries() == {"backfilled": 1, "failed": 0, "pending": 0}
+        note = isolated_note_store.get(note_id)
+        assert note.summary == "## Title ##\n- point"
+        assert note.metadata["backfilled"] is True
+        assert "summary_pending" not in note.metadata
+        assert isolated_note_store.search("point").hits[0].note_id == note_id
+
+    def test_transcription_open_is_503(self, client, tmp_path):
+        """Test an open transcription circuit fails fast with Retry-After"""
+        breaker = circuit_breaker("transcription")
+        for _ in range(breaker.min_calls):
+            breaker.record(False)
+        decoded = tmp_path / "decoded.mp3"
+        decoded.write_bytes(b"x")
+        with patch("website.views.speed_up_audio", return_value=str(decoded)):
+            response = client.post("/api/process-audio", data={"audio": (io.BytesIO(b"x" * 2000), "a.webm")},
+                                   content_type="multipart/form-data")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) > 0
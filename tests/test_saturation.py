@@ -0,0 +1,138 @@
+"""
+Tests for the pod saturation board behind /autoscaling
+"""
+import os
+import struct
+
+import pytest
+from prometheus_client import REGISTRY
+
+from website.admission import StageLimiter
+from website.saturation import HEADER, SaturationBoard, track_pipeline
+from website.processes import process_start
+
+
+@pytest.fixture
+def board(tmp_path):
+    return SaturationBoard(str(tmp_path / "board"), capacities={"decode": 2, "transcription": 8})
+
+
+def dead_pid():
+    """A pid no process is using"""
+    pid = 2 ** 22 - 1
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid -= 1
+
+
+def parent_start():
+    """Our parent's start time, as a live worker would have written it"""
+    return int(process_start(os.getppid()) or 0)
+
+
+class TestBoard:
+    """Test per-worker slots and pod-wide aggregation"""
+
+    def test_idle_worker_counts_capacity(self, board):
+        """A worker that joined contributes capacity with nothing in flight"""
+        board.join()
+        snapshot = board.snapshot()
+        assert snapshot["workers"] == 1
+        assert snapshot["stages"]["decode"] == {"in_flight": 0, "queued": 0, "capacity": 2, "saturation": 0.0}
+        assert snapshot["saturation"] == 0.0
+
+    def test_saturation_is_busiest_stage(self, board):
+        """In flight plus queued over capacity, for the busiest stage"""
+        board.update_stage("decode", 2, 1)
+        board.update_stage("transcription", 4, 0)
+        snapshot = board.snapshot()
+        assert snapshot["stages"]["decode"]["saturation"] == 1.5
+        assert snapshot["stages"]["transcription"]["saturation"] == 0.5
+        assert snapshot["saturation"] == 1.5
+        assert snapshot["queued"] == 1
+
+    def test_sums_other_workers(self, board):
+        """Slots written by other live workers are added in"""
+        board.join()
+        # Our parent stands in for a live worker other than this one
+        with open(board.path, "r+b") as f:
+            f.seek(board.slot_size)
+            f.write(HEADER.pack(os.getppid(), parent_start(), 3) + struct.pack("<iii", 1, 0, 2) + struct.pack("<iii", 8, 4, 8))
+        snapshot = board.snapshot()
+        assert snapshot["workers"] == 2
+        assert snapshot["pipelines_in_flight"] == 3
+        assert snapshot["stages"]["decode"]["capacity"] == 4
+        assert snapshot["stages"]["transcription"]["saturation"] == 0.75
+
+    def test_ignores_and_reuses_dead_workers(self, tmp_path):
+        """A dead worker's slot is neither counted nor kept"""
+        path = str(tmp_path / "board")
+        board = SaturationBoard(path, capacities={"decode": 2}, max_workers=1)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(dead_pid(), 0, 5) + struct.pack("<iii", 2, 2, 2))
+        snapshot = board.snapshot()
+        assert snapshot["workers"] == 1
+        assert snapshot["pipelines_in_flight"] == 0
+
+    def test_ignores_reused_pids(self, tmp_path):
+        """A slot whose pid now belongs to a process started at another time is dead"""
+        if not parent_start():
+            pytest.skip("needs /proc")
+        path = str(tmp_path / "board")
+        board = SaturationBoard(path, capacities={"decode": 2}, max_workers=1)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(os.getppid(), parent_start() + 1, 5) + struct.pack("<iii", 2, 2, 2))
+        snapshot = board.snapshot()
+        assert snapshot["workers"] == 1
+        assert snapshot["pipelines_in_flight"] == 0
+
+    def test_no_free_slot(self, tmp_path):
+        """Running out of slots is an error rather than silent overwriting"""
+        path = str(tmp_path / "board")
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(os.getppid(), parent_start(), 0) + struct.pack("<iii", 0, 0, 2))
+        with pytest.raises(RuntimeError):
+            SaturationBoard(path, capacities={"decode": 2}, max_workers=1).join()
+
+    def test_track_pipeline(self, isolated_saturation):
+        """Decorated views count as pipelines in flight while they run"""
+        seen = []
+
+        @track_pipeline
+        def view():
+            seen.append(isolated_saturation.snapshot()["pipelines_in_flight"])
+
+        view()
+        assert seen == [1]
+        assert isolated_saturation.snapshot()["pipelines_in_flight"] == 0
+
+
+class TestPublishing:
+    """Test stage limiters feeding the board and the endpoints"""
+
+    def test_limiter_publishes(self, isolated_saturation):
+        """Admission limiters publish their occupancy"""
+        limiter = StageLimiter("decode", max_concurrent=2, max_queue=4, wait_budget_s=1)
+        with limiter.admit():
+            assert isolated_saturation.snapshot()["stages"]["decode"]["in_flight"] == 1
+        assert isolated_saturation.snapshot()["stages"]["decode"]["in_flight"] == 0
+
+    def test_autoscaling_endpoint(self, client, isolated_decode_budget):
+        """The endpoint includes decode memory in the saturation"""
+        with isolated_decode_budget.reserve(256 * 1024 * 1024):
+            data = client.get("/autoscaling").get_json()
+        assert data["workers"] == 1
+        assert data["decode_memory"] == 0.5
+        assert data["saturation"] == 0.5
+        assert set(data["stages"]) == {"decode", "transcription", "summarization"}
+
+    def test_prometheus_gauge(self, isolated_saturation):
+        """dicto_pod_saturation is computed at scrape time"""
+        isolated_saturation.update_stage("transcription", 8, 8)
+        assert REGISTRY.get_sample_value("dicto_pod_saturation") == 2.0
+        assert REGISTRY.get_sample_value("dicto_pod_queued") == 8
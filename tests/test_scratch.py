@@ -0,0 +1,161 @@
+"""
+Tests for the managed scratch space behind temp audio files
+"""
+import io
+import os
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+from website.scratch import ScratchFull, ScratchSpace, estimate_scratch_bytes, scratch_path
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def dead_pid():
+    """A pid no process is using"""
+    pid = 2 ** 22 - 1
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid -= 1
+
+
+@pytest.fixture
+def space(tmp_path):
+    return ScratchSpace(str(tmp_path / "scratch"), quota_bytes=1000, reap_interval_s=0)
+
+
+def write(path, nbytes):
+    with open(path, "wb") as f:
+        f.write(b"x" * nbytes)
+
+
+class TestQuota:
+    """Test admission against the byte quota"""
+
+    def test_rejects_what_does_not_fit(self, space):
+        """Reservations count against the quota until released"""
+        first = space.admit(600)
+        with pytest.raises(ScratchFull) as excinfo:
+            space.admit(600)
+        assert excinfo.value.retry_after_header == "5"
+        space.release(first)
+        space.release(space.admit(600))
+
+    def test_oversized_request_admitted_when_empty(self, space):
+        """A request bigger than the quota still runs alone"""
+        space.release(space.admit(5000))
+
+    def test_files_beyond_reservation_are_counted(self, space):
+        """A request is charged the larger of its reservation and its files"""
+        scope = space.admit(100)
+        write(scope.new_path(".webm"), 300)
+        usage = space.usage()
+        assert (usage.files, usage.used_bytes, usage.accounted_bytes) == (1, 300, 300)
+        space.release(scope)
+
+    def test_estimate(self):
+        """Spooled copy plus decoded output, or a default when the size is unknown"""
+        assert estimate_scratch_bytes(1000) == 2000
+        assert estimate_scratch_bytes(None) > 0
+
+
+class TestRequestScope:
+    """Test per-request tracking and cleanup"""
+
+    def test_leftovers_deleted(self, space):
+        """Files a request did not delete go when it ends, with its reservation"""
+        with space.request_scope(100):
+            path = space.new_path(".webm")
+            write(path, 10)
+            assert space.usage().accounted_bytes == 100
+        assert not os.path.exists(path)
+        assert space.usage().accounted_bytes == 0
+
+    def test_cleanup_on_exception(self, space):
+        """A failing request still leaves nothing behind"""
+        with pytest.raises(RuntimeError):
+            with space.request_scope(100):
+                space.new_path(".webm")
+                raise RuntimeError("export failed")
+        assert space.usage().files == 0
+
+    def test_pipeline_failure_leaves_no_files(self, client, isolated_scratch):
+        """A decode step that fails after creating its output doesn't leak it"""
+        def failing_decode(audio_file):
+            write(scratch_path(".mp3"), 10)
+            raise RuntimeError("export failed")
+
+        with patch("website.views.speed_up_audio", side_effect=failing_decode):
+            response = client.post("/api/process-audio", data={"audio": (io.BytesIO(b"x" * 2000), "a.webm")},
+                                   content_type="multipart/form-data")
+        assert response.status_code == 500
+        assert isolated_scratch.usage().files == 0
+
+    def test_full_scratch_sheds_requests(self, client, isolated_scratch):
+        """Requests that don't fit are shed with Retry-After"""
+        scope = isolated_scratch.admit(isolated_scratch.quota_bytes)
+        response = client.post("/api/process-audio", data=b"OggS" * 100, content_type="audio/webm")
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "5"
+        isolated_scratch.release(scope)
+
+
+class TestReaper:
+    """Test orphan reaping"""
+
+    def test_reaps_dead_workers_files(self, space):
+        """Files and reservations of exited workers are deleted"""
+        pid = dead_pid()
+        write(os.path.join(space.directory, f"{pid}-abc-0.webm"), 50)
+        write(os.path.join(space.directory, f"{pid}-abc.reserve"), 3)
+        assert space.reap() == 2
+        assert space.usage().files == 0
+
+    def test_reaps_files_of_reused_pids(self, space):
+        """A live pid that started after the file was tagged is a different process"""
+        write(os.path.join(space.directory, f"{os.getpid()}.1-abc-0.webm"), 50)
+        assert space.reap() == 1
+        assert space.usage().files == 0
+
+    def test_reaps_old_files(self, tmp_path):
+        """Files past the maximum age go even if their worker is alive"""
+        clock = FakeClock()
+        space = ScratchSpace(str(tmp_path / "scratch"), quota_bytes=1000, max_age_s=60, reap_interval_s=0,
+                             clock=clock)
+        path = space.new_path(".webm")
+        clock.now = os.stat(path).st_mtime + 30
+        assert space.reap() == 0
+        clock.now += 60
+        assert space.reap() == 1
+        assert not os.path.exists(path)
+
+    def test_keeps_live_requests(self, tmp_path):
+        """Files of requests still running in this worker are never reaped"""
+        clock = FakeClock()
+        space = ScratchSpace(str(tmp_path / "scratch"), quota_bytes=1000, max_age_s=60, reap_interval_s=0,
+                             clock=clock)
+        with space.request_scope(100):
+            path = space.new_path(".webm")
+            clock.now = os.stat(path).st_mtime + 3600
+            assert space.reap() == 0
+            assert os.path.exists(path)
+
+    def test_metrics(self, isolated_scratch):
+        """Usage is exported at scrape time"""
+        write(isolated_scratch.new_path(".webm"), 123)
+        assert REGISTRY.get_sample_value("dicto_scratch_used_bytes") == 123
+        assert REGISTRY.get_sample_value("dicto_scratch_files") == 1
+        assert REGISTRY.get_sample_value("dicto_scratch_filesystem_free_bytes") > 0
@@ -0,0 +1,198 @@
+"""
+Tests for full-text search over stored notes
+"""
+import json
+import sqlite3
+import zlib
+
+import pytest
+from flask.testing import FlaskClient
+
+from website import note_store
+from website.note_store import NoteStore, build_match_query, make_snippet
+
+
+@pytest.fixture
+def populated_store(isolated_note_store, client_owner):
+    isolated_note_store.save("We talked about the garden and planting tomatoes.",
+                             "## Garden Plans ##\n- Plant tomatoes", "", owner=client_owner)
+    isolated_note_store.save("The budget meeting ran long; budget cuts are coming.",
+                             "## Budget Meeting ##\n- Cuts coming", "", owner=client_owner)
+    isolated_note_store.save("Remember to email the client about the budget.",
+                             "## Client Email ##\n- Email client", "", owner=client_owner)
+    return isolated_note_store
+
+
+class TestQueryParsing:
+    """Test free-text to FTS5 query conversion"""
+
+    def test_tokens_quoted_and_last_is_prefix(self):
+        """Test words are quoted and the last one prefix-matches"""
+        assert build_match_query("budget meet") == '"budget" "meet"*'
+
+    def test_single_letter_is_not_a_prefix(self):
+        """Test a one-letter last word matches exactly instead of expanding"""
+        assert build_match_query("budget a") == '"budget" "a"'
+
+    def test_fts_syntax_is_neutralised(self):
+        """Test FTS operators in user input cannot break the query"""
+        assert build_match_query('budget" OR NEAR(') == '"budget" "OR" "NEAR"*'
+        assert build_match_query("   ") is None
+
+    def test_snippet_escapes_and_marks(self):
+        """Test snippets escape HTML and highlight matches"""
+        snippet = make_snippet("", "Check <script> budget today", ["budget"])
+
+        assert "&lt;script&gt;" in snippet
+        assert "<mark>budget</mark>" in snippet
+
+
+class TestNoteSearch:
+    """Test ranked search with pagination"""
+
+    def test_finds_matching_notes(self, populated_store):
+        """Test only notes containing the terms are returned"""
+        page = populated_store.search("budget")
+
+        assert len(page.hits) == 2
+        assert all("budget" in hit.snippet.lower() for hit in page.hits)
+
+    def test_summary_matches_rank_higher(self, populated_store):
+        """Test notes matching in the summary and repeatedly rank first"""
+        page = populated_store.search("budget")
+
+        assert "Budget" in page.hits[0].snippet
+
+    def test_prefix_and_stemmed_matches(self, populated_store):
+        """Test partial last word and porter stemming"""
+        assert len(populated_store.search("tomat").hits) == 1
+        assert len(populated_store.search("plant").hits) == 1
+
+    def test_cursor_pagination_covers_all_results(self, isolated_note_store):
+        """Test paging with cursors visits every hit exactly once"""
+        for i in range(7):
+            isolated_note_store.save(f"note {i} about widgets " + "widgets " * i, "summary", "")
+
+        seen = []
+        cursor = None
+        while True:
+            page = isolated_note_store.search("widgets", limit=3, cursor=cursor)
+            seen.extend(hit.note_id for hit in page.hits)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert len(seen) == 7
+        assert len(set(seen)) == 7
+
+    def test_deleted_notes_leave_index(self, populated_store):
+        """Test deleting a note removes it from search"""
+        note_id = populated_store.search("tomatoes").hits[0].note_id
+        populated_store.delete(note_id)
+
+        assert populated_store.search("tomatoes").hits == []
+
+    def test_existing_notes_backfilled(self, tmp_path):
+        """Test notes without index rows are indexed on open"""
+        store = NoteStore(str(tmp_path / "notes.sqlite3"))
+        store.save("orphaned transcript about kayaks", "summary", "")
+        store._connect().execute("INSERT INTO notes_fts (notes_fts) VALUES ('delete-all')")
+
+        reopened = NoteStore(str(tmp_path / "notes.sqlite3"))
+
+        assert len(reopened.search("kayaks").hits) == 1
+
+    def test_index_keeps_no_copy_of_the_text(self, tmp_path):
+        """Test an index with its own copy of the text is rebuilt contentless on open"""
+        db_path = str(tmp_path / "old_notes.sqlite3")
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE notes (id TEXT PRIMARY KEY, created REAL NOT NULL, transcript BLOB NOT NULL,
+                                summary BLOB NOT NULL, plain_text BLOB NOT NULL, metadata TEXT NOT NULL DEFAULT '{}');
+            CREATE VIRTUAL TABLE notes_fts USING fts5(note_id UNINDEXED, transcript, summary);
+            """
+        )
+        packed = [zlib.compress(text.encode()) for text in ("old note about kayaks", "summary", "")]
+        conn.execute("INSERT INTO notes VALUES ('n1', 0, ?, ?, ?, '{}')", packed)
+        conn.execute("INSERT INTO notes_fts (rowid, note_id, transcript, summary) "
+                     "VALUES (1, 'n1', 'old note about kayaks', 'summary')")
+        conn.commit()
+        conn.close()
+
+        store = NoteStore(db_path)
+
+        assert [hit.note_id for hit in store.search("kayaks").hits] == ["n1"]
+        text_tables = store._connect().execute("SELECT name FROM sqlite_master WHERE name = 'notes_fts_content'")
+        assert text_tables.fetchall() == []
+
+    @pytest.mark.parametrize("match_owner_term", [True, False])
+    def test_scoped_to_owner(self, populated_store, client_owner, monkeypatch, match_owner_term):
+        """Test an owner's search only sees their own notes, by index term or per-match check"""
+        monkeypatch.setattr(NoteStore, "_match_owner_term", lambda self, conn, owner: match_owner_term)
+        populated_store.save("Someone else's budget.", "## Budget ##", "", owner="someone-else")
+
+        assert len(populated_store.search("budget", owner=client_owner).hits) == 2
+        assert len(populated_store.search("budget", owner="someone-else").hits) == 1
+        assert populated_store.search("budget", owner="nobody").hits == []
+
+    def test_owner_scoping_follows_note_share(self, isolated_note_store, monkeypatch):
+        """Test small owners are matched by index term and one owning most notes per match"""
+        monkeypatch.setattr(note_store, "SEARCH_MAX_CANDIDATES", 2)
+        for i in range(6):
+            isolated_note_store.save(f"note {i}", "summary", "", owner="big")
+        small = isolated_note_store.save("note", "summary", "", owner="small")
+        conn = isolated_note_store._connect()
+
+        assert isolated_note_store._match_owner_term(conn, "small")
+        assert not isolated_note_store._match_owner_term(conn, "big")
+        isolated_note_store.delete(small.id)
+        assert conn.execute("SELECT notes FROM owner_counts WHERE owner = 'small'").fetchone() == (0,)
+
+    def test_broad_queries_rank_newest_matches(self, isolated_note_store, monkeypatch):
+        """Test ranking is capped to the newest matches, across every page"""
+        monkeypatch.setattr(note_store, "SEARCH_MAX_CANDIDATES", 4)
+        saved = [isolated_note_store.save(f"widgets {i}", "summary", "").id for i in range(10)]
+
+        seen = []
+        cursor = None
+        while True:
+            page = isolated_note_store.search("widgets", limit=3, cursor=cursor)
+            seen.extend(hit.note_id for hit in page.hits)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert sorted(seen) == sorted(saved[-4:])
+
+
+class TestSearchRoute:
+    """Test the search API"""
+
+    def test_search_endpoint(self, client: FlaskClient, populated_store):
+        """Test results and cursor are returned as JSON"""
+        response = client.get('/api/notes/search?q=budget&limit=1')
+
+        assert response.status_code == 200
+        data = json.loads(response.get_data(as_text=True))
+        assert len(data['results']) == 1
+        assert data['next_cursor']
+
+        second = client.get(f"/api/notes/search?q=budget&limit=1&cursor={data['next_cursor']}")
+        second_data = json.loads(second.get_data(as_text=True))
+        assert second_data['results'][0]['note_id'] != data['results'][0]['note_id']
+
+    def test_search_requires_query(self, client: FlaskClient):
+        """Test an empty query is rejected"""
+        assert client.get('/api/notes/search').status_code == 400
+
+    def test_search_endpoint_scoped_to_owner(self, app, populated_store):
+        """Test another client does not see this client's notes"""
+        response = app.test_client().get('/api/notes/search?q=budget')
+
+        assert response.status_code == 200
+        assert response.get_json()['results'] == []
+
+    def test_invalid_cursor(self, client: FlaskClient):
+        """Test a malformed cursor returns 400"""
+        assert client.get('/api/notes/search?q=x&cursor=%%%').status_code == 400
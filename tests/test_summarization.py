@@ -0,0 +1,167 @@
+"""
+Tests for map-reduce summarization of long transcripts
+"""
+import json
+
+from website import process_audio
+from website.summarization import (
+    ChunkSummaryCache,
+    chunk_transcript,
+    map_reduce_summary,
+    needs_map_reduce,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def long_transcript(sentences=200):
+    return " ".join(f"This is sentence number {i} of the recording." for i in range(sentences))
+
+
+class TestChunking:
+    """Test token-bounded transcript chunking"""
+
+    def test_chunks_respect_token_budget(self):
+        """Test every chunk fits the character budget for its token limit"""
+        chunks = chunk_transcript(long_transcript(), max_tokens=50)
+
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 50 * 4 for chunk in chunks)
+
+    def test_chunks_preserve_all_text(self):
+        """Test chunking loses no sentences"""
+        transcript = long_transcript(30)
+
+        assert " ".join(chunk_transcript(transcript, max_tokens=40)) == transcript
+
+    def test_run_on_sentence_is_split(self):
+        """Test a sentence longer than a chunk is hard-split on words"""
+        chunks = chunk_transcript("word " * 500, max_tokens=25)
+
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert sum(chunk.count("word") for chunk in chunks) == 500
+
+    def test_short_transcript_skips_map_reduce(self):
+        """Test the threshold gate"""
+        assert not needs_map_reduce("short note", threshold_tokens=100)
+        assert needs_map_reduce(long_transcript(), threshold_tokens=100)
+        assert not needs_map_reduce(long_transcript(), threshold_tokens=0)
+
+
+class TestMapReduce:
+    """Test parallel map with cached chunk summaries"""
+
+    def test_reduce_receives_partials_in_order(self):
+        """Test partial summaries reach reduce in transcript order"""
+        result = map_reduce_summary(
+            long_transcript(40),
+            summarize_chunk=lambda chunk: chunk.split(".")[0],
+            reduce=lambda partials: "|".join(partials),
+            chunk_tokens=30,
+        )
+
+        parts = result.split("|")
+        assert parts[0] == "This is sentence number 0 of the recording"
+        assert len(parts) > 1
+
+    def test_resummarize_only_reruns_reduce(self, tmp_path):
+        """Test cached chunk summaries are reused on a second run"""
+        cache = ChunkSummaryCache(str(tmp_path / "cache.sqlite3"))
+        map_calls = []
+        reduce_calls = []
+
+        def summarize_chunk(chunk):
+            map_calls.append(chunk)
+            return f"summary of {len(chunk)} chars"
+
+        def reduce(partials):
+            reduce_calls.append(partials)
+            return "## Title ##"
+
+        for _ in range(2):
+            map_reduce_summary(long_transcript(), summarize_chunk, reduce, chunk_tokens=100,
+                               cache=cache, namespace="v1")
+
+        assert len(reduce_calls) == 2
+        assert len(map_calls) == len(reduce_calls[0])
+
+    def test_namespace_change_invalidates_cache(self, tmp_path):
+        """Test a new prompt namespace does not reuse old summaries"""
+        cache = ChunkSummaryCache(str(tmp_path / "cache.sqlite3"))
+        calls = []
+
+        for namespace in ("v1", "v2"):
+            map_reduce_summary("One sentence.", lambda c: calls.append(c) or "s", lambda p: "r",
+                               chunk_tokens=100, cache=cache, namespace=namespace)
+
+        assert len(calls) == 2
+
+    def test_cache_entries_expire(self, tmp_path):
+        """Test summaries older than the TTL are missed and pruned on put"""
+        clock = FakeClock()
+        cache = ChunkSummaryCache(str(tmp_path / "cache.sqlite3"), ttl_s=60, clock=clock)
+        cache.put("old", "summary")
+        clock.now += 61
+
+        assert cache.get("old") is None
+        cache.put("new", "summary")
+        rows = cache._connect().execute("SELECT key FROM chunk_summaries").fetchall()
+        assert rows == [("new",)]
+
+    def test_cache_row_cap(self, tmp_path):
+        """Test the oldest summaries beyond max_rows are pruned"""
+        clock = FakeClock()
+        cache = ChunkSummaryCache(str(tmp_path / "cache.sqlite3"), max_rows=2, clock=clock)
+        for key in ("a", "b", "c"):
+            cache.put(key, "summary")
+            clock.now += 1
+
+        assert cache.get("a") is None
+        assert cache.get("b") == cache.get("c") == "summary"
+
+    def test_new_summaries_filed_under_cache_namespace(self, tmp_path):
+        """Test fresh summaries are stored under cache_namespace() rather than the lookup namespace"""
+        cache = ChunkSummaryCache(str(tmp_path / "cache.sqlite3"))
+        calls = []
+
+        def run(namespace, cache_namespace=None):
+            map_reduce_summary("One sentence.", lambda c: calls.append(c) or "s", lambda p: "r", chunk_tokens=100,
+                               cache=cache, namespace=namespace, cache_namespace=cache_namespace)
+
+        run("expected-model", cache_namespace=lambda: "served-model")
+        run("expected-model")
+        run("served-model")
+
+        assert len(calls) == 2
+
+
+class TestProcessWithLLM:
+    """Test process_with_LLM picks the summarization mode"""
+
+    def test_long_transcript_uses_map_reduce(self, app, monkeypatch, tmp_path):
+        """Test long transcripts are chunked and reduced into one summary"""
+        prompts = []
+
+        def fake_complete(system_prompt, user_content, max_tokens):
+            prompts.append(system_prompt)
+            return "## Reduced Title ##\n- point" if system_prompt == process_audio.SUMMARY_SYSTEM_PROMPT else "- part"
+
+        monkeypatch.setattr(process_audio, "_complete", fake_complete)
+        monkeypatch.setattr(process_audio, "MAP_REDUCE_THRESHOLD_TOKENS", 100)
+        monkeypatch.setattr(process_audio, "CHUNK_TOKENS", 100)
+        monkeypatch.setattr(process_audio, "get_chunk_cache",
+                            lambda: ChunkSummaryCache(str(tmp_path / "cache.sqlite3")))
+
+        with app.app_context():
+            response = process_audio.process_with_LLM(long_transcript())
+        data = json.loads(response.get_data(as_text=True))
+
+        assert data["summary"].startswith("## Reduced Title")
+        assert prompts.count(process_audio.CHUNK_SYSTEM_PROMPT) > 1
+        assert prompts.count(process_audio.SUMMARY_SYSTEM_PROMPT) == 1
@@ -0,0 +1,104 @@
+"""
+Tests for pluggable transcription backends
+"""
+import pytest
+
+from benchmarks.transcription_bench import time_backend
+from website.resilience import RetryPolicy
+from website.transcription_backends import (
+    LocalWhisperBackend,
+    OpenAIWhisperBackend,
+    TranscriptionBackend,
+    create_backend,
+)
+
+
+class FakeSegment:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, path, beam_size):
+        self.calls.append(path)
+        return iter([FakeSegment(" Hello "), FakeSegment("world. ")]), None
+
+
+class TestBackendSelection:
+    """Test choosing a backend by name"""
+
+    def test_openai_backend(self):
+        """Test the hosted backend is built with the given client"""
+        backend = create_backend("openai", client=object(), policy=RetryPolicy())
+
+        assert isinstance(backend, OpenAIWhisperBackend)
+
+    def test_local_backend_from_env(self, monkeypatch):
+        """Test local backend settings come from env vars"""
+        monkeypatch.setenv("LOCAL_WHISPER_MODEL", "small")
+        monkeypatch.setenv("LOCAL_WHISPER_THREADS", "4")
+
+        backend = create_backend("local")
+
+        assert isinstance(backend, LocalWhisperBackend)
+        assert backend.model_size == "small"
+        assert backend.cpu_threads == 4
+        assert backend.compute_type == "int8"
+
+    def test_unknown_backend(self):
+        """Test an unknown name is rejected"""
+        with pytest.raises(ValueError):
+            create_backend("nope")
+
+    def test_backend_must_transcribe(self):
+        """Test a backend without transcribe() fails when created"""
+        class Incomplete(TranscriptionBackend):
+            name = "incomplete"
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+
+class TestLocalBackend:
+    """Test local model residency and output"""
+
+    def test_model_loaded_once(self):
+        """Test the model is loaded lazily and reused across requests"""
+        loads = []
+
+        def factory(size, compute_type, threads):
+            loads.append((size, compute_type, threads))
+            return FakeModel()
+
+        backend = LocalWhisperBackend(model_factory=factory)
+        assert loads == []
+
+        backend.transcribe("a.webm")
+        backend.transcribe("b.webm")
+
+        assert loads == [("base", "int8", 0)]
+
+    def test_segments_joined(self):
+        """Test segment texts are stripped and joined"""
+        backend = LocalWhisperBackend(model_factory=lambda *args: FakeModel())
+
+        assert backend.transcribe("a.webm") == "Hello world."
+
+
+class TestBenchmark:
+    """Test real-time factor calculation"""
+
+    def test_rtf(self, tmp_path):
+        """Test RTF is processing time over audio duration"""
+        ticks = iter([0.0, 2.0, 10.0, 11.0])
+        backend = LocalWhisperBackend(model_factory=lambda *args: FakeModel())
+        files = [tmp_path / "a.webm", tmp_path / "b.webm"]
+
+        result = time_backend(backend, files, {files[0]: 10.0, files[1]: 4.0},
+                              clock=lambda: next(ticks))
+
+        assert result["mean_latency_s"] == 1.5
+        assert result["rtf"] == pytest.approx((0.2 + 0.25) / 2)
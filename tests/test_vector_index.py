@@ -0,0 +1,248 @@
+"""
+Tests for semantic similarity search over notes
+"""
+import json
+
+import numpy as np
+import pytest
+from flask.testing import FlaskClient
+
+from website import vector_index
+from website.vector_index import Embedder, HashingEmbedder, VectorIndex, kmeans, normalize
+
+
+@pytest.fixture
+def embedder():
+    return HashingEmbedder(dim=64)
+
+
+def random_unit_vectors(count, dim, seed=0):
+    return normalize(np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32))
+
+
+class TestHashingEmbedder:
+    """Test the local stand-in embedder"""
+
+    def test_vectors_are_unit_length(self, embedder):
+        """Test embeddings are L2-normalised float32"""
+        vectors = embedder.embed(["garden tomatoes", "quarterly budget review"])
+
+        assert vectors.dtype == np.float32
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+
+    def test_shared_vocabulary_is_closer(self, embedder):
+        """Test texts sharing words score higher than unrelated ones"""
+        a, b, c = embedder.embed([
+            "plant tomatoes in the garden this weekend",
+            "the garden needs tomatoes planted",
+            "quarterly budget review with finance",
+        ])
+
+        assert a @ b > a @ c
+
+    def test_deterministic(self, embedder):
+        """Test the same text always maps to the same vector"""
+        assert np.array_equal(embedder.embed(["hello"]), HashingEmbedder(dim=64).embed(["hello"]))
+
+    def test_embedder_must_embed(self):
+        """Test an embedder without embed() fails when created"""
+        class Incomplete(Embedder):
+            name = "incomplete"
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+
+class TestVectorIndex:
+    """Test exact and IVF top-k search"""
+
+    def test_exact_top_k(self, tmp_path):
+        """Test brute-force search returns the nearest vectors in order"""
+        index = VectorIndex(str(tmp_path), dim=16)
+        vectors = random_unit_vectors(50, 16)
+        for i, vector in enumerate(vectors):
+            index.add(f"n{i}", vector)
+
+        results = index.search(vectors[7], k=3)
+
+        assert results[0][0] == "n7"
+        assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+        assert results[1][1] >= results[2][1]
+
+    def test_exclude(self, tmp_path):
+        """Test excluded ids are skipped without shortening the result"""
+        index = VectorIndex(str(tmp_path), dim=16)
+        vectors = random_unit_vectors(10, 16)
+        for i, vector in enumerate(vectors):
+            index.add(f"n{i}", vector)
+
+        results = index.search(vectors[0], k=3, exclude=["n0"])
+
+        assert len(results) == 3
+        assert "n0" not in [note_id for note_id, _ in results]
+
+    def test_appends_visible_to_other_instances(self, tmp_path):
+        """Test a second process's index sees rows appended by the first"""
+        writer = VectorIndex(str(tmp_path), dim=8)
+        reader = VectorIndex(str(tmp_path), dim=8)
+        writer.add("a", random_unit_vectors(1, 8)[0])
+        assert len(reader) == 1
+
+        writer.add("b", random_unit_vectors(1, 8, seed=1)[0])
+        assert len(reader) == 2
+        assert reader.vector("b") is not None
+
+    def test_dimension_mismatch_rejected(self, tmp_path):
+        """Test reopening an index with a different embedder dimension fails"""
+        VectorIndex(str(tmp_path), dim=8)
+
+        with pytest.raises(ValueError):
+            VectorIndex(str(tmp_path), dim=16)
+
+    def test_ivf_matches_exact_search(self, tmp_path):
+        """Test IVF search finds the query's own vector and covers new rows"""
+        index = VectorIndex(str(tmp_path), dim=16, ivf_min_vectors=10**9, nprobe=4)
+        vectors = random_unit_vectors(400, 16)
+        for i, vector in enumerate(vectors):
+            index.add(f"n{i}", vector)
+        index.build_ivf()
+        index.add("late", vectors[3])
+
+        results = index.search(vectors[3], k=2)
+
+        assert {note_id for note_id, _ in results} == {"n3", "late"}
+
+    def test_search_within(self, tmp_path):
+        """Test only the allowed ids are scored"""
+        index = VectorIndex(str(tmp_path), dim=16)
+        vectors = random_unit_vectors(10, 16)
+        for i, vector in enumerate(vectors):
+            index.add(f"n{i}", vector)
+
+        results = index.search(vectors[0], k=3, within=["n4", "n5", "gone"])
+
+        assert {note_id for note_id, _ in results} == {"n4", "n5"}
+        assert index.search(vectors[0], k=3, within=[]) == []
+
+    def test_empty_probed_lists(self, tmp_path):
+        """Test probing only empty IVF lists returns no results instead of failing"""
+        index = VectorIndex(str(tmp_path), dim=16, ivf_min_vectors=10**9, nprobe=2)
+        vectors = random_unit_vectors(50, 16)
+        for i, vector in enumerate(vectors):
+            index.add(f"n{i}", vector)
+        index.build_ivf()
+        index.search(vectors[0])
+        index._ivf["offsets"][:] = 0
+
+        assert index.search(vectors[0], k=3) == []
+
+    def test_torn_append_repaired(self, tmp_path):
+        """Test a vector written without its id is cut off before the next append"""
+        index = VectorIndex(str(tmp_path), dim=8)
+        first, second, orphan = random_unit_vectors(3, 8)
+        index.add("a", first)
+        with open(index.vectors_path, "ab") as f:
+            f.write(orphan.tobytes())
+
+        index.add("b", second)
+
+        assert len(index) == 2
+        assert np.allclose(index.vector("b"), second)
+
+    def test_partial_id_repaired_on_open(self, tmp_path):
+        """Test a half-written id and its vector are dropped when the index is opened"""
+        index = VectorIndex(str(tmp_path), dim=8)
+        vectors = random_unit_vectors(2, 8)
+        index.add("a", vectors[0])
+        with open(index.vectors_path, "ab") as f:
+            f.write(vectors[1].tobytes())
+        with open(index.ids_path, "a") as f:
+            f.write("b-half")
+
+        reopened = VectorIndex(str(tmp_path), dim=8)
+
+        assert len(reopened) == 1
+        with open(reopened.ids_path) as f:
+            assert f.read() == "a\n"
+
+    def test_kmeans_assigns_every_vector(self):
+        """Test k-means returns one assignment per vector"""
+        vectors = random_unit_vectors(100, 8)
+
+        centroids, assignment = kmeans(vectors, clusters=5)
+
+        assert centroids.shape == (5, 8)
+        assert len(assignment) == 100
+        assert assignment.max() < 5
+
+
+class TestSimilarityRoutes:
+    """Test the related-notes and semantic search API"""
+
+    def add_note(self, store, index, embedder, transcript, summary, owner):
+        note = store.save(transcript, summary, summary, owner=owner)
+        index.add(note.id, embedder.embed([f"{summary}\n\n{transcript}"])[0])
+        return note
+
+    def test_related_notes(self, client: FlaskClient, isolated_note_store, isolated_vector_index, client_owner):
+        """Test related notes exclude the note itself and rank by similarity"""
+        embedder = HashingEmbedder(dim=64)
+        garden = self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                               "plant tomatoes in the garden", "## Garden ##", client_owner)
+        self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                      "garden tomatoes need water", "## Garden Watering ##", client_owner)
+        self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                      "budget review with finance", "## Budget ##", client_owner)
+
+        response = client.get(f'/api/notes/{garden.id}/related?k=2')
+        data = json.loads(response.get_data(as_text=True))
+
+        assert response.status_code == 200
+        assert [r['title'] for r in data['results']][0] == 'Garden Watering'
+        assert garden.id not in [r['note_id'] for r in data['results']]
+
+    def test_semantic_search(self, client: FlaskClient, isolated_note_store, isolated_vector_index, client_owner):
+        """Test free-text semantic queries return the closest note first"""
+        embedder = HashingEmbedder(dim=64)
+        self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                      "budget review with finance", "## Budget ##", client_owner)
+        self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                      "plant tomatoes in the garden", "## Garden ##", client_owner)
+
+        response = client.get('/api/notes/semantic-search?q=tomatoes+garden')
+        data = json.loads(response.get_data(as_text=True))
+
+        assert data['results'][0]['title'] == 'Garden'
+
+    def test_other_owners_notes_excluded(self, client: FlaskClient, isolated_note_store, isolated_vector_index,
+                                         client_owner):
+        """Test similarity results and related lookups only cover the caller's notes"""
+        embedder = HashingEmbedder(dim=64)
+        mine = self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                             "plant tomatoes in the garden", "## Garden ##", client_owner)
+        theirs = self.add_note(isolated_note_store, isolated_vector_index, embedder,
+                               "garden tomatoes need water", "## Garden Watering ##", "someone-else")
+
+        related = json.loads(client.get(f'/api/notes/{mine.id}/related').get_data(as_text=True))
+        searched = json.loads(client.get('/api/notes/semantic-search?q=garden+tomatoes').get_data(as_text=True))
+
+        assert related['results'] == []
+        assert [r['note_id'] for r in searched['results']] == [mine.id]
+        assert client.get(f'/api/notes/{theirs.id}/related').status_code == 404
+
+    def test_embedder_failure(self, client: FlaskClient, monkeypatch):
+        """Test an embedding API error becomes a JSON error response"""
+        class FailingEmbedder(HashingEmbedder):
+            def embed(self, texts):
+                raise RuntimeError("embeddings unavailable")
+
+        monkeypatch.setattr(vector_index, "_embedder", FailingEmbedder(dim=64))
+
+        response = client.get('/api/notes/semantic-search?q=garden')
+
+        assert response.status_code == 500
+        assert json.loads(response.get_data(as_text=True))['error']
+
+    def test_related_unknown_note(self, client: FlaskClient):
+        """Test related notes for an unknown id returns 404"""
+        assert client.get('/api/notes/nope/related').status_code == 404
@@ -4,6 +4,7 @@ import secrets
 from typing import Dict, Any
 from flask import Flask
 from flask_cors import CORS
+from prometheus_client import Gauge
 from prometheus_flask_exporter import PrometheusMetrics
 from dotenv import load_dotenv
 
@@ -18,6 +19,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Module-level so repeated create_app() calls (e.g. in tests) don't re-register it
+APP_INFO = Gauge('app_info', 'Application info', ['version'])
+
 def create_app() -> Flask:
     app = Flask(__name__)
     
@@ -25,7 +29,7 @@ def create_app() -> Flask:
     metrics = PrometheusMetrics(app)
     
     # Add custom metrics
-    metrics.info('app_info', 'Application info', version='1.0')
+    APP_INFO.labels(version='1.0').set(1)
     
     # Enable CORS for frontend communication - restrict to specific origins
     allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:5005,http://127.0.0.1:5005').split(',')
@@ -45,7 +49,43 @@ def create_app() -> Flask:
     
     # Register blueprints
     from website.views import views
+    from website.admin import admin
     app.register_blueprint(views, url_prefix="/")
+    app.register_blueprint(admin, url_prefix="/admin")
+
+    # Notes belong to the browser (owner cookie) that recorded them
+    from website.owners import install_owner_cookie
+    install_owner_cookie(app)
+
+    # Each worker (after any fork) joins the pod's saturation board on its first request
+    from website.saturation import get_saturation_board
+    app.before_request(lambda: get_saturation_board().join())
+
+    # Reap temp audio that crashed or killed workers left in the scratch directory
+    from website.scratch import get_scratch_space
+    get_scratch_space()
+
+    # Hashed, precompressed static assets with immutable caching; JSON responses compressed
+    from website.assets import install_assets
+    install_assets(app)
+
+    # Rolling latency percentiles for /metrics-dashboard
+    from website.latency import install_latency_recording
+    install_latency_recording(app)
+
+    # Allocation tracing from boot is opt-in (MEMORY_TRACEMALLOC); it slows every allocation
+    from website.memory_profiling import configure_tracemalloc
+    configure_tracemalloc()
+
+    # Per-request profiling hooks are only installed when PROFILE_DIR is set
+    from website.profiling import install_profiling
+    install_profiling(app)
+
+    # Load local transcription models up front; with gunicorn --preload this
+    # happens once in the master and workers share the weights copy-on-write
+    if os.getenv('TRANSCRIPTION_PRELOAD', 'false').lower() == 'true':
+        from website.process_audio import transcription_backend
+        transcription_backend.warm_up()
     
     logger.info("Dicto Flask app created successfully")
     return app
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Admin endpoints for diagnostics
+Disabled (404) unless ADMIN_TOKEN is set; callers send it as a bearer token
+"""
+
+import os
+import secrets
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple
+
+from flask import Blueprint, Response, current_app, jsonify, request, send_file
+
+from .memory_profiling import GROUP_BY, get_snapshot_store
+from .process_audio import backfill_summaries
+from .resilience import circuit_breaker
+
+admin = Blueprint("admin", __name__)
+
+
+def require_admin(func: Callable) -> Callable:
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = os.getenv("ADMIN_TOKEN", "")
+        if not token:
+            return jsonify({"error": "Not found"}), 404
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not secrets.compare_digest(supplied, token):
+            return jsonify({"error": "Unauthorized"}), 401
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@admin.route("/profiles")
+@require_admin
+def list_profiles() -> Response:
+    """Most recent request profiles, newest first"""
+    store = current_app.extensions.get("dicto_profiles")
+    if store is None:
+        return jsonify({"error": "Profiling is not enabled (set PROFILE_DIR)"}), 404
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    return jsonify({"profiles": store.list(limit)})
+
+
+@admin.route("/profiles/<filename>")
+@require_admin
+def download_profile(filename: str) -> Response:
+    """A profile file, for speedscope.app or flamegraph.pl"""
+    store = current_app.extensions.get("dicto_profiles")
+    path = store.path(filename) if store is not None else None
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, download_name=filename)
+
+
+@admin.route("/memory")
+@require_admin
+def memory_status() -> Response:
+    """This worker's RSS, tracemalloc state and held snapshots"""
+    return jsonify(get_snapshot_store().status())
+
+
+@admin.route("/memory/snapshots", methods=["POST"])
+@require_admin
+def take_memory_snapshot() -> Response:
+    """Take a tracemalloc snapshot (starting tracing if needed) and return its top allocations"""
+    group_by, limit = _snapshot_query()
+    if group_by is None:
+        return jsonify({"error": f"group_by must be one of {', '.join(GROUP_BY)}"}), 400
+    store = get_snapshot_store()
+    snapshot_id, snapshot = store.take()
+    return jsonify({"id": snapshot_id, "pid": os.getpid(), "top": store.top(snapshot, group_by, limit)}), 201
+
+
+@admin.route("/memory/snapshots/<int:snapshot_id>/diff")
+@require_admin
+def diff_memory_snapshots(snapshot_id: int) -> Response:
+    """Allocation changes since another snapshot (?base=, default the previous one)"""
+    group_by, limit = _snapshot_query()
+    if group_by is None:
+        return jsonify({"error": f"group_by must be one of {', '.join(GROUP_BY)}"}), 400
+    store = get_snapshot_store()
+    base_id = request.args.get("base", type=int) or store.previous(snapshot_id)
+    snapshot = store.get(snapshot_id)
+    base = store.get(base_id) if base_id is not None else None
+    if snapshot is None or base is None:
+        return jsonify({"error": "Snapshot not found in this worker", "pid": os.getpid()}), 404
+    return jsonify({
+        "id": snapshot_id, "base": base_id, "pid": os.getpid(),
+        "diff": store.diff(snapshot, base, group_by, limit),
+    })
+
+
+@admin.route("/memory/snapshots", methods=["DELETE"])
+@require_admin
+def clear_memory_snapshots() -> Response:
+    """Free held snapshots and stop on-demand tracing"""
+    get_snapshot_store().clear()
+    return jsonify(get_snapshot_store().status())
+
+
+def _snapshot_query() -> Tuple[Optional[str], int]:
+    group_by = request.args.get("group_by", "lineno")
+    limit = min(max(request.args.get("limit", 25, type=int), 1), 500)
+    return (group_by if group_by in GROUP_BY else None), limit
+
+
+@admin.route("/summaries/backfill", methods=["POST"])
+@require_admin
+def backfill_pending_summaries() -> Response:
+    """Summarize up to ?limit= notes saved transcript-only while summarization was down"""
+    if not circuit_breaker("summarization").allows_calls():
+        return jsonify({"error": "Summarization is still unavailable"}), 503
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 200)
+    return jsonify(backfill_summaries(limit))
@@ -0,0 +1,327 @@
+"""
+Admission control for pipeline stages
+Bounded concurrency with a bounded, per-client fair wait queue per stage
+and a fast lane for short recordings; requests whose estimated wait exceeds
+the stage budget are shed with 429 + Retry-After
+"""
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .latency import get_latency_recorder
+from .saturation import get_saturation_board
+
+STAGE_QUEUE_DEPTH = Gauge("dicto_stage_queue_depth", "Requests waiting for a stage slot", ["stage"])
+STAGE_IN_FLIGHT = Gauge("dicto_stage_in_flight", "Requests currently running a stage", ["stage"])
+STAGE_ESTIMATED_WAIT = Gauge(
+    "dicto_stage_estimated_wait_seconds", "Estimated wait for the next request to enter a stage", ["stage"]
+)
+STAGE_WAIT = Histogram(
+    "dicto_stage_wait_seconds", "Time spent queued before entering a stage", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+STAGE_REJECTED = Counter("dicto_stage_rejected_total", "Requests shed by admission control", ["stage", "reason"])
+LANE_QUEUE_DEPTH = Gauge("dicto_stage_lane_queue_depth", "Requests waiting for a stage slot by lane", ["stage", "lane"])
+LANE_WAIT = Histogram(
+    "dicto_stage_lane_wait_seconds", "Time spent queued before entering a stage by lane", ["stage", "lane"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+
+LANES = ("fast", "bulk")
+# Recordings up to this many (estimated) seconds wait in the fast lane
+FAST_LANE_MAX_AUDIO_S = float(os.getenv("FAST_LANE_MAX_AUDIO_S", "120"))
+# Fast lane turns per bulk lane turn when both have requests waiting
+FAST_LANE_WEIGHT = float(os.getenv("FAST_LANE_WEIGHT", "3"))
+# Fair-share weights for particular clients ("batch=0.25,alice=2"); others weigh 1
+CLIENT_WEIGHTS = {
+    client.strip(): float(weight)
+    for client, _, weight in (entry.partition("=") for entry in os.getenv("CLIENT_WEIGHTS", "").split(","))
+    if weight
+}
+
+
+class Overloaded(Exception):
+    """Raised when a stage sheds a request; carries a Retry-After hint in seconds"""
+
+    def __init__(self, stage: str, retry_after: float, reason: str):
+        super().__init__(f"{stage} stage overloaded ({reason})")
+        self.stage = stage
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+@dataclass
+class Job:
+    """Who a pipeline run is for and what it costs, for fair scheduling"""
+
+    client: str = ""
+    cost: float = 1.0
+    weight: float = 1.0
+
+    @classmethod
+    def for_client(cls, client: str, cost: float) -> "Job":
+        return cls(client, cost, CLIENT_WEIGHTS.get(client, 1.0))
+
+
+_current_job: ContextVar[Optional[Job]] = ContextVar("dicto_job", default=None)
+
+
+@contextmanager
+def scheduled_as(job: Job) -> Iterator[None]:
+    """Run stages entered in this block (on this thread) on behalf of job"""
+    token = _current_job.set(job)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+@dataclass(order=True)
+class _Ticket:
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    lane: str = field(compare=False)
+    client: str = field(compare=False)
+    prev_finish: float = field(default=0.0, compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class StageLimiter:
+    """Concurrency limiter with a bounded, fair queue and wait-time budget.
+
+    Waiting requests are split into a fast lane (estimated cost up to
+    fast_lane_max_cost, e.g. short recordings) and a bulk lane. Freed slots
+    go to the lanes in proportion to their weights, so neither starves;
+    within a lane, start-time fair queueing orders requests by virtual
+    finish time, so each client gets a share in proportion to its weight
+    however many requests it has queued. A client may hold at most
+    max_queue_per_client queue places.
+
+    Wait estimates use an EWMA of the stage's service time:
+    (requests served first + 1) / max_concurrent * service time.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        max_concurrent: int,
+        max_queue: int,
+        wait_budget_s: float,
+        initial_service_s: float = 1.0,
+        ewma_alpha: float = 0.2,
+        max_queue_per_client: Optional[int] = None,
+        fast_lane_max_cost: float = 0.0,
+        fast_lane_weight: float = 3.0,
+    ):
+        self.stage = stage
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_queue_per_client = self.max_queue if max_queue_per_client is None else max_queue_per_client
+        self.wait_budget_s = wait_budget_s
+        self.service_s = initial_service_s
+        self.ewma_alpha = ewma_alpha
+        self.fast_lane_max_cost = fast_lane_max_cost
+        self.lane_weights = {"fast": max(fast_lane_weight, 0.01), "bulk": 1.0}
+        self.in_flight = 0
+        self.queued = 0
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._lanes: Dict[str, List[_Ticket]] = {lane: [] for lane in LANES}
+        self._lane_queued = {lane: 0 for lane in LANES}
+        self._lane_pass = {lane: 0.0 for lane in LANES}
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._client_finish: Dict[Tuple[str, str], float] = {}
+        self._client_queued: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls, stage: str, max_concurrent: int, max_queue: int, wait_budget_s: float) -> "StageLimiter":
+        """Read <STAGE>_MAX_CONCURRENT, <STAGE>_MAX_QUEUE, <STAGE>_WAIT_BUDGET_S and
+        <STAGE>_MAX_QUEUE_PER_CLIENT overrides, plus the shared fast lane settings"""
+        prefix = stage.upper()
+        max_queue = int(os.getenv(f"{prefix}_MAX_QUEUE", max_queue))
+        return cls(
+            stage,
+            max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENT", max_concurrent)),
+            max_queue=max_queue,
+            wait_budget_s=float(os.getenv(f"{prefix}_WAIT_BUDGET_S", wait_budget_s)),
+            max_queue_per_client=int(os.getenv(f"{prefix}_MAX_QUEUE_PER_CLIENT", max(1, max_queue // 2))),
+            fast_lane_max_cost=FAST_LANE_MAX_AUDIO_S,
+            fast_lane_weight=FAST_LANE_WEIGHT,
+        )
+
+    def lane_for(self, cost: float) -> str:
+        return "fast" if cost <= self.fast_lane_max_cost else "bulk"
+
+    def estimated_wait(self, ahead: Optional[int] = None) -> float:
+        if ahead is None:
+            ahead = self.queued
+        if self.in_flight + ahead < self.max_concurrent:
+            return 0.0
+        return (ahead + 1) / self.max_concurrent * self.service_s
+
+    def _ahead_of(self, ticket: _Ticket) -> int:
+        """Queued requests that will be served before ticket"""
+        lane = ticket.lane
+        in_lane = sum(1 for other in self._lanes[lane] if not other.cancelled and other < ticket)
+        others = [other for other in LANES if other != lane and self._lane_queued[other]]
+        if not others:
+            return in_lane
+        # Other lanes take their weighted share of the slots in the meantime
+        share = sum(self.lane_weights[other] for other in others) / self.lane_weights[lane]
+        return min(self.queued, in_lane + math.ceil((in_lane + 1) * share))
+
+    def _publish(self) -> None:
+        STAGE_QUEUE_DEPTH.labels(stage=self.stage).set(self.queued)
+        STAGE_IN_FLIGHT.labels(stage=self.stage).set(self.in_flight)
+        STAGE_ESTIMATED_WAIT.labels(stage=self.stage).set(self.estimated_wait())
+        for lane in LANES:
+            LANE_QUEUE_DEPTH.labels(stage=self.stage, lane=lane).set(self._lane_queued[lane])
+        get_saturation_board().update_stage(self.stage, self.in_flight, self.queued)
+
+    def _reject(self, reason: str, retry_after: float) -> Overloaded:
+        STAGE_REJECTED.labels(stage=self.stage, reason=reason).inc()
+        return Overloaded(self.stage, retry_after, reason)
+
+    def _enqueue(self, client: str, cost: float, weight: float) -> _Ticket:
+        lane = self.lane_for(cost)
+        key = (lane, client)
+        prev_finish = self._client_finish.get(key, 0.0)
+        start_tag = max(self._virtual_time[lane], prev_finish)
+        finish_tag = start_tag + max(cost, 0.001) / max(weight, 0.001)
+        self._client_finish[key] = finish_tag
+        ticket = _Ticket(finish_tag, next(self._seq), start_tag, lane, client, prev_finish)
+        if not self._lane_queued[lane]:
+            # A lane that was idle starts level with the others rather than with banked turns
+            busy = [self._lane_pass[other] for other in LANES if self._lane_queued[other]]
+            self._lane_pass[lane] = max([self._lane_pass[lane]] + busy)
+        heapq.heappush(self._lanes[lane], ticket)
+        self._lane_queued[lane] += 1
+        self._client_queued[client] = self._client_queued.get(client, 0) + 1
+        self.queued += 1
+        return ticket
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        self._lane_queued[ticket.lane] -= 1
+        if not self._lane_queued[ticket.lane]:
+            self._lanes[ticket.lane].clear()  # only cancelled tickets are left
+        self._client_queued[ticket.client] -= 1
+        if not self._client_queued[ticket.client]:
+            del self._client_queued[ticket.client]
+        self.queued -= 1
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the next tickets: lanes by weighted turns, clients by finish tag"""
+        while self.in_flight < self.max_concurrent and self.queued:
+            lane = min((lane for lane in LANES if self._lane_queued[lane]), key=lambda lane: self._lane_pass[lane])
+            ticket = heapq.heappop(self._lanes[lane])
+            if ticket.cancelled:
+                continue
+            self._lane_pass[lane] += 1 / self.lane_weights[lane]
+            self._virtual_time[lane] = max(self._virtual_time[lane], ticket.start_tag)
+            self._dequeue(ticket)
+            ticket.granted = True
+            self.in_flight += 1
+        if len(self._client_finish) > 4096:
+            # Tags at or behind virtual time behave exactly like absent ones
+            self._client_finish = {
+                key: tag for key, tag in self._client_finish.items() if tag > self._virtual_time[key[0]]
+            }
+        self._cond.notify_all()
+
+    def acquire(self, client: str = "", cost: float = 1.0, weight: float = 1.0) -> float:
+        """Take a slot or raise Overloaded; returns the time spent queued"""
+        start = time.monotonic()
+        lane = self.lane_for(cost)
+        with self._cond:
+            if self.in_flight < self.max_concurrent and self.queued == 0:
+                self.in_flight += 1
+                self._publish()
+                STAGE_WAIT.labels(stage=self.stage).observe(0.0)
+                LANE_WAIT.labels(stage=self.stage, lane=lane).observe(0.0)
+                return 0.0
+
+            if self.queued >= self.max_queue:
+                raise self._reject("queue_full", self.estimated_wait())
+            if self._client_queued.get(client, 0) >= self.max_queue_per_client:
+                raise self._reject("client_queue_full", self.estimated_wait())
+
+            ticket = self._enqueue(client, cost, weight)
+            estimate = self.estimated_wait(self._ahead_of(ticket))
+            if estimate > self.wait_budget_s:
+                # Never queued, so the client isn't charged for it
+                ticket.cancelled = True
+                self._dequeue(ticket)
+                if self._client_finish.get((ticket.lane, client)) == ticket.finish_tag:
+                    self._client_finish[(ticket.lane, client)] = ticket.prev_finish
+                raise self._reject("wait_budget", estimate)
+            self._publish()
+            try:
+                deadline = start + self.wait_budget_s
+                while not ticket.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        ticket.cancelled = True
+                        self._dequeue(ticket)
+                        raise self._reject("timeout", self.estimated_wait())
+                    self._cond.wait(remaining)
+            finally:
+                self._publish()
+
+        waited = time.monotonic() - start
+        STAGE_WAIT.labels(stage=self.stage).observe(waited)
+        LANE_WAIT.labels(stage=self.stage, lane=lane).observe(waited)
+        return waited
+
+    def release(self, service_s: float) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self.service_s += self.ewma_alpha * (service_s - self.service_s)
+            self._dispatch()
+            self._publish()
+
+    @contextmanager
+    def admit(self, job: Optional[Job] = None) -> Iterator[None]:
+        job = job or Job()
+        self.acquire(job.client, job.cost, job.weight)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+stage_limiters: Dict[str, StageLimiter] = {
+    "decode": StageLimiter.from_env("decode", max_concurrent=2, max_queue=8, wait_budget_s=10.0),
+    "transcription": StageLimiter.from_env("transcription", max_concurrent=8, max_queue=32, wait_budget_s=30.0),
+    "summarization": StageLimiter.from_env("summarization", max_concurrent=8, max_queue=32, wait_budget_s=30.0),
+}
+
+
+def limit_stage(stage: str) -> Callable:
+    """Decorator to run a pipeline stage under its admission limiter, on behalf of the
+    current scheduled_as job, recording its service time"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            limiter = stage_limiters[stage]
+            with limiter.admit(_current_job.get()), get_latency_recorder().measure(f"stage:{stage}"):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,228 @@
+"""
+Static asset pipeline and response compression
+Builds minified, content-hashed copies of the static files with gzip and
+brotli variants next to them, serves those with immutable cache headers,
+and compresses JSON responses for clients that accept it.
+
+Run `python -m website.assets` at image build time; the app builds the
+assets on startup if they are missing or older than their sources
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, List, Optional
+
+from flask import Flask, Response, abort, request, send_file
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip alone is still served
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+MANIFEST_NAME = "manifest.json"
+# Build output, when it lives under the static directory
+SKIP_DIRS = {"dist"}
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".map"}
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Encodings tried in order of preference; brotli only when the module is installed
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")] if brotli else [("gzip", ".gz")]
+
+# Dynamic responses: compress only bodies worth the CPU, at fast settings
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_MIMETYPES = {"application/json"}
+
+
+_CSS_STRING = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')")
+
+
+def minify_css(source: str) -> str:
+    """Strip comments and insignificant whitespace, leaving quoted strings alone"""
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    parts = _CSS_STRING.split(source)
+    for i in range(0, len(parts), 2):
+        code = re.sub(r"\s+", " ", parts[i])
+        code = re.sub(r"\s*([{};,>])\s*", r"\1", code)
+        code = re.sub(r":\s+", ":", code)
+        parts[i] = code.replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def minify_js(source: str) -> str:
+    """Drop indentation, blank lines and whole-line // comments.
+
+    Line breaks are kept, so automatic semicolon insertion is unaffected;
+    lines inside multi-line template literals are copied untouched.
+    """
+    lines: List[str] = []
+    in_template = False
+    for line in source.splitlines():
+        stripped = line.strip()
+        if in_template:
+            lines.append(line)
+        elif stripped and not stripped.startswith("//"):
+            lines.append(stripped)
+        if line.count("`") % 2:
+            in_template = not in_template
+    return "\n".join(lines) + "\n"
+
+
+def minify(path: str, data: bytes) -> bytes:
+    name = os.path.basename(path)
+    if ".min." in name:
+        return data
+    if name.endswith(".css"):
+        return minify_css(data.decode("utf-8")).encode("utf-8")
+    if name.endswith(".js"):
+        return minify_js(data.decode("utf-8")).encode("utf-8")
+    return data
+
+
+def hashed_name(path: str, data: bytes) -> str:
+    """css/style.css -> css/style.<first 12 hex of sha256>.css"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def compress(data: bytes, encoding: str, best: bool = True) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 4)
+    # mtime=0 keeps the build reproducible
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def _sources(static_dir: str) -> List[str]:
+    """Relative paths of every source file under static_dir"""
+    paths = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.relpath(os.path.join(root, d), static_dir) not in SKIP_DIRS)
+        for name in sorted(files):
+            if not name.startswith("."):
+                paths.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+    return paths
+
+
+def build_assets(static_dir: str = STATIC_DIR, out_dir: Optional[str] = None) -> Dict[str, str]:
+    """Write minified, hashed and precompressed assets; returns {source path: hashed path}"""
+    out_dir = out_dir or os.path.join(static_dir, "dist")
+    manifest: Dict[str, str] = {}
+    for path in _sources(static_dir):
+        with open(os.path.join(static_dir, path), "rb") as f:
+            data = minify(path, f.read())
+        target = hashed_name(path, data)
+        manifest[path] = target
+        target_path = os.path.join(out_dir, target)
+        if os.path.exists(target_path):
+            continue  # Same content hash, already built
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        _write(target_path, data)
+        if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+            for encoding, suffix in ENCODINGS:
+                _write(target_path + suffix, compress(data, encoding))
+    _write(os.path.join(out_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def _write(path: str, data: bytes) -> None:
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _is_stale(static_dir: str, out_dir: str) -> bool:
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return True
+    built = os.path.getmtime(manifest_path)
+    return any(os.path.getmtime(os.path.join(static_dir, path)) > built for path in _sources(static_dir))
+
+
+class AssetManifest:
+    """Maps source paths to their hashed build output for templates"""
+
+    def __init__(self, out_dir: str, mapping: Dict[str, str]):
+        self.out_dir = out_dir
+        self.mapping = mapping
+
+    def url(self, path: str, base_path: str = "", fallback: Optional[str] = None) -> str:
+        """The immutable URL of a built asset, else fallback or the plain static URL"""
+        if path in self.mapping:
+            return f"{base_path}/assets/{self.mapping[path]}"
+        return fallback or f"{base_path}/static/{path}"
+
+
+def load_manifest(static_dir: str = STATIC_DIR, out_dir: Optional[str] = None) -> AssetManifest:
+    """The built manifest, building first if the sources changed (or failing over to plain static URLs)"""
+    out_dir = out_dir or os.getenv("ASSET_DIR") or os.path.join(static_dir, "dist")
+    try:
+        if _is_stale(static_dir, out_dir):
+            logger.info(f"Building static assets into {out_dir}")
+            return AssetManifest(out_dir, build_assets(static_dir, out_dir))
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return AssetManifest(out_dir, json.load(f))
+    except OSError as e:
+        # A read-only image without a build step still serves the unhashed files
+        logger.warning(f"Static assets not built ({e}); serving them uncompressed from /static")
+        return AssetManifest(out_dir, {})
+
+
+def _accepted_encodings() -> List[str]:
+    return [encoding for encoding, _ in ENCODINGS if request.accept_encodings[encoding]]
+
+
+def install_assets(app: Flask, static_dir: str = STATIC_DIR) -> AssetManifest:
+    """Serve built assets under /assets, expose asset_url() to templates and compress JSON"""
+    manifest = load_manifest(static_dir)
+    app.extensions["dicto_assets"] = manifest
+
+    @app.context_processor
+    def inject_asset_url() -> Dict[str, object]:
+        return {"asset_url": lambda path, fallback=None: manifest.url(path, app.config.get("BASE_PATH", ""), fallback)}
+
+    @app.route("/assets/<path:filename>")
+    def built_asset(filename: str) -> Response:
+        path = os.path.realpath(os.path.join(manifest.out_dir, filename))
+        if not path.startswith(os.path.realpath(manifest.out_dir) + os.sep) or not os.path.isfile(path):
+            abort(404)
+        suffixes = dict(ENCODINGS)
+        encoding = next((encoding for encoding in _accepted_encodings()
+                         if os.path.exists(path + suffixes[encoding])), None)
+        response = send_file(path + suffixes[encoding] if encoding else path,
+                             mimetype=mimetypes.guess_type(filename)[0], conditional=True)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.after_request(compress_response)
+    return manifest
+
+
+def compress_response(response: Response) -> Response:
+    """gzip/brotli-encode JSON bodies for clients that accept it"""
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+            or "Content-Encoding" in response.headers or not 200 <= response.status_code < 300):
+        return response
+    response.vary.add("Accept-Encoding")
+    encodings = _accepted_encodings()
+    data = response.get_data()
+    if not encodings or len(data) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress(data, encodings[0], best=False))
+    response.headers["Content-Encoding"] = encodings[0]
+    return response
+
+
+if __name__ == "__main__":
+    built = build_assets(STATIC_DIR, os.getenv("ASSET_DIR") or None)
+    for source, target in sorted(built.items()):
+        print(f"{source} -> {target}")
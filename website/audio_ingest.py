@@ -0,0 +1,268 @@
+"""
+Streaming audio ingest
+Sniffs the upload's container from its first bytes, then either stores it
+as-is (when no transform is enabled and the transcription backend accepts
+the format) or pipes it into an ffmpeg decode/time-stretch/encode process
+as it arrives, so upload and processing overlap. The size cap is enforced
+while streaming
+"""
+
+import hashlib
+import itertools
+import os
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Collection, Iterable, Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from .scratch import scratch_path
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 64
+
+DECODE_PEAK_RSS = Histogram(
+    "dicto_decode_peak_rss_bytes", "Peak resident memory of the decoder process per request",
+    buckets=tuple(mib * 1024 * 1024 for mib in (16, 32, 64, 96, 128, 192, 256, 512, 1024)),
+)
+INGESTED = Counter("dicto_ingest_total", "Uploads ingested by detected format and path", ["format", "path"])
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the streaming size cap"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class EmptyUpload(Exception):
+    """The request carried no audio"""
+
+
+class UnsupportedFormat(Exception):
+    """The upload is not a recognised audio container"""
+
+
+class TranscodeError(Exception):
+    """ffmpeg could not decode or encode the upload"""
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str
+    extension: str
+    demuxer: str
+    # MP4-family demuxers seek to the index, which may sit at the end of the file
+    needs_seek: bool = False
+
+
+FORMATS = {
+    "webm": AudioFormat("webm", ".webm", "matroska"),
+    "mkv": AudioFormat("mkv", ".mkv", "matroska"),
+    "ogg": AudioFormat("ogg", ".ogg", "ogg"),
+    "wav": AudioFormat("wav", ".wav", "wav"),
+    "flac": AudioFormat("flac", ".flac", "flac"),
+    "mp3": AudioFormat("mp3", ".mp3", "mp3"),
+    "aac": AudioFormat("aac", ".aac", "aac"),
+    "amr": AudioFormat("amr", ".amr", "amr"),
+    "m4a": AudioFormat("m4a", ".m4a", "mov", needs_seek=True),
+    "mp4": AudioFormat("mp4", ".mp4", "mov", needs_seek=True),
+    "caf": AudioFormat("caf", ".caf", "caf", needs_seek=True),
+}
+
+
+def sniff_format(head: bytes) -> Optional[AudioFormat]:
+    """Identify the container from its leading bytes"""
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return FORMATS["webm"] if b"webm" in head[:SNIFF_BYTES] else FORMATS["mkv"]
+    if head.startswith(b"OggS"):
+        return FORMATS["ogg"]
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return FORMATS["wav"]
+    if head.startswith(b"fLaC"):
+        return FORMATS["flac"]
+    if head.startswith(b"ID3"):
+        return FORMATS["mp3"]
+    if head.startswith(b"#!AMR"):
+        return FORMATS["amr"]
+    if head.startswith(b"caff"):
+        return FORMATS["caf"]
+    if head[4:8] == b"ftyp":
+        return FORMATS["m4a"] if head[8:12] in (b"M4A ", b"M4B ") else FORMATS["mp4"]
+    if len(head) >= 2 and head[0] == 0xFF:
+        if head[1] & 0xF6 == 0xF0:  # ADTS sync with layer bits 00
+            return FORMATS["aac"]
+        if head[1] & 0xE0 == 0xE0:  # MPEG audio frame sync
+            return FORMATS["mp3"]
+    return None
+
+
+@dataclass
+class TranscodeStats:
+    sha256: str
+    bytes_read: int
+    peak_rss_bytes: int
+
+
+@dataclass
+class IngestResult:
+    path: str
+    sha256: str
+    bytes_read: int
+    peak_rss_bytes: int = 0
+    format: str = ""
+    transcoded: bool = True
+
+
+def ffmpeg_command(output_path: str, speed: float = 1.5, input_path: str = "pipe:0",
+                   input_format: Optional[str] = None) -> List[str]:
+    """Decode the input, time-stretch it (pitch preserved) when speed != 1 and encode to Opus/WebM"""
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    if input_format:
+        command += ["-f", input_format]
+    command += ["-i", input_path, "-vn"]
+    if speed != 1.0:
+        command += ["-filter:a", f"atempo={speed}"]
+    return command + ["-c:a", "libopus", "-b:a", "32k", "-f", "webm", output_path]
+
+
+def read_chunks(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _capped(chunks: Iterable[bytes], max_bytes: int, digest: Any) -> Iterator[bytes]:
+    received = 0
+    for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        digest.update(chunk)
+        yield chunk
+
+
+def copy_to_file(chunks: Iterable[bytes], path: str, max_bytes: int) -> TranscodeStats:
+    """Write chunks to path unchanged, hashing and enforcing the cap on the way"""
+    digest = hashlib.sha256()
+    received = 0
+    with open(path, "wb") as f:
+        for chunk in _capped(chunks, max_bytes, digest):
+            f.write(chunk)
+            received += len(chunk)
+    return TranscodeStats(sha256=digest.hexdigest(), bytes_read=received, peak_rss_bytes=0)
+
+
+def stream_transcode(chunks: Iterable[bytes], command: List[str], max_bytes: int) -> TranscodeStats:
+    """Feed chunks to `command` on stdin as they arrive.
+
+    Raises UploadTooLarge as soon as more than max_bytes have arrived, and
+    TranscodeError if the process fails. stderr is drained on a thread so a
+    chatty decoder can never block on a full pipe while we write stdin.
+    Neither the upload nor the decoded audio is ever held whole in memory.
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    stderr_parts: List[bytes] = []
+    drain = threading.Thread(target=lambda: stderr_parts.append(process.stderr.read()), daemon=True)
+    drain.start()
+
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        for chunk in _capped(chunks, max_bytes, digest):
+            received += len(chunk)
+            try:
+                process.stdin.write(chunk)
+            except BrokenPipeError:
+                # The decoder gave up early; its exit status and stderr say why
+                break
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        # wait4 rather than wait() to get the decoder's own peak RSS
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = returncode = os.waitstatus_to_exitcode(status)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        drain.join()
+
+    if returncode != 0:
+        message = b"".join(stderr_parts).decode("utf-8", "replace").strip()
+        raise TranscodeError(message or f"Decoder exited with status {returncode}")
+    # ru_maxrss is in KiB on Linux
+    peak_rss_bytes = usage.ru_maxrss * 1024
+    DECODE_PEAK_RSS.observe(peak_rss_bytes)
+    return TranscodeStats(sha256=digest.hexdigest(), bytes_read=received, peak_rss_bytes=peak_rss_bytes)
+
+
+def _sniff(chunks: Iterator[bytes]) -> Tuple[AudioFormat, Iterator[bytes]]:
+    """Read far enough into the stream to identify it; returns the format and all chunks"""
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= SNIFF_BYTES:
+            break
+    if not head:
+        raise EmptyUpload("No audio received")
+    audio_format = sniff_format(head)
+    if audio_format is None:
+        raise UnsupportedFormat("Unrecognised audio format")
+    return audio_format, itertools.chain([head], chunks)
+
+
+def ingest(stream: BinaryIO, max_bytes: int, speed: float = 1.5,
+           accepted_formats: Optional[Collection[str]] = None,
+           passthrough_max_bytes: Optional[int] = None) -> IngestResult:
+    """Store an upload in a temp file the caller must delete, transcoding only if needed.
+
+    The upload passes through untouched when no transform is enabled
+    (speed == 1), the backend accepts its format (None means any) and it is
+    within passthrough_max_bytes. Otherwise it is streamed into ffmpeg; MP4
+    family containers are spooled to disk first because their index may
+    come last.
+    """
+    audio_format, chunks = _sniff(read_chunks(stream))
+    passthrough = speed == 1.0 and (accepted_formats is None or audio_format.name in accepted_formats)
+
+    if passthrough or audio_format.needs_seek:
+        source_path = scratch_path(audio_format.extension)
+        try:
+            spooled = copy_to_file(chunks, source_path, max_bytes)
+        except BaseException:
+            os.unlink(source_path)
+            raise
+        if passthrough and (passthrough_max_bytes is None or spooled.bytes_read <= passthrough_max_bytes):
+            INGESTED.labels(format=audio_format.name, path="passthrough").inc()
+            return IngestResult(path=source_path, sha256=spooled.sha256, bytes_read=spooled.bytes_read,
+                                format=audio_format.name, transcoded=False)
+        try:
+            return _transcode(iter(()), audio_format, speed, max_bytes, source_path, spooled)
+        finally:
+            os.unlink(source_path)
+
+    return _transcode(chunks, audio_format, speed, max_bytes)
+
+
+def _transcode(chunks: Iterable[bytes], audio_format: AudioFormat, speed: float, max_bytes: int,
+               source_path: Optional[str] = None, spooled: Optional[TranscodeStats] = None) -> IngestResult:
+    output_path = scratch_path(".webm")
+    command = ffmpeg_command(output_path, speed, input_path=source_path or "pipe:0",
+                             input_format=audio_format.demuxer)
+    try:
+        stats = stream_transcode(chunks, command, max_bytes)
+    except BaseException:
+        os.unlink(output_path)
+        raise
+    INGESTED.labels(format=audio_format.name, path="transcode").inc()
+    source = spooled or stats
+    return IngestResult(path=output_path, sha256=source.sha256, bytes_read=source.bytes_read,
+                        peak_rss_bytes=stats.peak_rss_bytes, format=audio_format.name)
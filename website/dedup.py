@@ -0,0 +1,166 @@
+"""
+Single-flight deduplication for process-audio
+Requests are keyed by Idempotency-Key or audio content hash; concurrent
+duplicates across workers wait on one computation through a shared SQLite
+table and replay its stored response
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from prometheus_client import Counter
+
+DEDUP_REQUESTS = Counter(
+    "dicto_dedup_requests_total", "process-audio requests by single-flight outcome", ["outcome"]
+)
+
+
+class IdempotencyConflict(Exception):
+    """The Idempotency-Key was already used for a different recording"""
+
+
+class FlightTimeout(Exception):
+    """Gave up waiting for a duplicate request's computation to finish"""
+
+
+@dataclass
+class StoredResponse:
+    status: int
+    body: str
+    # Replay window instead of the flight's result_ttl_s, e.g. shorter for provisional results
+    ttl_s: Optional[float] = None
+
+
+def content_key(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+class SingleFlight:
+    """Cross-process single-flight with a result cache.
+
+    The first request for a key becomes the owner and holds a lease; others
+    poll until it stores a response or releases the key. A lease that runs
+    out (e.g. the owning worker was killed) lets a waiter take over.
+    """
+
+    def __init__(self, db_path: str, lease_s: float = 300.0, result_ttl_s: float = 600.0,
+                 poll_interval_s: float = 0.25, clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.db_path = db_path
+        self.lease_s = lease_s
+        self.result_ttl_s = result_ttl_s
+        self.poll_interval_s = poll_interval_s
+        self.clock = clock
+        self.sleep = sleep
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS flights ("
+            " key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, state TEXT NOT NULL,"
+            " expires REAL NOT NULL, status INTEGER, body TEXT)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """Returns ("owner", None), ("wait", None) or ("done", response)"""
+        conn = self._connect()
+        now = self.clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM flights WHERE expires < ?", (now,))
+            row = conn.execute(
+                "SELECT fingerprint, state, status, body FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO flights (key, fingerprint, state, expires) VALUES (?, ?, 'running', ?)",
+                    (key, fingerprint, now + self.lease_s),
+                )
+                conn.execute("COMMIT")
+                return "owner", None
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+        stored_fingerprint, state, status, body = row
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyConflict(key)
+        if state == "done":
+            return "done", StoredResponse(status, body)
+        return "wait", None
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        ttl_s = self.result_ttl_s if response.ttl_s is None else response.ttl_s
+        self._connect().execute(
+            "UPDATE flights SET state = 'done', status = ?, body = ?, expires = ? WHERE key = ?",
+            (response.status, response.body, self.clock() + ttl_s, key),
+        )
+
+    def release(self, key: str) -> None:
+        """Drop a failed flight so the next request for the key runs again"""
+        self._connect().execute("DELETE FROM flights WHERE key = ? AND state = 'running'", (key,))
+
+    def run(self, key: str, fingerprint: str, compute: Callable[[], StoredResponse],
+            wait_timeout_s: float) -> Tuple[StoredResponse, str]:
+        """Run compute() once per key; returns (response, outcome)"""
+        deadline = self.clock() + wait_timeout_s
+        joined = False
+        while True:
+            try:
+                state, stored = self.claim(key, fingerprint)
+            except IdempotencyConflict:
+                DEDUP_REQUESTS.labels(outcome="conflict").inc()
+                raise
+            if state == "done":
+                outcome = "joined" if joined else "replayed"
+                DEDUP_REQUESTS.labels(outcome=outcome).inc()
+                return stored, outcome
+            if state == "owner":
+                break
+            joined = True
+            if self.clock() >= deadline:
+                DEDUP_REQUESTS.labels(outcome="timeout").inc()
+                raise FlightTimeout(key)
+            self.sleep(self.poll_interval_s)
+
+        try:
+            response = compute()
+        except BaseException:
+            self.release(key)
+            raise
+        # Only successes are shared; errors are left for the next attempt to retry
+        if 200 <= response.status < 300:
+            self.complete(key, response)
+        else:
+            self.release(key)
+        DEDUP_REQUESTS.labels(outcome="owner").inc()
+        return response, "owner"
+
+
+_flight: Optional[SingleFlight] = None
+_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    global _flight
+    with _flight_lock:
+        if _flight is None:
+            _flight = SingleFlight(
+                os.getenv("DEDUP_DB", os.path.join(tempfile.gettempdir(), "dicto_dedup.sqlite3")),
+                lease_s=float(os.getenv("DEDUP_LEASE_S", "300")),
+                result_ttl_s=float(os.getenv("DEDUP_RESULT_TTL_S", "600")),
+            )
+        return _flight
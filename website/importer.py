@@ -0,0 +1,262 @@
+"""
+Batch transcription and bulk import
+Runs archived recordings through the decode -> transcribe -> summarize
+pipeline outside Flask, with separate concurrency for the CPU (decode) and
+API (transcribe, summarize) stages, a resumable manifest and live throughput
+
+    python -m website.importer ~/Recordings "~/Voice Memos/**/*.m4a" \\
+        --decode-workers 4 --api-workers 8 --manifest import.manifest.jsonl [--jsonl out.jsonl]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .admission import Overloaded
+from .audio_ingest import SNIFF_BYTES, AudioFormat, IngestResult, sniff_format
+from .owners import owned_by, owner_key
+
+logger = logging.getLogger(__name__)
+
+
+def expand_paths(patterns: Sequence[str]) -> List[Path]:
+    """Files, directories and glob patterns (** recurses) to concrete paths"""
+    paths: List[Path] = []
+    for pattern in patterns:
+        pattern = os.path.expanduser(pattern)
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        paths.extend(Path(match) for match in sorted(matches))
+    return paths
+
+
+def find_recordings(paths: Sequence[Path]) -> Iterator[Tuple[Path, AudioFormat]]:
+    """Audio files under the given files/directories, identified by their content"""
+    for root in paths:
+        candidates = sorted(p for p in root.rglob("*") if p.is_file()) if root.is_dir() else [root]
+        for path in candidates:
+            if path.name.startswith("."):
+                continue
+            with open(path, "rb") as f:
+                audio_format = sniff_format(f.read(SNIFF_BYTES))
+            if audio_format is not None:
+                yield path, audio_format
+
+
+def recording_key(path: Path) -> str:
+    """Identity used by the manifest: a file that changes is processed again"""
+    stat = path.stat()
+    return f"{path.resolve()}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class Manifest:
+    """Append-only JSONL record of finished files, so a rerun resumes after a crash"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done: Set[str] = set()
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if entry.get("status") == "done":
+                        self.done.add(entry["key"])
+        self._file = open(path, "a")
+
+    def record(self, key: str, status: str, **fields: Any) -> None:
+        with self._lock:
+            self._file.write(json.dumps({"key": key, "status": status, "ts": time.time(), **fields}) + "\n")
+            self._file.flush()
+            if status == "done":
+                self.done.add(key)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Progress:
+    """Live files/min and audio throughput on one status line"""
+
+    def __init__(self, total: int, out: IO[str] = sys.stderr, clock: Callable[[], float] = time.monotonic):
+        self.total = total
+        self.out = out
+        self.clock = clock
+        self.start = clock()
+        self.done = 0
+        self.failed = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def update(self, ok: bool, nbytes: int = 0) -> None:
+        with self._lock:
+            self.done += 1
+            self.failed += 0 if ok else 1
+            self.bytes += nbytes
+            self.out.write("\r" + self.line())
+            self.out.flush()
+
+    def line(self) -> str:
+        elapsed = max(self.clock() - self.start, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0.0
+        return (
+            f"{self.done}/{self.total} files ({self.failed} failed) | "
+            f"{rate * 60:.1f} files/min | {self.bytes / elapsed / 1e6:.2f} MB/s | "
+            f"elapsed {elapsed:.0f}s | eta {eta:.0f}s"
+        )
+
+
+@dataclass
+class Pipeline:
+    """The stages a batch runs; defaults to the app's own functions"""
+
+    prepare: Callable[[IO[bytes]], IngestResult]
+    transcribe: Callable[[str], str]
+    summarize: Callable[..., Dict[str, Any]]
+
+    @classmethod
+    def default(cls) -> "Pipeline":
+        from .process_audio import prepare_audio, summarize_transcript, transcribe
+
+        return cls(prepare=prepare_audio, transcribe=transcribe, summarize=summarize_transcript)
+
+
+def _retry_overloaded(fn: Callable[[], Any], attempts: int = 10) -> Any:
+    """Admission limits are sized for web traffic; a batch waits instead of failing"""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Overloaded as e:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(e.retry_after)
+
+
+def run_batch(
+    recordings: Sequence[Path],
+    pipeline: Pipeline,
+    manifest: Manifest,
+    decode_workers: int = 2,
+    api_workers: int = 8,
+    jsonl: Optional[IO[str]] = None,
+    progress: Optional[Progress] = None,
+    owner: str = "",
+) -> Tuple[int, int]:
+    """Process recordings not yet in the manifest; returns (succeeded, failed).
+
+    Decoding runs on its own pool and feeds the API pool; at most two
+    decoded files per API worker wait at a time, so decoding never races
+    far ahead and fills the disk.
+    """
+    pending = [path for path in recordings if recording_key(path) not in manifest.done]
+    progress = progress or Progress(len(pending))
+    ready = threading.BoundedSemaphore(max(1, api_workers) * 2)
+    output_lock = threading.Lock()
+    counts = {"ok": 0, "failed": 0}
+
+    def finish(path: Path, key: str, ok: bool, nbytes: int, **fields: Any) -> None:
+        manifest.record(key, "done" if ok else "failed", path=str(path), **fields)
+        with output_lock:
+            counts["ok" if ok else "failed"] += 1
+        progress.update(ok, nbytes)
+
+    def api_stage(path: Path, key: str, prepared: IngestResult) -> None:
+        try:
+            transcript = _retry_overloaded(lambda: pipeline.transcribe(prepared.path))
+            metadata = {"source": path.name, "recorded": path.stat().st_mtime}
+            with owned_by(owner):
+                result = _retry_overloaded(
+                    lambda: pipeline.summarize(transcript, metadata=metadata, store=jsonl is None)
+                )
+            if jsonl is not None:
+                with output_lock:
+                    jsonl.write(json.dumps({"path": str(path), **metadata, **result}) + "\n")
+                    jsonl.flush()
+            finish(path, key, True, prepared.bytes_read, note_id=result.get("note_id"))
+        except Exception as e:
+            logger.error(f"Failed to process {path}: {str(e)}")
+            finish(path, key, False, prepared.bytes_read, error=str(e))
+        finally:
+            if os.path.exists(prepared.path):
+                os.unlink(prepared.path)
+            ready.release()
+
+    with ThreadPoolExecutor(max_workers=max(1, api_workers)) as api_pool, \
+            ThreadPoolExecutor(max_workers=max(1, decode_workers)) as decode_pool:
+
+        def decode_stage(path: Path) -> None:
+            key = recording_key(path)
+            ready.acquire()
+            try:
+                with open(path, "rb") as f:
+                    prepared = _retry_overloaded(lambda: pipeline.prepare(f))
+            except Exception as e:
+                ready.release()
+                logger.error(f"Failed to decode {path}: {str(e)}")
+                finish(path, key, False, 0, error=str(e))
+                return
+            api_pool.submit(api_stage, path, key, prepared)
+
+        decodes: List[Future] = [decode_pool.submit(decode_stage, path) for path in pending]
+        for future in decodes:
+            future.result()
+
+    return counts["ok"], counts["failed"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Transcribe and summarize archived recordings in bulk")
+    parser.add_argument("paths", nargs="+", help="Files, directories or glob patterns")
+    parser.add_argument("--decode-workers", type=int, default=os.cpu_count() or 2,
+                        help="Concurrent decodes (CPU bound)")
+    parser.add_argument("--api-workers", type=int, default=8,
+                        help="Concurrent transcription/summarization calls")
+    parser.add_argument("--manifest", type=Path, default=Path("import.manifest.jsonl"),
+                        help="Progress file; rerun with the same one to resume")
+    parser.add_argument("--jsonl", type=Path, help="Append results here instead of the note store")
+    parser.add_argument("--owner", default="",
+                        help="Owner token (a browser's dicto_owner cookie) whose notes the imports become")
+    parser.add_argument("--dry-run", action="store_true", help="List the recordings found and stop")
+    args = parser.parse_args(argv)
+
+    recordings = list(find_recordings(expand_paths(args.paths)))
+    print(f"Found {len(recordings)} recordings")
+    if args.dry_run:
+        for path, audio_format in recordings:
+            print(f"{audio_format.name}\t{path}")
+        return 0
+
+    manifest = Manifest(args.manifest)
+    skipped = sum(1 for path, _ in recordings if recording_key(path) in manifest.done)
+    if skipped:
+        print(f"Resuming: {skipped} already done according to {args.manifest}")
+
+    jsonl = open(args.jsonl, "a") if args.jsonl else None
+    try:
+        succeeded, failed = run_batch(
+            [path for path, _ in recordings], Pipeline.default(), manifest,
+            decode_workers=args.decode_workers, api_workers=args.api_workers, jsonl=jsonl,
+            owner=owner_key(args.owner) if args.owner else "",
+        )
+    finally:
+        manifest.close()
+        if jsonl is not None:
+            jsonl.close()
+    print(f"\nProcessed {succeeded}, failed {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Rolling latency percentiles without Prometheus
+Each worker records stage and endpoint latencies into fixed-size log-linear
+(HDR-style) histograms over a ring of time slots, and flushes them to a
+per-worker sidecar file; the dashboard merges every worker's file on the pod
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from flask import Flask, Response, g, request
+
+logger = logging.getLogger(__name__)
+
+# 32 linear sub-buckets per power of two: every value is within ~3% of its bucket
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Microsecond resolution up to 2^32 us (~71 minutes); anything longer lands in the last bucket
+MAX_MICROS = (1 << 32) - 1
+BUCKET_COUNT = (MAX_MICROS.bit_length() - SUB_BUCKET_BITS - 1) * SUB_BUCKETS + 2 * SUB_BUCKETS
+PERCENTILES = (50, 95, 99)
+
+
+def bucket_index(micros: int) -> int:
+    micros = min(max(micros, 0), MAX_MICROS)
+    shift = max(0, micros.bit_length() - SUB_BUCKET_BITS - 1)
+    return shift * SUB_BUCKETS + (micros >> shift)
+
+
+def bucket_value(index: int) -> float:
+    """Midpoint of a bucket, in microseconds"""
+    shift = max(0, index // SUB_BUCKETS - 1)
+    top = index - shift * SUB_BUCKETS
+    return ((top << shift) + ((top + 1) << shift) - 1) / 2
+
+
+def percentile(counts: Dict[int, int], total: int, pct: float) -> float:
+    """Value at or below which pct% of recorded latencies fall, in seconds"""
+    if not total:
+        return 0.0
+    rank = max(1, round(total * pct / 100))
+    seen = 0
+    for index in sorted(counts):
+        seen += counts[index]
+        if seen >= rank:
+            return bucket_value(index) / 1e6
+    return bucket_value(max(counts)) / 1e6
+
+
+class _Series:
+    """A ring of per-slot histograms for one stage or endpoint"""
+
+    def __init__(self, slots: int):
+        self.epochs = [-1] * slots
+        self.totals = [0] * slots
+        self.errors = [0] * slots
+        # Sparse, but never more than BUCKET_COUNT entries per slot
+        self.counts: List[Dict[int, int]] = [{} for _ in range(slots)]
+
+    def record(self, slot_no: int, index: int, error: bool) -> None:
+        i = slot_no % len(self.epochs)
+        if self.epochs[i] != slot_no:
+            self.epochs[i] = slot_no
+            self.totals[i] = self.errors[i] = 0
+            self.counts[i] = {}
+        self.totals[i] += 1
+        self.errors[i] += 1 if error else 0
+        self.counts[i][index] = self.counts[i].get(index, 0) + 1
+
+    def export(self, oldest_slot: int) -> List[List[Any]]:
+        return [
+            [slot_no, self.totals[i], self.errors[i], self.counts[i].copy()]
+            for i, slot_no in enumerate(self.epochs) if slot_no >= oldest_slot and self.totals[i]
+        ]
+
+
+class LatencyRecorder:
+    """Fixed-memory rolling latency histograms for this worker, shared through a sidecar file.
+
+    Memory is bounded by max_series x slots x BUCKET_COUNT counters. The
+    file is rewritten (atomically) at most every flush_interval_s by a
+    background thread, so recording is a few integer increments.
+    """
+
+    def __init__(self, directory: str, window_s: float = 60.0, slot_s: float = 5.0, max_series: int = 64,
+                 flush_interval_s: float = 1.0, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.slot_s = slot_s
+        self.slots = max(1, int(window_s // slot_s))
+        self.window_s = self.slots * slot_s
+        self.max_series = max_series
+        self.flush_interval_s = flush_interval_s
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+        os.makedirs(directory, exist_ok=True)
+
+    def _reset(self) -> None:
+        self.pid = os.getpid()
+        self._series: Dict[str, _Series] = {}
+        self._dirty = False
+        self._flusher: Optional[threading.Thread] = None
+        self._dropped_warned = False
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.pid}.json")
+
+    def record(self, series: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            if os.getpid() != self.pid:
+                self._reset()  # forked worker: the parent's samples aren't ours
+            if series not in self._series:
+                if len(self._series) >= self.max_series:
+                    if not self._dropped_warned:
+                        logger.warning(f"Latency series limit ({self.max_series}) reached; not recording {series}")
+                        self._dropped_warned = True
+                    return
+                self._series[series] = _Series(self.slots)
+            slot_no = int(self.clock() // self.slot_s)
+            self._series[series].record(slot_no, bucket_index(int(seconds * 1e6)), error)
+            self._dirty = True
+            if self._flusher is None and self.flush_interval_s > 0:
+                self._flusher = threading.Thread(target=self._flush_loop, name="dicto-latency", daemon=True)
+                self._flusher.start()
+
+    @contextmanager
+    def measure(self, series: str) -> Iterator[None]:
+        """Record the block's duration; an exception counts as an error"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(series, time.perf_counter() - start, error=True)
+            raise
+        self.record(series, time.perf_counter() - start)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            now = self.clock()
+            with self._lock:
+                oldest_slot = int(now // self.slot_s) - self.slots + 1
+                data = {
+                    "pid": self.pid, "written": now, "slot_s": self.slot_s,
+                    "series": {name: series.export(oldest_slot) for name, series in self._series.items()},
+                }
+                self._dirty = False
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval_s)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError as e:
+                    logger.error(f"Failed to write latency sidecar: {str(e)}")
+
+    def summary(self) -> Dict[str, Any]:
+        """Percentiles, throughput and error rate per series over the window, across all workers"""
+        if self._dirty:
+            self.flush()
+        now = self.clock()
+        oldest_slot = int(now // self.slot_s) - self.slots + 1
+        merged: Dict[str, Dict[str, Any]] = {}
+        workers = 0
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # replaced mid-read; its next version will be read next time
+            if data["written"] < now - 2 * self.window_s:
+                _remove_stale(path)  # a worker that is gone
+                continue
+            workers += 1
+            for name, slots in data["series"].items():
+                entry = merged.setdefault(name, {"total": 0, "errors": 0, "counts": {}, "first_slot": None})
+                for slot_no, total, errors, counts in slots:
+                    if slot_no < oldest_slot:
+                        continue
+                    entry["total"] += total
+                    entry["errors"] += errors
+                    entry["first_slot"] = min(slot_no, entry["first_slot"] or slot_no)
+                    for index, count in counts.items():
+                        entry["counts"][int(index)] = entry["counts"].get(int(index), 0) + count
+
+        series = {}
+        for name, entry in sorted(merged.items()):
+            if not entry["total"]:
+                continue
+            # A series that started recording mid-window is rated over the time it has existed
+            span = min(self.window_s, max(self.slot_s, now - entry["first_slot"] * self.slot_s))
+            series[name] = {
+                "count": entry["total"],
+                "throughput_per_s": round(entry["total"] / span, 3),
+                "error_rate": round(entry["errors"] / entry["total"], 4),
+                **{f"p{pct}_s": round(percentile(entry["counts"], entry["total"], pct), 4) for pct in PERCENTILES},
+                "max_s": round(bucket_value(max(entry["counts"])) / 1e6, 4),
+            }
+        return {"window_s": self.window_s, "workers": workers, "series": series}
+
+
+def _remove_stale(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def install_latency_recording(app: Flask) -> None:
+    """Record every request's latency under endpoint:<endpoint>; 5xx and exceptions are errors"""
+
+    @app.before_request
+    def start_latency() -> None:
+        g.latency_start = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response: Response) -> Response:
+        start = g.pop("latency_start", None)
+        if start is not None and request.endpoint not in (None, "static", "views.latency_summary"):
+            get_latency_recorder().record(
+                f"endpoint:{request.endpoint}", time.perf_counter() - start, error=response.status_code >= 500
+            )
+        return response
+
+    @app.teardown_request
+    def record_failed_latency(exc: Optional[BaseException]) -> None:
+        # Only still set when an exception skipped after_request
+        start = g.pop("latency_start", None)
+        if start is not None and request.endpoint is not None:
+            get_latency_recorder().record(f"endpoint:{request.endpoint}", time.perf_counter() - start, error=True)
+
+
+_recorder: Optional[LatencyRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_latency_recorder() -> LatencyRecorder:
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = LatencyRecorder(
+                os.getenv("LATENCY_DIR", os.path.join(tempfile.gettempdir(), "dicto_latency")),
+                window_s=float(os.getenv("LATENCY_WINDOW_S", "60")),
+                slot_s=float(os.getenv("LATENCY_SLOT_S", "5")),
+                max_series=int(os.getenv("LATENCY_MAX_SERIES", "64")),
+            )
+        return _recorder
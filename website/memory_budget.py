@@ -0,0 +1,140 @@
+"""
+Per-pod memory budget for audio decoding
+Each decode reserves its estimated memory from a budget shared by all
+workers through SQLite; decodes that don't fit wait briefly, then are shed
+"""
+
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from prometheus_client import Counter, Gauge
+
+from .admission import Overloaded
+
+DECODE_MEMORY_RESERVED = Gauge(
+    "dicto_decode_memory_reserved_bytes", "Decode memory reserved on this pod (as last seen by this worker)"
+)
+DECODE_MEMORY_REJECTED = Counter(
+    "dicto_decode_memory_rejected_total", "Decodes shed because the pod memory budget was exhausted"
+)
+
+MIB = 1024 * 1024
+# ffmpeg process, codec state and pipe buffers, whatever the recording length
+DECODE_BASE_BYTES = 48 * MIB
+# Uncompressed PCM is ~10-50x the compressed upload; 16 kHz mono s16 from
+# 32 kbps Opus is 8x, 44.1 kHz stereo from 128 kbps AAC ~11x
+DECODED_EXPANSION = 11
+# Frame-based decoding never holds more than a bounded window of PCM
+DECODE_WINDOW_BYTES = 32 * MIB
+
+
+def estimate_decode_memory(input_bytes: Optional[int]) -> int:
+    """Peak memory for one streaming decode of an upload of input_bytes (None if unknown)"""
+    if input_bytes is None:
+        return DECODE_BASE_BYTES + DECODE_WINDOW_BYTES
+    return DECODE_BASE_BYTES + min(input_bytes * DECODED_EXPANSION, DECODE_WINDOW_BYTES)
+
+
+class MemoryBudget:
+    """Byte reservations against a fixed capacity, shared across processes.
+
+    Reservations carry a lease so memory held by a killed worker is
+    reclaimed. A single request larger than the whole budget is admitted
+    only when nothing else is reserved, so it can't starve forever.
+    """
+
+    def __init__(self, db_path: str, capacity_bytes: int, wait_budget_s: float = 10.0,
+                 lease_s: float = 600.0, poll_interval_s: float = 0.1,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.db_path = db_path
+        self.capacity_bytes = capacity_bytes
+        self.wait_budget_s = wait_budget_s
+        self.lease_s = lease_s
+        self.poll_interval_s = poll_interval_s
+        self.clock = clock
+        self.sleep = sleep
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS reservations ("
+            " id TEXT PRIMARY KEY, bytes INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def reserved(self) -> int:
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM reservations WHERE expires >= ?", (self.clock(),)
+        ).fetchone()
+        return row[0]
+
+    def try_reserve(self, nbytes: int) -> Optional[str]:
+        """Reserve nbytes if they fit; returns a reservation id or None"""
+        conn = self._connect()
+        now = self.clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM reservations WHERE expires < ?", (now,))
+            reserved = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM reservations").fetchone()[0]
+            if reserved and reserved + nbytes > self.capacity_bytes:
+                conn.execute("COMMIT")
+                DECODE_MEMORY_RESERVED.set(reserved)
+                return None
+            reservation_id = secrets.token_hex(8)
+            conn.execute(
+                "INSERT INTO reservations (id, bytes, expires) VALUES (?, ?, ?)",
+                (reservation_id, nbytes, now + self.lease_s),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        DECODE_MEMORY_RESERVED.set(reserved + nbytes)
+        return reservation_id
+
+    def release(self, reservation_id: str) -> None:
+        self._connect().execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+        DECODE_MEMORY_RESERVED.set(self.reserved())
+
+    @contextmanager
+    def reserve(self, nbytes: int) -> Iterator[None]:
+        """Hold nbytes of the budget, waiting up to wait_budget_s or raising Overloaded"""
+        deadline = self.clock() + self.wait_budget_s
+        reservation_id = self.try_reserve(nbytes)
+        while reservation_id is None:
+            if self.clock() >= deadline:
+                DECODE_MEMORY_REJECTED.inc()
+                raise Overloaded("decode", self.wait_budget_s, "memory_budget")
+            self.sleep(self.poll_interval_s)
+            reservation_id = self.try_reserve(nbytes)
+        try:
+            yield
+        finally:
+            self.release(reservation_id)
+
+
+_budget: Optional[MemoryBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_decode_budget() -> MemoryBudget:
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = MemoryBudget(
+                os.getenv("DECODE_MEMORY_DB", os.path.join(tempfile.gettempdir(), "dicto_decode_memory.sqlite3")),
+                capacity_bytes=int(float(os.getenv("DECODE_MEMORY_BUDGET_MB", "512")) * MIB),
+                wait_budget_s=float(os.getenv("DECODE_MEMORY_WAIT_S", "10")),
+            )
+        return _budget
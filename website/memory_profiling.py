@@ -0,0 +1,201 @@
+"""
+Memory instrumentation
+Per-stage resident memory and Python allocation metrics for the audio and
+PDF stages, plus on-demand tracemalloc snapshots diffed by file and line,
+to attribute worker memory and size the pod limits from data
+"""
+
+import itertools
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+STAGE_PEAK_RSS = Histogram(
+    "dicto_stage_peak_rss_bytes", "Worker resident memory high-water mark during a stage", ["stage"],
+    buckets=tuple(mib * MIB for mib in (64, 128, 192, 256, 384, 512, 768, 1024, 1536, 2048)),
+)
+STAGE_RSS_GROWTH = Histogram(
+    "dicto_stage_rss_growth_bytes", "Worker resident memory added by a stage", ["stage"],
+    buckets=tuple(mib * MIB for mib in (1, 4, 16, 32, 64, 128, 256, 512)),
+)
+STAGE_ALLOCATED = Histogram(
+    "dicto_stage_allocated_bytes", "Net Python allocations left behind by a stage (tracemalloc only)", ["stage"],
+    buckets=tuple(kib * 1024 for kib in (16, 64, 256, 1024, 4096, 16384, 65536, 262144)),
+)
+WORKER_RSS = Gauge("dicto_worker_rss_bytes", "Resident memory of this worker")
+WORKER_PEAK_RSS = Gauge("dicto_worker_peak_rss_bytes", "Resident memory high-water mark of this worker")
+
+# tracemalloc's own bookkeeping and the import machinery are noise in every diff
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+GROUP_BY = ("lineno", "filename", "traceback")
+
+
+def current_rss_bytes() -> int:
+    """This process's resident memory now"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """This process's resident memory high-water mark"""
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def track_memory(stage: str) -> Callable:
+    """Decorator recording a stage's peak RSS, RSS growth and, when tracing, net allocations.
+
+    The figures are for the whole worker process, so with threaded workers
+    a concurrent request's memory is counted too; with gunicorn's default
+    sync workers they are per request. The decode stage's ffmpeg child is
+    measured separately (dicto_decode_peak_rss_bytes).
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            rss_before = current_rss_bytes()
+            peak_before = peak_rss_bytes()
+            traced_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            try:
+                return func(*args, **kwargs)
+            finally:
+                rss_after = current_rss_bytes()
+                peak_after = peak_rss_bytes()
+                # A new high-water mark was set during the stage, so it is the stage's
+                # peak; otherwise the best lower bound is what we saw either side
+                stage_peak = peak_after if peak_after > peak_before else max(rss_before, rss_after)
+                STAGE_PEAK_RSS.labels(stage=stage).observe(stage_peak)
+                STAGE_RSS_GROWTH.labels(stage=stage).observe(max(0, rss_after - rss_before))
+                if traced_before is not None and tracemalloc.is_tracing():
+                    allocated = tracemalloc.get_traced_memory()[0] - traced_before
+                    STAGE_ALLOCATED.labels(stage=stage).observe(max(0, allocated))
+                WORKER_RSS.set(rss_after)
+                WORKER_PEAK_RSS.set(peak_after)
+        return wrapper
+    return decorator
+
+
+def _location(stat: Any) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def _stat_dict(stat: Any, group_by: str) -> Dict[str, Any]:
+    entry = {"location": _location(stat), "size_bytes": stat.size, "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        entry.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+    if group_by == "traceback":
+        entry["traceback"] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    return entry
+
+
+class SnapshotStore:
+    """The last few tracemalloc snapshots of this worker, numbered in order taken.
+
+    Tracing starts with the first snapshot if MEMORY_TRACEMALLOC didn't start
+    it at boot; allocations made before tracing started are not attributed.
+    """
+
+    def __init__(self, keep: int = 4, frames: int = 1):
+        self.keep = keep
+        self.frames = frames
+        self.started_here = False
+        self._snapshots: "OrderedDict[int, Tuple[float, tracemalloc.Snapshot]]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def status(self) -> Dict[str, Any]:
+        traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            snapshots = [{"id": snapshot_id, "taken": taken} for snapshot_id, (taken, _) in self._snapshots.items()]
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": current_rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": traced,
+            "traced_peak_bytes": traced_peak,
+            "snapshots": snapshots,
+        }
+
+    def take(self) -> Tuple[int, tracemalloc.Snapshot]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self.started_here = True
+                logger.info(f"tracemalloc started on demand ({self.frames} frames)")
+            snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            snapshot_id = next(self._ids)
+            self._snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self._snapshots) > self.keep:
+                self._snapshots.popitem(last=False)
+            return snapshot_id, snapshot
+
+    def get(self, snapshot_id: int) -> Optional[tracemalloc.Snapshot]:
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+            return entry[1] if entry else None
+
+    def previous(self, snapshot_id: int) -> Optional[int]:
+        with self._lock:
+            earlier = [other for other in self._snapshots if other < snapshot_id]
+            return earlier[-1] if earlier else None
+
+    def top(self, snapshot: tracemalloc.Snapshot, group_by: str = "lineno", limit: int = 25) -> List[Dict[str, Any]]:
+        return [_stat_dict(stat, group_by) for stat in snapshot.statistics(group_by)[:limit]]
+
+    def diff(self, snapshot: tracemalloc.Snapshot, base: tracemalloc.Snapshot,
+             group_by: str = "lineno", limit: int = 25) -> List[Dict[str, Any]]:
+        """Biggest changes from base to snapshot, growth and shrinkage alike"""
+        return [_stat_dict(stat, group_by) for stat in snapshot.compare_to(base, group_by)[:limit]]
+
+    def clear(self) -> None:
+        """Drop all snapshots, and stop tracing if it was started on demand"""
+        with self._lock:
+            self._snapshots.clear()
+            if self.started_here:
+                tracemalloc.stop()
+                self.started_here = False
+
+
+def configure_tracemalloc() -> None:
+    """Trace allocations from boot when MEMORY_TRACEMALLOC is set, so stages report them"""
+    if os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true" and not tracemalloc.is_tracing():
+        frames = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "1"))
+        tracemalloc.start(frames)
+        logger.info(f"tracemalloc enabled ({frames} frames)")
+
+
+_snapshots: Optional[SnapshotStore] = None
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    global _snapshots
+    with _snapshots_lock:
+        if _snapshots is None:
+            _snapshots = SnapshotStore(
+                keep=int(os.getenv("MEMORY_SNAPSHOT_KEEP", "4")),
+                frames=int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "1")),
+            )
+        return _snapshots
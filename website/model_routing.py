@@ -0,0 +1,197 @@
+"""
+Latency-aware model routing for summarization
+Picks the chat model for each call from the prompt size (it must fit the
+model's context, and long prompts go to the largest context) and from live
+latency and error EWMAs kept per model, so calls move off a failing model
+without a config change, and back once occasional probes show it has recovered
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+MODEL_ROUTES = Counter(
+    "dicto_model_routes_total", "Summarization calls routed to each model, by why it was picked", ["model", "reason"]
+)
+MODEL_FALLBACKS = Counter(
+    "dicto_model_fallbacks_total", "Summarization attempts moved to another model after a failure",
+    ["from_model", "to_model"],
+)
+MODEL_LATENCY_EWMA = Gauge(
+    "dicto_model_latency_ewma_seconds", "Smoothed latency of successful calls per model (this worker)", ["model"]
+)
+MODEL_ERROR_EWMA = Gauge(
+    "dicto_model_error_ewma", "Smoothed share of failed calls per model (this worker)", ["model"]
+)
+
+# Summary length scales with the transcript, within these bounds
+MIN_SUMMARY_TOKENS = 150
+MAX_SUMMARY_TOKENS = 600
+SUMMARY_TOKENS_PER_TRANSCRIPT_TOKEN = 0.2
+
+
+@dataclass
+class ModelOption:
+    name: str
+    context_tokens: int
+
+
+@dataclass
+class ModelHealth:
+    latency_s: float = 0.0
+    error_rate: float = 0.0
+    samples: int = 0
+
+
+def parse_models(spec: str) -> List[ModelOption]:
+    """"gpt-4o-mini:128000,gpt-4.1-mini:1047576" -> options, in order of preference"""
+    models = []
+    for item in spec.split(","):
+        name, _, context = item.strip().partition(":")
+        if name:
+            models.append(ModelOption(name, int(context or 128_000)))
+    if not models:
+        raise ValueError("SUMMARY_MODELS must name at least one model")
+    return models
+
+
+def summary_max_tokens(transcript_tokens: int) -> int:
+    """Completion allowance for a summary of a transcript this long"""
+    wanted = int(transcript_tokens * SUMMARY_TOKENS_PER_TRANSCRIPT_TOKEN)
+    return max(MIN_SUMMARY_TOKENS, min(MAX_SUMMARY_TOKENS, wanted))
+
+
+class ModelRouter:
+    """Orders candidate models for a call.
+
+    Models the prompt does not fit are skipped. Of the rest, healthy ones
+    (error EWMA below max_error_rate) come first and degraded ones stay at
+    the end as a last resort. Among healthy models, a call needing at least
+    long_prompt_tokens goes to the largest context (models summarize better
+    far from their limit); otherwise the primary (first configured) model
+    is kept first. Only then are ties broken by latency EWMA, models without
+    samples yet counting as fastest so each gets tried. The caller moves
+    down the list when an attempt fails.
+
+    EWMAs only move when a model is called, so a model ranked below the first
+    would never show it got faster or recovered. Once a model has gone
+    probe_interval_s without a call, the next call tries it first (a probe);
+    if that fails the caller falls back down the list as usual.
+    """
+
+    def __init__(self, models: List[ModelOption], alpha: float = 0.2, max_error_rate: float = 0.5,
+                 probe_interval_s: float = 60.0, long_prompt_tokens: int = 32_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.models = list(models)
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.long_prompt_tokens = long_prompt_tokens
+        self.probe_interval_s = probe_interval_s
+        self.clock = clock
+        self._health: Dict[str, ModelHealth] = {model.name: ModelHealth() for model in self.models}
+        # When each model was last called or picked for a probe
+        self._last_tried: Dict[str, float] = {model.name: clock() for model in self.models}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> str:
+        return self.models[0].name
+
+    def is_long(self, prompt_tokens: int, max_tokens: int) -> bool:
+        return prompt_tokens + max_tokens >= self.long_prompt_tokens
+
+    def rank(self, prompt_tokens: int, max_tokens: int) -> List[str]:
+        """Models the prompt fits (all of them if none has the context), best first by health, size, then latency"""
+        needed = prompt_tokens + max_tokens
+        fitting = [model for model in self.models if model.context_tokens >= needed] or self.models
+        long_prompt = self.is_long(prompt_tokens, max_tokens)
+        with self._lock:
+            health = {model.name: ModelHealth(**vars(self._health[model.name])) for model in fitting}
+        order = {model.name: i for i, model in enumerate(self.models)}
+        context = {model.name: model.context_tokens for model in self.models}
+        return sorted(
+            health,
+            key=lambda name: (
+                self.degraded(health[name]),
+                -context[name] if long_prompt else 0,
+                name != self.primary,
+                health[name].latency_s,
+                order[name],
+            ),
+        )
+
+    def candidates(self, prompt_tokens: int, max_tokens: int) -> List[str]:
+        """Models to try for a call, best first, with a model due a probe moved to the front"""
+        ranked = self.rank(prompt_tokens, max_tokens)
+        fits_all = len(ranked) == len(self.models)
+        if not fits_all:
+            reason = "context"
+        elif self.is_long(prompt_tokens, max_tokens):
+            reason = "long_prompt"
+        else:
+            reason = "primary" if ranked[0] == self.primary else "fastest"
+        with self._lock:
+            health = {name: ModelHealth(**vars(self._health[name])) for name in ranked}
+            now = self.clock()
+            due = [name for name in ranked[1:] if now - self._last_tried[name] >= self.probe_interval_s]
+            if due:
+                # One call probes the longest-untried model; later calls wait for the next interval
+                probe = min(due, key=lambda name: self._last_tried[name])
+                self._last_tried[probe] = now
+                ranked.remove(probe)
+                ranked.insert(0, probe)
+                reason = "probe"
+            self._last_tried[ranked[0]] = now
+        if reason != "probe":
+            if self.degraded(health[ranked[0]]):
+                reason = "degraded"
+            elif ranked[0] != self.primary and self.degraded(health.get(self.primary, ModelHealth())):
+                reason = "fallback"
+        MODEL_ROUTES.labels(model=ranked[0], reason=reason).inc()
+        return ranked
+
+    def degraded(self, health: ModelHealth) -> bool:
+        return health.error_rate >= self.max_error_rate
+
+    def record(self, model: str, latency_s: float, error: bool) -> None:
+        with self._lock:
+            self._last_tried[model] = self.clock()
+            health = self._health.setdefault(model, ModelHealth())
+            health.error_rate += self.alpha * ((1.0 if error else 0.0) - health.error_rate)
+            if not error:
+                # The first sample seeds the average rather than being pulled towards zero
+                health.latency_s = latency_s if health.samples == 0 else \
+                    health.latency_s + self.alpha * (latency_s - health.latency_s)
+                health.samples += 1
+            MODEL_LATENCY_EWMA.labels(model=model).set(health.latency_s)
+            MODEL_ERROR_EWMA.labels(model=model).set(health.error_rate)
+
+    def health(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(vars(health)) for name, health in self._health.items()}
+
+
+def configured_models() -> List[ModelOption]:
+    return parse_models(os.getenv("SUMMARY_MODELS", "gpt-4o-mini:128000,gpt-4.1-nano:1047576"))
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(
+                configured_models(),
+                alpha=float(os.getenv("MODEL_ROUTING_EWMA_ALPHA", "0.2")),
+                max_error_rate=float(os.getenv("MODEL_ROUTING_MAX_ERROR_RATE", "0.5")),
+                probe_interval_s=float(os.getenv("MODEL_ROUTING_PROBE_INTERVAL_S", "60")),
+                long_prompt_tokens=int(os.getenv("MODEL_ROUTING_LONG_PROMPT_TOKENS", "32000")),
+            )
+        return _router
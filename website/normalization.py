@@ -0,0 +1,81 @@
+"""
+Transcript normalization before summarization
+Strips filler words, false starts and repeated words/phrases from speech
+transcripts with precompiled patterns, so summary prompts carry fewer tokens
+"""
+
+import re
+from dataclasses import dataclass
+
+from prometheus_client import Counter, Histogram
+
+from .rate_limit import estimate_tokens
+
+NORMALIZATION_TOKENS_REMOVED = Counter(
+    "dicto_normalization_tokens_removed_total", "Estimated prompt tokens removed by transcript normalization"
+)
+NORMALIZATION_REDUCTION = Histogram(
+    "dicto_normalization_reduction_ratio", "Fraction of transcript tokens removed by normalization",
+    buckets=(0.0, 0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5),
+)
+
+# Standalone hesitation sounds with any comma that follows them
+FILLERS = re.compile(
+    r"(?<![\w'-])(?:u+h+m*|u+m+|e+r+m*|a+h+|h+m+|m+h*m+)(?![\w'-])[,.…]*\s*",
+    re.IGNORECASE,
+)
+# Repeated digits and number words are facts ("555 555 1234", "room four four two"), not stutters
+NUMBER_WORDS = (
+    "zero|oh|nought|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|fourteen|"
+    "fifteen|sixteen|seventeen|eighteen|nineteen|twenty|thirty|forty|fifty|sixty|seventy|eighty|ninety|"
+    "hundred|thousand|million|billion"
+)
+# A word of letters only that is not a number word
+REPEATABLE_WORD = rf"(?!(?:{NUMBER_WORDS})\b)[^\W\d_]+"
+# Grammatical doubles ("I know that that is wrong", "she had had enough", "what it is is")
+ALLOWED_DOUBLES = ("that", "had", "is")
+# "I was- I was going" / "go- going": a fragment cut off with a dash and then restarted.
+# Case-sensitive, so "Plan A- a better plan" is not a restart of "A"
+FALSE_STARTS = re.compile(rf"\b({REPEATABLE_WORD}(?:\s+{REPEATABLE_WORD}){{0,2}})[-—–]\s+(?=\1)")
+# "we should, we should go" / "the the": a word or phrase (up to 4 words) said twice or more,
+# except an allowed double said exactly twice
+REPETITIONS = re.compile(
+    rf"\b((?!(?P<double>{'|'.join(ALLOWED_DOUBLES)})[\s,]+(?P=double)\b(?![\s,]+(?P=double)\b))"
+    rf"{REPEATABLE_WORD}(?:\s+{REPEATABLE_WORD}){{0,3}})(?:[\s,]+\1\b)+",
+    re.IGNORECASE,
+)
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.!?;:])")
+REPEATED_PUNCTUATION = re.compile(r"([,;:])(?:\s*[,;:])+")
+LEADING_COMMA = re.compile(r"(^|[.!?]\s+),\s*")
+WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class NormalizedTranscript:
+    text: str
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0
+
+
+def normalize_transcript(transcript: str) -> NormalizedTranscript:
+    """Remove disfluencies and collapse repetitions; meaning-bearing words are kept"""
+    text = WHITESPACE.sub(" ", transcript).strip()
+    text = FILLERS.sub("", text)
+    text = FALSE_STARTS.sub("", text)
+    text = REPETITIONS.sub(r"\1", text)
+    text = SPACE_BEFORE_PUNCTUATION.sub(r"\1", text)
+    text = REPEATED_PUNCTUATION.sub(r"\1", text)
+    text = LEADING_COMMA.sub(r"\1", text)
+    text = WHITESPACE.sub(" ", text).strip()
+    if not text:
+        # All filler ("Hmm."): an empty prompt says less than the original
+        text = WHITESPACE.sub(" ", transcript).strip()
+
+    result = NormalizedTranscript(text, estimate_tokens(transcript), estimate_tokens(text))
+    NORMALIZATION_TOKENS_REMOVED.inc(max(0, result.tokens_before - result.tokens_after))
+    NORMALIZATION_REDUCTION.observe(result.reduction)
+    return result
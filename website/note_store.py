@@ -0,0 +1,451 @@
+"""
+Persistent note store for Dicto
+Processed notes (transcript, summary, plain text, metadata) and their
+rendered artifacts, zlib-compressed in a local SQLite database, with a
+contentless FTS5 full-text index over transcripts and summaries. Each note
+belongs to an owner key (see website.owners) and lookups can be scoped to it
+"""
+
+import base64
+import hashlib
+import html
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# bm25 column weights: a hit in the summary says more than one in the transcript
+SEARCH_WEIGHTS = {"transcript": 1.0, "summary": 2.0}
+SEARCH_TOKEN = re.compile(r"\w+", re.UNICODE)
+# Broad queries rank only this many of their newest matches, which bounds the
+# bm25 scoring and sorting work however many notes a word appears in
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+# Shorter last words match exactly: one-letter prefixes expand to most of the vocabulary
+MIN_PREFIX_CHARS = 2
+
+
+@dataclass
+class Note:
+    id: str
+    transcript: str
+    summary: str
+    plain_text: str
+    created: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "note_id": self.id,
+            "transcript": self.transcript,
+            "summary": self.summary,
+            "plain_text": self.plain_text,
+            "created": self.created,
+            "metadata": self.metadata,
+        }
+
+
+@dataclass
+class SearchHit:
+    note_id: str
+    score: float
+    snippet: str
+    created: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"note_id": self.note_id, "score": self.score, "snippet": self.snippet, "created": self.created}
+
+
+@dataclass
+class SearchPage:
+    hits: List[SearchHit]
+    next_cursor: Optional[str]
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: every word must match, last word as a prefix"""
+    tokens = SEARCH_TOKEN.findall(query)
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    if len(tokens[-1]) >= MIN_PREFIX_CHARS:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _encode_cursor(score: float, rowid: int, floor: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, rowid, floor]).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, int, int]:
+    try:
+        score, rowid, floor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(rowid), int(floor)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid search cursor") from e
+
+
+def make_snippet(summary: str, transcript: str, terms: List[str], words: int = 16) -> str:
+    """HTML-escaped excerpt around the first matching term, with matches in <mark>.
+
+    Terms match as word prefixes, which approximates the index's porter stemming.
+    """
+    # One regex scan finds the first hit; only the window around it is tokenized per word
+    matcher = re.compile(
+        "(?<!\\S)[.,!?;:()*#\"']*(?:" + "|".join(re.escape(term) for term in terms) + ")", re.IGNORECASE
+    ) if terms else None
+    for text in (summary, transcript):
+        first = matcher.search(text) if matcher else None
+        if first is None:
+            continue
+        tokens = text.split()
+        start = max(0, len(text[:first.start()].split()) - words // 4)
+        window = tokens[start:start + words]
+        marked = [
+            f"<mark>{html.escape(token)}</mark>" if matcher.match(token) else html.escape(token)
+            for token in window
+        ]
+        prefix = "… " if start > 0 else ""
+        suffix = " …" if start + words < len(tokens) else ""
+        return prefix + " ".join(marked) + suffix
+    return html.escape(" ".join(transcript.split()[:words]))
+
+
+def _owner_term(owner: str) -> str:
+    """The one index token an owner's notes carry, whatever characters the owner key has"""
+    return "o" + hashlib.sha256(owner.encode()).hexdigest()[:16]
+
+
+def _pack(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _unpack(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+class NoteStore:
+    """SQLite-backed note storage, safe to share between threads and workers"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id TEXT PRIMARY KEY,
+                created REAL NOT NULL,
+                transcript BLOB NOT NULL,
+                summary BLOB NOT NULL,
+                plain_text BLOB NOT NULL,
+                metadata TEXT NOT NULL DEFAULT '{}',
+                owner TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS owner_counts (
+                owner TEXT PRIMARY KEY,
+                notes INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS artifacts (
+                note_id TEXT NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+                kind TEXT NOT NULL,
+                data BLOB NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (note_id, kind)
+            );
+            """
+        )
+        self._migrate()
+        # Contentless: the index keeps no copy of the text, which stays compressed in notes.
+        # Its owner column holds one _owner_term() token, so searches can match by owner
+        conn.executescript(
+            """
+            CREATE INDEX IF NOT EXISTS notes_owner ON notes (owner);
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                owner,
+                transcript,
+                summary,
+                content = '',
+                prefix = '2 3',
+                tokenize = 'porter unicode61'
+            );
+            """
+        )
+        self._backfill_index()
+
+    def _migrate(self) -> None:
+        """Bring databases written by older versions up to the current schema"""
+        conn = self._connect()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(notes)")]
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE notes ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        if conn.execute("SELECT 1 FROM owner_counts LIMIT 1").fetchone() is None:
+            conn.execute("INSERT INTO owner_counts (owner, notes) SELECT owner, COUNT(*) FROM notes GROUP BY owner")
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'notes_fts'").fetchone()
+        if row is not None and "content = ''" not in row[0]:
+            # The old index stored its own uncompressed copy of every note; rebuild it
+            conn.execute("DROP TABLE notes_fts")
+
+    def _backfill_index(self) -> None:
+        """Index notes written before the FTS table existed (FTS rowid == notes rowid)"""
+        conn = self._connect()
+        missing = conn.execute(
+            "SELECT rowid, owner, transcript, summary FROM notes "
+            "WHERE rowid NOT IN (SELECT rowid FROM notes_fts)"
+        ).fetchall()
+        if not missing:
+            return
+        with self.transaction():
+            conn.executemany(
+                "INSERT INTO notes_fts (rowid, owner, transcript, summary) VALUES (?, ?, ?, ?)",
+                [(rowid, _owner_term(owner), _unpack(transcript), _unpack(summary))
+                 for rowid, owner, transcript, summary in missing],
+            )
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Group writes (e.g. bulk imports) into one transaction"""
+        conn = self._connect()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA mmap_size=268435456")
+            self._local.conn = conn
+        return conn
+
+    def save(self, transcript: str, summary: str, plain_text: str,
+             metadata: Optional[Dict[str, Any]] = None, owner: str = "") -> Note:
+        note = Note(
+            id=secrets.token_urlsafe(12),
+            transcript=transcript,
+            summary=summary,
+            plain_text=plain_text,
+            created=time.time(),
+            metadata=metadata or {},
+        )
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO notes (id, created, transcript, summary, plain_text, metadata, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (note.id, note.created, _pack(transcript), _pack(summary), _pack(plain_text),
+                 json.dumps(note.metadata), owner),
+            )
+            conn.execute(
+                "INSERT INTO notes_fts (rowid, owner, transcript, summary) VALUES (?, ?, ?, ?)",
+                (cursor.lastrowid, _owner_term(owner), transcript, summary),
+            )
+            conn.execute(
+                "INSERT INTO owner_counts (owner, notes) VALUES (?, 1) "
+                "ON CONFLICT (owner) DO UPDATE SET notes = notes + 1",
+                (owner,),
+            )
+        return note
+
+    def get(self, note_id: str, owner: Optional[str] = None) -> Optional[Note]:
+        """A note by id; with `owner`, only if it belongs to that owner"""
+        row = self._connect().execute(
+            "SELECT id, created, transcript, summary, plain_text, metadata, owner FROM notes WHERE id = ?",
+            (note_id,),
+        ).fetchone()
+        if row is None or (owner is not None and row[6] != owner):
+            return None
+        return Note(
+            id=row[0],
+            created=row[1],
+            transcript=_unpack(row[2]),
+            summary=_unpack(row[3]),
+            plain_text=_unpack(row[4]),
+            metadata=json.loads(row[5]),
+        )
+
+    def note_ids(self, owner: str) -> List[str]:
+        """Ids of every note the owner has"""
+        rows = self._connect().execute("SELECT id FROM notes WHERE owner = ?", (owner,)).fetchall()
+        return [note_id for note_id, in rows]
+
+    def _unindex(self, conn: sqlite3.Connection, rowid: int) -> Optional[Tuple[str, str, str]]:
+        """Remove a note from the contentless index, which needs the values it indexed;
+        returns (owner, transcript, summary)"""
+        row = conn.execute("SELECT owner, transcript, summary FROM notes WHERE rowid = ?", (rowid,)).fetchone()
+        if row is None:
+            return None
+        owner, transcript, summary = row[0], _unpack(row[1]), _unpack(row[2])
+        conn.execute(
+            "INSERT INTO notes_fts (notes_fts, rowid, owner, transcript, summary) VALUES ('delete', ?, ?, ?, ?)",
+            (rowid, _owner_term(owner), transcript, summary),
+        )
+        return owner, transcript, summary
+
+    def update_summary(self, note_id: str, summary: str, plain_text: str, metadata: Dict[str, Any]) -> bool:
+        """Replace a note's summary (e.g. a backfilled one), dropping artifacts rendered from the old one"""
+        with self.transaction() as conn:
+            row = conn.execute("SELECT rowid FROM notes WHERE id = ?", (note_id,)).fetchone()
+            if row is None:
+                return False
+            owner, transcript, _ = self._unindex(conn, row[0])
+            conn.execute(
+                "UPDATE notes SET summary = ?, plain_text = ?, metadata = ? WHERE rowid = ?",
+                (_pack(summary), _pack(plain_text), json.dumps(metadata), row[0]),
+            )
+            conn.execute(
+                "INSERT INTO notes_fts (rowid, owner, transcript, summary) VALUES (?, ?, ?, ?)",
+                (row[0], _owner_term(owner), transcript, summary),
+            )
+            conn.execute("DELETE FROM artifacts WHERE note_id = ?", (note_id,))
+        return True
+
+    def pending_summaries(self, limit: int = 20) -> List[Note]:
+        """Oldest notes saved without a summary (metadata summary_pending)"""
+        rows = self._connect().execute(
+            "SELECT id FROM notes WHERE json_extract(metadata, '$.summary_pending') ORDER BY created LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [note for note in (self.get(note_id) for note_id, in rows) if note is not None]
+
+    def count_pending_summaries(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM notes WHERE json_extract(metadata, '$.summary_pending')"
+        ).fetchone()[0]
+
+    def delete(self, note_id: str) -> bool:
+        with self.transaction() as conn:
+            row = conn.execute("SELECT rowid FROM notes WHERE id = ?", (note_id,)).fetchone()
+            if row is None:
+                return False
+            owner, _, _ = self._unindex(conn, row[0])
+            conn.execute("DELETE FROM notes WHERE rowid = ?", (row[0],))
+            conn.execute("UPDATE owner_counts SET notes = notes - 1 WHERE owner = ?", (owner,))
+        return True
+
+    def search(self, query: str, owner: Optional[str] = None, limit: int = 20,
+               cursor: Optional[str] = None) -> SearchPage:
+        """Ranked full-text search with highlighted snippets and keyset pagination.
+
+        With `owner`, only that owner's notes match. Results are ordered by
+        (bm25 score, rowid) among the newest SEARCH_MAX_CANDIDATES matches: the
+        first page finds the rowid floor of that window, and the cursor carries
+        it with the last (score, rowid) pair, so later pages rank the same
+        window and resume after it without OFFSET scans.
+        """
+        match = build_match_query(query)
+        if match is None:
+            return SearchPage(hits=[], next_cursor=None)
+        conn = self._connect()
+        owned, params = "", []
+        if owner is not None and self._match_owner_term(conn, owner):
+            match = f'owner : "{_owner_term(owner)}" AND ({match})'
+        elif owner is not None:
+            owned = ("AND EXISTS (SELECT 1 FROM notes INDEXED BY notes_owner "
+                     "WHERE notes.owner = ? AND notes.rowid = notes_fts.rowid)")
+            params = [owner]
+
+        if cursor:
+            after_score, after_rowid, floor = _decode_cursor(cursor)
+        else:
+            after_score, after_rowid = float("-inf"), 0
+            # Walking the doclist newest first is cheap; scoring every match is not
+            row = conn.execute(
+                f"SELECT rowid FROM notes_fts WHERE notes_fts MATCH ? {owned} ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                [match, *params, SEARCH_MAX_CANDIDATES - 1],
+            ).fetchone()
+            floor = row[0] if row else 0
+
+        rows = conn.execute(
+            f"""
+            SELECT rowid, score FROM (
+                SELECT rowid, bm25(notes_fts, 0, ?, ?) AS score
+                FROM notes_fts WHERE notes_fts MATCH ? AND rowid >= ? {owned}
+            )
+            WHERE score > ? OR (score = ? AND rowid > ?)
+            ORDER BY score, rowid
+            LIMIT ?
+            """,
+            [SEARCH_WEIGHTS["transcript"], SEARCH_WEIGHTS["summary"], match, floor, *params,
+             after_score, after_score, after_rowid, limit + 1],
+        ).fetchall()
+
+        # Snippets are built in Python for this page only, from the compressed notes
+        page = rows[:limit]
+        details: Dict[int, Tuple[str, str, str, float]] = {}
+        if page:
+            placeholders = ",".join("?" * len(page))
+            for rowid, note_id, transcript, summary, created in conn.execute(
+                f"SELECT rowid, id, transcript, summary, created FROM notes WHERE rowid IN ({placeholders})",
+                [rowid for rowid, _ in page],
+            ):
+                details[rowid] = (note_id, _unpack(transcript), _unpack(summary), created)
+
+        terms = [token.lower() for token in SEARCH_TOKEN.findall(query)]
+        hits = [
+            SearchHit(note_id=details[rowid][0], score=score,
+                      snippet=make_snippet(details[rowid][2], details[rowid][1], terms),
+                      created=details[rowid][3])
+            for rowid, score in page if rowid in details
+        ]
+        next_cursor = _encode_cursor(page[-1][1], page[-1][0], floor) if len(rows) > limit else None
+        return SearchPage(hits=hits, next_cursor=next_cursor)
+
+    def _match_owner_term(self, conn: sqlite3.Connection, owner: str) -> bool:
+        """Whether to scope a search by matching the owner's index term, else by
+        checking each match's owner.
+
+        Matching the term makes bm25 walk the owner's whole doclist for its idf;
+        checking matches walks about SEARCH_MAX_CANDIDATES * notes / owner_notes of
+        them to fill the ranking window. Whichever walks fewer wins: the term for
+        most owners, the per-match check for one that owns a large share of notes.
+        """
+        row = conn.execute("SELECT notes FROM owner_counts WHERE owner = ?", (owner,)).fetchone()
+        owner_notes = row[0] if row else 0
+        notes = conn.execute("SELECT max(rowid) FROM notes").fetchone()[0] or 0
+        return owner_notes * owner_notes < SEARCH_MAX_CANDIDATES * notes
+
+    def get_artifact(self, note_id: str, kind: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            "SELECT data FROM artifacts WHERE note_id = ? AND kind = ?", (note_id, kind)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_artifact(self, note_id: str, kind: str, data: bytes) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO artifacts (note_id, kind, data, created) VALUES (?, ?, ?, ?)",
+            (note_id, kind, data, time.time()),
+        )
+
+
+_store: Optional[NoteStore] = None
+_store_lock = threading.Lock()
+
+
+def default_db_path() -> str:
+    data_dir = os.getenv("DICTO_DATA_DIR", "data")
+    return os.getenv("NOTE_STORE_DB", os.path.join(data_dir, "notes.sqlite3"))
+
+
+def get_note_store() -> NoteStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            db_path = default_db_path()
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            _store = NoteStore(db_path)
+        return _store
@@ -0,0 +1,72 @@
+"""
+Note ownership
+There are no user accounts: each browser gets a random owner token in an
+HttpOnly cookie on its first request (API clients may send it in the
+X-Dicto-Owner header instead). Notes are saved under a hash of the token,
+and reading, searching and relating notes only ever sees the caller's own
+"""
+
+import hashlib
+import os
+import re
+import secrets
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from flask import Flask, Response, g, has_request_context, request
+
+OWNER_COOKIE = "dicto_owner"
+OWNER_HEADER = "X-Dicto-Owner"
+OWNER_TOKEN = re.compile(r"^[A-Za-z0-9_-]{22,128}$")
+# Browsers cap cookie lifetimes at 400 days
+OWNER_COOKIE_MAX_AGE_S = 400 * 24 * 3600
+
+_owner_override: ContextVar[Optional[str]] = ContextVar("note_owner", default=None)
+
+
+def owner_key(token: str) -> str:
+    """What notes are stored under: a hash, so the database never holds usable tokens"""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def current_owner() -> str:
+    """The caller's owner key, issuing a new token (sent back as a cookie) if it has none.
+
+    Outside a request (batch jobs) it is whatever owned_by() set, else "".
+    """
+    override = _owner_override.get()
+    if override is not None:
+        return override
+    if not has_request_context():
+        return ""
+    if "dicto_owner" not in g:
+        token = request.headers.get(OWNER_HEADER) or request.cookies.get(OWNER_COOKIE, "")
+        if not OWNER_TOKEN.match(token):
+            token = secrets.token_urlsafe(32)
+            g.dicto_new_owner_token = token
+        g.dicto_owner = owner_key(token)
+    return g.dicto_owner
+
+
+@contextmanager
+def owned_by(owner: str) -> Iterator[None]:
+    """Save notes made inside under this owner key (e.g. for the batch importer)"""
+    token = _owner_override.set(owner)
+    try:
+        yield
+    finally:
+        _owner_override.reset(token)
+
+
+def install_owner_cookie(app: Flask) -> None:
+    """Send newly issued owner tokens back as a long-lived HttpOnly cookie"""
+    secure = os.getenv("OWNER_COOKIE_SECURE", "false").lower() == "true"
+
+    @app.after_request
+    def issue_owner_cookie(response: Response) -> Response:
+        token = g.pop("dicto_new_owner_token", None)
+        if token:
+            response.set_cookie(OWNER_COOKIE, token, max_age=OWNER_COOKIE_MAX_AGE_S, httponly=True,
+                                secure=secure, samesite="Lax")
+        return response
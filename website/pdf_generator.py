@@ -12,9 +12,11 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.enums import TA_LEFT
 from flask import Response
+from .memory_profiling import track_memory
 from .utils import markdown_to_pdf_text
 
 
+@track_memory("pdf")
 def create_dyslexia_friendly_pdf(
     transcript: str, summary: str, timestamp: Optional[datetime] = None
 ) -> bytes:
@@ -199,6 +201,10 @@ def create_pdf_response(
     transcript: str, summary: str, timestamp: Optional[datetime] = None
 ) -> Response:
     pdf_content = create_dyslexia_friendly_pdf(transcript, summary, timestamp)
+    return pdf_response(pdf_content, timestamp)
+
+
+def pdf_response(pdf_content: bytes, timestamp: Optional[datetime] = None) -> Response:
     filename = generate_pdf_filename(timestamp)
 
     response = Response(
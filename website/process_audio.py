@@ -1,17 +1,41 @@
+import hashlib
+import itertools
+import logging
 import os
-import tempfile
+import threading
 import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import wraps
-from typing import Callable, Any
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 
-from flask import jsonify, current_app, Response
+from flask import jsonify, current_app, has_app_context, Response
 from openai import OpenAI
-from pydub import AudioSegment
-from pydub.effects import speedup
 from werkzeug.datastructures import FileStorage
 
 
+from website.admission import limit_stage
+from website.audio_ingest import IngestResult, ingest
+from website.memory_budget import estimate_decode_memory, get_decode_budget
+from website.memory_profiling import track_memory
+from website.model_routing import MODEL_FALLBACKS, get_model_router, summary_max_tokens
+from website.normalization import normalize_transcript
+from website.note_store import get_note_store
+from website.owners import current_owner
+from website.rate_limit import RateLimited, acquire_model_budget, estimate_tokens
+from website.resilience import CircuitOpen, RetryPolicy, call_with_resilience, circuit_breaker, is_retryable
+from website.summarization import get_chunk_cache, map_reduce_summary, needs_map_reduce
+from website.transcription_backends import create_backend
 from website.utils import markdown_to_plain_text
+from website.vector_index import get_embedder, get_vector_index, note_text
+
+
+logger = logging.getLogger(__name__)
+
+
+def _logger() -> logging.Logger:
+    """The app logger while serving requests, this module's logger in batch jobs"""
+    return current_app.logger if has_app_context() else logger
 
 
 def track_processing_time(metric_name: str) -> Callable:
@@ -23,11 +47,11 @@ def track_processing_time(metric_name: str) -> Callable:
             try:
                 result = func(*args, **kwargs)
                 duration = time.time() - start_time
-                current_app.logger.info(f"{metric_name} completed in {duration:.2f}s")
+                _logger().info(f"{metric_name} completed in {duration:.2f}s")
                 return result
             except Exception as e:
                 duration = time.time() - start_time
-                current_app.logger.error(f"{metric_name} failed after {duration:.2f}s: {str(e)}")
+                _logger().error(f"{metric_name} failed after {duration:.2f}s: {str(e)}")
                 raise
         return wrapper
     return decorator
@@ -36,50 +60,91 @@ def track_processing_time(metric_name: str) -> Callable:
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("OPENAI_API_KEY environment variable is required")
-client = OpenAI(api_key=api_key)
+# Retries are handled by website.resilience so deadlines and backoff are ours to control
+client = OpenAI(api_key=api_key, max_retries=0)
+
+transcription_policy = RetryPolicy.from_env("transcription", deadline_s=180.0, attempt_timeout_s=120.0)
+summarization_policy = RetryPolicy.from_env("summarization", deadline_s=60.0, attempt_timeout_s=30.0)
+
+transcription_backend = create_backend(
+    os.getenv("TRANSCRIPTION_BACKEND", "openai"), client=client, policy=transcription_policy
+)
+
+
+# Speed-up cuts per-minute transcription cost; 1 disables it, letting accepted formats pass through untouched
+PLAYBACK_SPEED = float(os.getenv("AUDIO_SPEED", "1.5"))
+# Upload cap, checked as bytes reach the decoder rather than from Content-Length
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Typical upload bitrate (browser Opus is 32-64 kbps), to estimate duration before decoding
+AUDIO_BYTES_PER_SECOND = int(os.getenv("AUDIO_BYTES_PER_SECOND", "8000"))
+
+
+def estimate_audio_seconds(upload_bytes: Optional[int]) -> float:
+    """Rough recording length from upload size; unknown sizes count as long"""
+    if upload_bytes is None:
+        return float("inf")
+    return upload_bytes / AUDIO_BYTES_PER_SECOND
 
 
+@limit_stage("decode")
+@track_memory("decode")
 def speed_up_audio(audio_file: FileStorage) -> str:
-    audio = AudioSegment.from_file(audio_file, format="webm")
-    sped_up_audio = speedup(audio, playback_speed=1.5)
+    """Decode and speed up an uploaded file into a temp file the caller must delete"""
+    stream = audio_file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    with get_decode_budget().reserve(estimate_decode_memory(size)):
+        return prepare_audio(stream).path
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_file:
-        sped_up_audio.export(temp_file.name, format="webm")
-        temp_path = temp_file.name
-    return temp_path
+
+@track_processing_time("ingest")
+@limit_stage("decode")
+@track_memory("decode")
+def ingest_audio_stream(stream: BinaryIO, expected_bytes: Optional[int] = None) -> IngestResult:
+    """Decode and speed up a raw audio request body while it is still uploading"""
+    with get_decode_budget().reserve(estimate_decode_memory(expected_bytes)):
+        return prepare_audio(stream)
+
+
+def prepare_audio(stream: BinaryIO) -> IngestResult:
+    """Sniff an upload and pass it through or transcode it for the transcription backend"""
+    return ingest(
+        stream,
+        UPLOAD_MAX_BYTES,
+        speed=PLAYBACK_SPEED,
+        accepted_formats=transcription_backend.accepted_formats,
+        passthrough_max_bytes=transcription_backend.max_upload_bytes,
+    )
+
+
+class NoSpeechDetected(ValueError):
+    """The audio transcribed to nothing"""
 
 
 @track_processing_time("transcription")
+@limit_stage("transcription")
+@track_memory("transcription")
 def transcribe(audio_file_path: str) -> str:
     try:
-        current_app.logger.info("Starting transcription...")
-        with open(audio_file_path, "rb") as audio:
-            transcript_response = client.audio.transcriptions.create(
-                model="whisper-1", file=audio, response_format="text"
-            )
+        _logger().info("Starting transcription...")
+
+        transcript_response = transcription_backend.transcribe(audio_file_path)
 
         transcript = transcript_response.strip()
-        current_app.logger.info(f"Transcription complete: {len(transcript)} characters")
+        _logger().info(f"Transcription complete: {len(transcript)} characters")
 
         if not transcript:
-            raise ValueError("No speech detected in audio")
+            raise NoSpeechDetected("No speech detected in audio")
 
         return transcript
 
     except Exception as e:
-        current_app.logger.error(f"Error during transcription: {str(e)}")
+        _logger().error(f"Error during transcription: {str(e)}")
         raise
 
 
-@track_processing_time("summarization")
-def process_with_LLM(transcript: str) -> Response:
-    current_app.logger.info("Starting summarization...")
-    summary_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a helpful assistant that creates concise, actionable
+SUMMARY_SYSTEM_PROMPT = """You are a helpful assistant that creates concise, actionable
                 summaries of voice recordings. 
                 
                 Start with a ## Title that summarizes the entire transcript in one line ##
@@ -89,28 +154,292 @@ def process_with_LLM(transcript: str) -> Response:
                 - Action items or next steps
                 - Important insights or decisions
                 - Keep it brief but comprehensive
-                - Use bullet points when appropriate""",
-            },
-            {
-                "role": "user",
-                "content": f"Please summarize this transcript: {transcript}",
-            },
-        ],
-        max_tokens=300,
-        temperature=0.3,
-    )
+                - Use bullet points when appropriate"""
+
+CHUNK_SYSTEM_PROMPT = """You are summarizing one part of a longer voice recording.
+                List the key points, decisions and action items from this part as
+                terse bullet points. Do not add a title."""
+
+ROLLING_SYSTEM_PROMPT = """You are keeping running notes on a voice recording that is
+                still in progress. Update the notes with the next part of the
+                transcript: add its key points, decisions and action items as terse
+                bullet points, merge repeats and keep earlier points, condensing the
+                oldest ones if the notes grow long. Return only the updated notes.
+                Do not add a title."""
 
-    summary = summary_response.choices[0].message.content
-    current_app.logger.info("Summarization complete")
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS", "3000"))
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+MAP_WORKERS = int(os.getenv("SUMMARY_MAP_WORKERS", "4"))
+# Cap on running notes for segmented recordings, which keeps each fold and the final call constant-size
+NOTES_MAX_TOKENS = int(os.getenv("ROLLING_NOTES_MAX_TOKENS", "400"))
+# Optionally strip disfluencies from the prompt copy of the transcript; the stored transcript stays verbatim
+NORMALIZE_TRANSCRIPTS = os.getenv("TRANSCRIPT_NORMALIZE", "false").lower() == "true"
+
+
+@track_processing_time("summarization")
+@limit_stage("summarization")
+@track_memory("summarization")
+def summarize_transcript(transcript: str, metadata: Optional[Dict[str, Any]] = None,
+                         store: bool = True) -> Dict[str, Any]:
+    """Summarize a transcript and, if `store`, save it as a note"""
+    _logger().info("Starting summarization...")
+    prompt_transcript = transcript
+    if NORMALIZE_TRANSCRIPTS:
+        normalized = normalize_transcript(transcript)
+        prompt_transcript = normalized.text
+        _logger().info(
+            f"Normalized transcript: {normalized.tokens_before} -> {normalized.tokens_after} est. tokens "
+            f"({normalized.reduction:.0%} fewer)"
+        )
+
+    map_reduce = needs_map_reduce(prompt_transcript, MAP_REDUCE_THRESHOLD_TOKENS)
+    with serving_models() as models:
+        if map_reduce:
+            summary = summarize_map_reduce(prompt_transcript)
+        else:
+            summary = _complete(
+                SUMMARY_SYSTEM_PROMPT, f"Please summarize this transcript: {prompt_transcript}",
+                max_tokens=summary_max_tokens(estimate_tokens(prompt_transcript)),
+            )
+    _logger().info("Summarization complete")
 
     # Convert markdown to plain text for copying
     plain_text = markdown_to_plain_text(summary)
 
-    return jsonify(
-        {
-            "transcript": transcript,
-            "summary": summary,
-            "plain_text": plain_text,
-            "status": "success",
-        }
+    note_id = None
+    if store:
+        note_id = _store_note(transcript, summary, plain_text,
+                              {"map_reduce": map_reduce, **_summary_model(models), **(metadata or {})})
+
+    return {
+        "transcript": transcript,
+        "summary": summary,
+        "plain_text": plain_text,
+        "note_id": note_id,
+        "status": "success",
+    }
+
+
+def summarize_or_defer(transcript: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Summarize a transcript, or while summarization's circuit is open, save it
+    without a summary (for backfill_summaries) and return it straight away"""
+    try:
+        if circuit_breaker("summarization").allows_calls():
+            return summarize_transcript(transcript, metadata)
+        retry_after_s = circuit_breaker("summarization").retry_after_s()
+    except CircuitOpen as e:
+        retry_after_s = e.retry_after_s
+    _logger().warning("Summarization unavailable, returning the transcript only")
+    note_id = _store_note(transcript, "", "", {"summary_pending": True, **(metadata or {})}, index=False)
+    return {
+        "transcript": transcript,
+        "summary": "",
+        "plain_text": "",
+        "note_id": note_id,
+        "status": "summary_pending",
+        "retry_after_s": round(retry_after_s, 1),
+    }
+
+
+def backfill_summaries(limit: int = 20) -> Dict[str, int]:
+    """Summarize notes saved while summarization was unavailable, oldest first;
+    stops early if the circuit opens again"""
+    store = get_note_store()
+    done = failed = 0
+    for note in store.pending_summaries(limit):
+        try:
+            with serving_models() as models:
+                result = summarize_transcript(note.transcript, store=False)
+        except CircuitOpen:
+            break
+        except Exception as e:
+            _logger().error(f"Failed to backfill summary for note {note.id}: {str(e)}")
+            failed += 1
+            continue
+        metadata = {key: value for key, value in note.metadata.items() if key != "summary_pending"}
+        store.update_summary(note.id, result["summary"], result["plain_text"],
+                             {**metadata, **_summary_model(models), "backfilled": True})
+        index_note(note.id, note.transcript, result["summary"])
+        done += 1
+    return {"backfilled": done, "failed": failed, "pending": store.count_pending_summaries()}
+
+
+def _store_note(transcript: str, summary: str, plain_text: str, metadata: Dict[str, Any],
+                index: bool = True) -> Optional[str]:
+    try:
+        note = get_note_store().save(
+            transcript, summary, plain_text, metadata=metadata, owner=current_owner(),
+        )
+    except Exception as e:
+        # Persistence is best-effort; the caller still gets the summary
+        _logger().error(f"Failed to store note: {str(e)}")
+        return None
+    if index:
+        try:
+            index_note(note.id, transcript, summary)
+        except Exception as e:
+            # The note is saved either way; it only goes missing from related notes
+            _logger().error(f"Failed to index note {note.id}: {str(e)}")
+    return note.id
+
+
+def _prompt_copy(transcript: str) -> str:
+    """The transcript as sent to the model: normalized unless TRANSCRIPT_NORMALIZE is off"""
+    return normalize_transcript(transcript).text if NORMALIZE_TRANSCRIPTS else transcript
+
+
+@track_processing_time("segment folding")
+@limit_stage("summarization")
+@track_memory("summarization")
+def fold_segment(notes: str, segment_transcript: str) -> str:
+    """Running notes updated with the next segment of a recording in progress"""
+    if not notes:
+        return _complete(CHUNK_SYSTEM_PROMPT, _prompt_copy(segment_transcript), max_tokens=NOTES_MAX_TOKENS)
+    return _complete(
+        ROLLING_SYSTEM_PROMPT,
+        f"Notes so far:\n{notes}\n\nNext part of the transcript:\n{_prompt_copy(segment_transcript)}",
+        max_tokens=NOTES_MAX_TOKENS,
+    )
+
+
+@track_processing_time("summarization")
+@limit_stage("summarization")
+@track_memory("summarization")
+def summarize_from_notes(notes: str, last_segment: str, transcript: str,
+                         metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Final summary from the running notes plus the last segment, saved as a note.
+
+    The prompt holds the (bounded) notes and one segment, so this costs the
+    same however long the recording was.
+    """
+    sections = [f"Notes on the recording so far:\n{notes}"] if notes else []
+    if last_segment:
+        sections.append(f"Transcript of its last part:\n{_prompt_copy(last_segment)}")
+    with serving_models() as models:
+        summary = _complete(
+            SUMMARY_SYSTEM_PROMPT, "Please summarize this recording from:\n\n" + "\n\n".join(sections),
+            max_tokens=summary_max_tokens(estimate_tokens(transcript)),
+        )
+    plain_text = markdown_to_plain_text(summary)
+    note_id = _store_note(transcript, summary, plain_text,
+                          {"incremental": True, **_summary_model(models), **(metadata or {})})
+    return {
+        "transcript": transcript,
+        "summary": summary,
+        "plain_text": plain_text,
+        "note_id": note_id,
+        "status": "success",
+    }
+
+
+def process_with_LLM(transcript: str, metadata: Optional[Dict[str, Any]] = None) -> Response:
+    return jsonify(summarize_or_defer(transcript, metadata))
+
+
+def index_note(note_id: str, transcript: str, summary: str) -> None:
+    """Embed a stored note and append it to the similarity index"""
+    vector = get_embedder(client).embed([note_text(transcript, summary)])[0]
+    get_vector_index(client).add(note_id, vector)
+
+
+def summarize_map_reduce(transcript: str) -> str:
+    """Summarize long transcripts chunk by chunk, then merge the partial summaries"""
+    _logger().info(f"Using map-reduce summarization ({estimate_tokens(transcript)} est. tokens)")
+    # Map calls run on pool threads, so each one's serving model is kept per thread
+    served = threading.local()
+
+    def summarize_chunk(chunk: str) -> str:
+        with serving_models() as models:
+            summary = _complete(CHUNK_SYSTEM_PROMPT, chunk, max_tokens=summary_max_tokens(estimate_tokens(chunk)))
+        served.model = models[-1] if models else expected_model
+        return summary
+
+    def reduce(partials: List[str]) -> str:
+        sections = "\n\n".join(f"Part {i + 1}:\n{partial}" for i, partial in enumerate(partials))
+        return _complete(
+            SUMMARY_SYSTEM_PROMPT,
+            f"Please summarize this transcript from these notes on its consecutive parts:\n\n{sections}",
+            max_tokens=summary_max_tokens(estimate_tokens(transcript)),
+        )
+
+    def namespace(model: str) -> str:
+        return hashlib.sha256(f"{model}\0{CHUNK_SYSTEM_PROMPT}".encode()).hexdigest()
+
+    # Reuse chunk summaries from the model chunks would be routed to now; new
+    # ones are filed under the model that actually wrote them
+    expected_model = get_model_router().rank(
+        estimate_tokens(CHUNK_SYSTEM_PROMPT) + CHUNK_TOKENS, summary_max_tokens(CHUNK_TOKENS)
+    )[0]
+    return map_reduce_summary(
+        transcript, summarize_chunk, reduce, CHUNK_TOKENS,
+        max_workers=MAP_WORKERS, cache=get_chunk_cache(), namespace=namespace(expected_model),
+        cache_namespace=lambda: namespace(served.model),
+    )
+
+
+# The model lists of the serving_models() blocks a completion is made in
+_serving: ContextVar[Tuple[List[str], ...]] = ContextVar("serving_models", default=())
+
+
+@contextmanager
+def serving_models() -> Iterator[List[str]]:
+    """Collect the models that actually serve the completions made inside, last one last"""
+    models: List[str] = []
+    token = _serving.set(_serving.get() + (models,))
+    try:
+        yield models
+    finally:
+        _serving.reset(token)
+
+
+def _summary_model(models: List[str]) -> Dict[str, str]:
+    """Note metadata naming the model that wrote the summary (the last call's)"""
+    return {"summary_model": models[-1]} if models else {}
+
+
+def _complete(system_prompt: str, user_content: str, max_tokens: int) -> str:
+    router = get_model_router()
+    candidates = router.candidates(estimate_tokens(system_prompt + user_content), max_tokens)
+    attempts = itertools.count()
+
+    def attempt(timeout: float) -> Any:
+        # Each retry (or hedge) moves down the candidates, staying on the last;
+        # a model out of local rate-limit budget is skipped straight away
+        while True:
+            index = min(next(attempts), len(candidates) - 1)
+            model = candidates[index]
+            if index:
+                MODEL_FALLBACKS.labels(from_model=candidates[index - 1], to_model=model).inc()
+            started = time.monotonic()
+            try:
+                response = _request_completion(model, system_prompt, user_content, max_tokens, timeout)
+            except RateLimited:
+                if index == len(candidates) - 1:
+                    raise
+                continue
+            except Exception as e:
+                router.record(model, time.monotonic() - started, error=is_retryable(e))
+                raise
+            router.record(model, time.monotonic() - started, error=False)
+            return model, response
+
+    model, response = call_with_resilience("summarization", attempt, summarization_policy)
+    for models in _serving.get():
+        models.append(model)
+    return response.choices[0].message.content
+
+
+def _request_completion(model: str, system_prompt: str, user_content: str, max_tokens: int,
+                        timeout: float) -> Any:
+    # Charge the prompt plus the full completion allowance up front
+    acquire_model_budget(model, estimate_tokens(system_prompt + user_content) + max_tokens)
+    return client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        max_tokens=max_tokens,
+        temperature=0.3,
+        timeout=timeout,
     )
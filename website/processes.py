@@ -0,0 +1,17 @@
+"""
+Process identity for pod-shared state
+A pid alone does not identify a worker once pids are reused (e.g. after a
+container restart in the same pod), so state shared between workers records
+the pid together with the process start time
+"""
+
+
+def process_start(pid: int) -> str:
+    """When the process started, in clock ticks after boot (/proc/<pid>/stat field 22); "" if unknown"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return ""
+    # Fields after the parenthesised command name start at field 3
+    return stat.rsplit(")", 1)[1].split()[19]
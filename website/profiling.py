@@ -0,0 +1,246 @@
+"""
+Opt-in per-request profiling
+A sampling profiler that walks the request thread's stack on a timer and
+writes collapsed-stack or speedscope files. Requests opt in with the
+X-Dicto-Profile header carrying PROFILE_TOKEN, or by random sampling; with
+profiling not configured no hooks are installed at all
+"""
+
+import json
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Dicto-Profile"
+Frame = Tuple[str, str, int]  # (function, file, first line)
+Stack = Tuple[Frame, ...]
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval_s` from a helper thread.
+
+    Only the profiled thread is sampled: work it hands to thread pools (hedged
+    upstream calls, map-reduce chunks) shows up as time spent waiting.
+    """
+
+    def __init__(self, thread_id: int, interval_s: float = 0.005):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.samples: Counter = Counter()
+        self.started = 0.0
+        self.duration_s = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dicto-profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration_s = time.perf_counter() - self.started
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[walk_stack(frame)] += 1
+
+
+def walk_stack(frame: Optional[FrameType]) -> Stack:
+    """Root-first stack of (function, file, line) for a frame"""
+    stack: List[Frame] = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def _frame_name(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def to_collapsed(samples: Counter) -> str:
+    """Brendan Gregg's collapsed format, input for flamegraph.pl and speedscope"""
+    lines = [";".join(_frame_name(frame) for frame in stack) + f" {count}"
+             for stack, count in samples.most_common()]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(samples: Counter, name: str, interval_s: float) -> Dict[str, Any]:
+    """speedscope's sampled-profile JSON, weighted in seconds"""
+    frames: List[Dict[str, Any]] = []
+    index: Dict[Frame, int] = {}
+    stacks: List[List[int]] = []
+    weights: List[float] = []
+    for stack, count in samples.items():
+        indices = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            indices.append(index[frame])
+        stacks.append(indices)
+        weights.append(count * interval_s)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": sum(weights),
+            "samples": stacks, "weights": weights,
+        }],
+        "exporter": "dicto",
+    }
+
+
+@dataclass
+class ProfileConfig:
+    directory: str
+    sample_rate: float = 0.0
+    endpoints: Sequence[str] = ("views.process_audio", "views.export_pdf")
+    token: str = ""
+    output_format: str = "speedscope"
+    interval_s: float = 0.005
+    max_files: int = 200
+
+    @classmethod
+    def from_env(cls) -> Optional["ProfileConfig"]:
+        """None unless PROFILE_DIR is set"""
+        directory = os.getenv("PROFILE_DIR")
+        if not directory:
+            return None
+        return cls(
+            directory=directory,
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            endpoints=[endpoint for endpoint in
+                       os.getenv("PROFILE_ENDPOINTS", "views.process_audio,views.export_pdf").split(",") if endpoint],
+            token=os.getenv("PROFILE_TOKEN", ""),
+            output_format=os.getenv("PROFILE_FORMAT", "speedscope"),
+            interval_s=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            max_files=int(os.getenv("PROFILE_MAX_FILES", "200")),
+        )
+
+    def wants(self, header: Optional[str], endpoint: Optional[str]) -> bool:
+        # Without a token the header is ignored, so anonymous clients can't switch the sampler on
+        if header is not None and self.token and secrets.compare_digest(header, self.token):
+            return True
+        return self.sample_rate > 0 and endpoint in self.endpoints and random.random() < self.sample_rate
+
+
+class ProfileStore:
+    """Profiles on disk: <id>.<format> plus <id>.meta.json, oldest pruned past max_files"""
+
+    def __init__(self, directory: str, max_files: int = 200):
+        # Absolute, since Flask resolves relative send_file paths against the app root
+        self.directory = os.path.abspath(directory)
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, sampler: StackSampler, meta: Dict[str, Any], output_format: str) -> str:
+        now = time.time()
+        # Sortable by creation time, which pruning relies on
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))
+        profile_id = f"{stamp}.{int(now * 1000) % 1000:03d}-{secrets.token_hex(4)}"
+        name = f"{meta.get('method', '')} {meta.get('path', '')}".strip()
+        if output_format == "collapsed":
+            filename, body = f"{profile_id}.collapsed.txt", to_collapsed(sampler.samples)
+        else:
+            filename = f"{profile_id}.speedscope.json"
+            body = json.dumps(to_speedscope(sampler.samples, name, sampler.interval_s))
+        with open(os.path.join(self.directory, filename), "w") as f:
+            f.write(body)
+        meta = {**meta, "id": profile_id, "file": filename, "created": time.time(),
+                "duration_ms": round(sampler.duration_s * 1000, 1),
+                "samples": sum(sampler.samples.values())}
+        with open(os.path.join(self.directory, f"{profile_id}.meta.json"), "w") as f:
+            json.dump(meta, f)
+        self._prune()
+        return profile_id
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        metas = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".meta.json"):
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        metas.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # pruned or half-written by another worker
+        metas.sort(key=lambda meta: meta["created"], reverse=True)
+        return metas[:limit]
+
+    def path(self, filename: str) -> Optional[str]:
+        """Absolute path of a profile file, refusing anything outside the directory"""
+        if os.path.basename(filename) != filename:
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.isfile(path) else None
+
+    def _prune(self) -> None:
+        metas = sorted(
+            (name for name in os.listdir(self.directory) if name.endswith(".meta.json")),
+            reverse=True,
+        )
+        for stale in metas[self.max_files:]:
+            profile_id = stale[: -len(".meta.json")]
+            for name in os.listdir(self.directory):
+                if name.startswith(profile_id):
+                    try:
+                        os.unlink(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+
+
+def install_profiling(app: Flask, config: Optional[ProfileConfig] = None) -> Optional[ProfileStore]:
+    """Register per-request profiling hooks; a no-op unless configured"""
+    config = config or ProfileConfig.from_env()
+    if config is None:
+        return None
+    store = ProfileStore(config.directory, config.max_files)
+    app.extensions["dicto_profiles"] = store
+
+    @app.before_request
+    def start_profile() -> None:
+        if config.wants(request.headers.get(PROFILE_HEADER), request.endpoint):
+            g.profiler = StackSampler(threading.get_ident(), config.interval_s).start()
+
+    @app.after_request
+    def finish_profile(response: Response) -> Response:
+        sampler = g.pop("profiler", None)
+        if sampler is not None:
+            sampler.stop()
+            try:
+                profile_id = store.write(sampler, {
+                    "method": request.method, "path": request.path,
+                    "endpoint": request.endpoint, "status": response.status_code,
+                }, config.output_format)
+                response.headers["X-Dicto-Profile-Id"] = profile_id
+            except OSError as e:
+                logger.error(f"Failed to write profile: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc: Optional[BaseException]) -> None:
+        sampler = g.pop("profiler", None)
+        if sampler is not None:
+            sampler.stop()
+
+    logger.info(f"Request profiling enabled, writing to {config.directory}")
+    return store
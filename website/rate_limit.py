@@ -0,0 +1,200 @@
+"""
+Cross-worker rate limiting for upstream model calls
+Token buckets for requests/minute and tokens/minute per model, stored in
+SQLite so every gunicorn worker on a pod draws from the same budget
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from prometheus_client import Counter, Histogram
+
+from .admission import Overloaded
+from .model_routing import configured_models
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WAIT = Histogram(
+    "dicto_rate_limit_wait_seconds", "Time queued locally for upstream rate-limit budget", ["model", "kind"],
+    buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60),
+)
+RATE_LIMIT_REJECTED = Counter(
+    "dicto_rate_limit_rejected_total", "Calls rejected because the local wait would be too long", ["model", "kind"]
+)
+
+# Rough English average; used to charge TPM before the call is made
+CHARS_PER_TOKEN = 4
+
+
+class RateLimited(Overloaded):
+    """Raised when waiting for upstream budget would exceed the allowed wait"""
+
+
+@dataclass
+class ModelBudget:
+    rpm: float
+    tpm: float = 0.0  # 0 means the model is not limited by tokens
+
+    @classmethod
+    def from_env(cls, model: str, rpm: float, tpm: float = 0.0) -> "ModelBudget":
+        """Read RATE_LIMIT_<MODEL>_RPM / _TPM, e.g. RATE_LIMIT_GPT_4O_MINI_TPM"""
+        prefix = "RATE_LIMIT_" + re.sub(r"[^A-Z0-9]+", "_", model.upper())
+        return cls(
+            rpm=float(os.getenv(f"{prefix}_RPM", rpm)),
+            tpm=float(os.getenv(f"{prefix}_TPM", tpm)),
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBucketLimiter:
+    """Token buckets in a shared SQLite file.
+
+    Acquisition reserves tokens immediately, letting the balance go negative,
+    and the caller sleeps off the deficit. Reservations are therefore served
+    in arrival order across all processes sharing the database.
+    """
+
+    def __init__(self, db_path: str, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.time):
+        self.db_path = db_path
+        self.sleep = sleep
+        self.clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, key: str, cost: float, capacity: float, per_second: float,
+                max_wait_s: float) -> float:
+        """Reserve `cost` tokens and return how long the caller must wait.
+
+        Raises RateLimited (without reserving) if the wait would exceed max_wait_s.
+        """
+        cost = min(cost, capacity)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self.clock()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * per_second)
+            remaining = tokens - cost
+            wait = 0.0 if remaining >= 0 else -remaining / per_second
+            if wait > max_wait_s:
+                conn.execute("ROLLBACK")
+                raise RateLimited(key, wait, "upstream_budget")
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, remaining, now),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def refund(self, key: str, cost: float, capacity: float) -> None:
+        """Give back a reservation that was not used"""
+        self._connect().execute(
+            "UPDATE buckets SET tokens = min(?, tokens + ?) WHERE key = ?", (capacity, min(cost, capacity), key)
+        )
+
+    def acquire(self, key: str, cost: float, capacity: float, per_second: float,
+                max_wait_s: float) -> float:
+        wait = self.reserve(key, cost, capacity, per_second, max_wait_s)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class ModelRateLimiter:
+    """Applies per-model RPM/TPM budgets on top of a shared TokenBucketLimiter"""
+
+    def __init__(self, limiter: TokenBucketLimiter, budgets: Dict[str, ModelBudget], max_wait_s: float):
+        self.limiter = limiter
+        self.budgets = budgets
+        self.max_wait_s = max_wait_s
+
+    def acquire(self, model: str, tokens: int = 0) -> float:
+        """Wait for one request (and `tokens` tokens) of the model's budget.
+
+        Both buckets are reserved before any waiting; if the second rejects the
+        call, the first reservation is refunded so rejected calls cost nothing.
+        """
+        budget = self.budgets.get(model)
+        if budget is None:
+            return 0.0
+
+        waited = 0.0
+        reserved = []
+        for kind, cost, per_minute in (("requests", 1, budget.rpm), ("tokens", tokens, budget.tpm)):
+            if per_minute <= 0 or cost <= 0:
+                continue
+            try:
+                wait = self.limiter.reserve(
+                    f"{model}:{kind}", cost, capacity=per_minute, per_second=per_minute / 60,
+                    max_wait_s=self.max_wait_s - waited,
+                )
+            except RateLimited:
+                RATE_LIMIT_REJECTED.labels(model=model, kind=kind).inc()
+                for key, reserved_cost, capacity in reserved:
+                    self.limiter.refund(key, reserved_cost, capacity)
+                raise
+            reserved.append((f"{model}:{kind}", cost, per_minute))
+            RATE_LIMIT_WAIT.labels(model=model, kind=kind).observe(wait)
+            waited += wait
+        if waited > 0:
+            logger.info(f"Queued {waited:.2f}s for {model} rate-limit budget")
+            self.limiter.sleep(waited)
+        return waited
+
+
+_model_limiter: Optional[ModelRateLimiter] = None
+_model_limiter_lock = threading.Lock()
+
+
+def get_model_limiter() -> Optional[ModelRateLimiter]:
+    """Process-wide limiter, or None when RATE_LIMIT_ENABLED is false"""
+    global _model_limiter
+    if os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "true":
+        return None
+    with _model_limiter_lock:
+        if _model_limiter is None:
+            db_path = os.getenv(
+                "RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "dicto_rate_limit.sqlite3")
+            )
+            budgets = {
+                "whisper-1": ModelBudget.from_env("whisper-1", rpm=50),
+                "gpt-4o-mini": ModelBudget.from_env("gpt-4o-mini", rpm=500, tpm=200_000),
+            }
+            for model in configured_models():
+                budgets.setdefault(model.name, ModelBudget.from_env(model.name, rpm=500, tpm=200_000))
+            _model_limiter = ModelRateLimiter(
+                TokenBucketLimiter(db_path), budgets, float(os.getenv("RATE_LIMIT_MAX_WAIT_S", "30"))
+            )
+        return _model_limiter
+
+
+def acquire_model_budget(model: str, tokens: int = 0) -> float:
+    limiter = get_model_limiter()
+    return limiter.acquire(model, tokens) if limiter else 0.0
@@ -0,0 +1,151 @@
+"""
+Recording sessions for incremental summarization
+While a long recording is still going, the client uploads it in segments;
+each segment's transcript is folded into running notes kept here, so when
+recording stops only the last segment and a short final call remain.
+Stored in SQLite next to the notes, so consecutive segments can land on
+any worker. Like notes, each session belongs to the owner that started it
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+class SessionNotFound(Exception):
+    """The session id is in use by another owner's recording"""
+
+
+class SegmentOutOfOrder(Exception):
+    """A segment arrived before the ones it follows were folded in"""
+
+    def __init__(self, expected_seq: int):
+        super().__init__(f"Expected segment {expected_seq}")
+        self.expected_seq = expected_seq
+
+
+@dataclass
+class RecordingSession:
+    id: str
+    next_seq: int
+    notes: str
+    transcript: str
+    created: float
+    updated: float
+
+
+class RecordingSessionStore:
+    """Running notes and transcript per in-progress recording.
+
+    Segments are applied strictly in order with a compare-and-set on
+    next_seq, so a retried or duplicated segment is never folded twice.
+    Sessions idle for longer than ttl_s (abandoned recordings) are dropped.
+    With `owner`, lookups only see that owner's sessions.
+    """
+
+    def __init__(self, db_path: str, ttl_s: float = 6 * 3600, clock: Callable[[], float] = time.time):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS recording_sessions ("
+            " id TEXT PRIMARY KEY, next_seq INTEGER NOT NULL, notes TEXT NOT NULL,"
+            " transcript TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL,"
+            " owner TEXT NOT NULL DEFAULT '')"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(recording_sessions)")]
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE recording_sessions ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str, owner: Optional[str] = None) -> Optional[RecordingSession]:
+        row = self._connect().execute(
+            "SELECT id, next_seq, notes, transcript, created, updated, owner FROM recording_sessions"
+            " WHERE id = ? AND updated >= ?",
+            (session_id, self.clock() - self.ttl_s),
+        ).fetchone()
+        if row is None or (owner is not None and row[6] != owner):
+            return None
+        return RecordingSession(*row[:6])
+
+    def check_next(self, session_id: str, seq: int, owner: Optional[str] = None) -> Optional[RecordingSession]:
+        """The session if seq is the segment it expects next (None for a new session at 0).
+
+        Raises SessionNotFound if the id belongs to another owner's session.
+        """
+        session = self.get(session_id, owner=owner)
+        if session is None and owner is not None and self.get(session_id) is not None:
+            raise SessionNotFound(session_id)
+        expected = session.next_seq if session else 0
+        if seq != expected:
+            raise SegmentOutOfOrder(expected)
+        return session
+
+    def append(self, session_id: str, seq: int, segment_transcript: str, notes: str,
+               owner: str = "") -> RecordingSession:
+        """Record segment seq's transcript and the notes that now include it.
+
+        Raises SessionNotFound if the id belongs to another owner's session.
+        """
+        conn = self._connect()
+        now = self.clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM recording_sessions WHERE updated < ?", (now - self.ttl_s,))
+            row = conn.execute(
+                "SELECT next_seq, transcript, created, owner FROM recording_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is not None and row[3] != owner:
+                conn.execute("COMMIT")
+                raise SessionNotFound(session_id)
+            expected, transcript, created = row[:3] if row else (0, "", now)
+            if seq != expected:
+                conn.execute("COMMIT")
+                raise SegmentOutOfOrder(expected)
+            transcript = f"{transcript} {segment_transcript}".strip()
+            conn.execute(
+                "INSERT OR REPLACE INTO recording_sessions"
+                " (id, next_seq, notes, transcript, created, updated, owner) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, seq + 1, notes, transcript, created, now, owner),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return RecordingSession(session_id, seq + 1, notes, transcript, created, now)
+
+    def delete(self, session_id: str, owner: Optional[str] = None) -> None:
+        if owner is None:
+            self._connect().execute("DELETE FROM recording_sessions WHERE id = ?", (session_id,))
+        else:
+            self._connect().execute(
+                "DELETE FROM recording_sessions WHERE id = ? AND owner = ?", (session_id, owner)
+            )
+
+
+_sessions: Optional[RecordingSessionStore] = None
+_sessions_lock = threading.Lock()
+
+
+def get_session_store() -> RecordingSessionStore:
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            db_path = os.getenv(
+                "RECORDING_SESSION_DB", os.path.join(os.getenv("DICTO_DATA_DIR", "data"), "sessions.sqlite3")
+            )
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            _sessions = RecordingSessionStore(db_path, ttl_s=float(os.getenv("RECORDING_SESSION_TTL_S", "21600")))
+        return _sessions
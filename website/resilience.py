@@ -0,0 +1,405 @@
+"""
+Resilience layer for upstream API calls
+Per-call deadlines, jittered exponential backoff that honours Retry-After,
+optional hedged requests for latency stragglers, and a circuit breaker per
+upstream that fails fast while it is down
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+import openai
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_RETRIES = Counter(
+    "dicto_upstream_retries_total", "Retried upstream API attempts", ["call", "reason"]
+)
+UPSTREAM_HEDGES = Counter(
+    "dicto_upstream_hedges_total", "Hedged upstream requests fired", ["call"]
+)
+UPSTREAM_HEDGE_WINS = Counter(
+    "dicto_upstream_hedge_wins_total", "Hedged races won, by which request finished first", ["call", "winner"]
+)
+UPSTREAM_LATENCY = Histogram(
+    "dicto_upstream_call_seconds", "Upstream API call latency including retries", ["call", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+
+CIRCUIT_STATE = Gauge(
+    "dicto_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)", ["call"]
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "dicto_circuit_transitions_total", "Upstream circuit breaker state changes, by new state", ["call", "state"]
+)
+CIRCUIT_REJECTED = Counter(
+    "dicto_circuit_rejected_total", "Upstream calls failed fast because the circuit was open", ["call"]
+)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_hedge_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("HEDGE_POOL_SIZE", "8")), thread_name_prefix="hedge"
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an upstream call cannot finish within its deadline"""
+
+
+class AttemptTimeout(TimeoutError):
+    """Raised when one (hedged) attempt outlives its per-attempt timeout; retried
+    like a client timeout while the overall deadline allows"""
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, call: str, retry_after_s: float):
+        super().__init__(f"{call} is unavailable, retry in {retry_after_s:.0f}s")
+        self.call = call
+        self.retry_after_s = retry_after_s
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, int(self.retry_after_s + 0.999)))
+
+
+@dataclass
+class RetryPolicy:
+    deadline_s: float = 120.0
+    attempt_timeout_s: float = 60.0
+    max_retries: int = 3
+    backoff_base_s: float = 0.5
+    backoff_max_s: float = 8.0
+    hedge_percentile: float = 0.0  # 0 disables hedging
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_env(cls, name: str, **defaults: Any) -> "RetryPolicy":
+        """Build a policy from <NAME>_DEADLINE_S, <NAME>_MAX_RETRIES, ... env vars"""
+        policy = cls(**defaults)
+        prefix = name.upper()
+        for attr, cast in (
+            ("deadline_s", float),
+            ("attempt_timeout_s", float),
+            ("max_retries", int),
+            ("backoff_base_s", float),
+            ("backoff_max_s", float),
+            ("hedge_percentile", float),
+            ("hedge_min_samples", int),
+        ):
+            value = os.getenv(f"{prefix}_{attr.upper()}")
+            if value is not None:
+                setattr(policy, attr, cast(value))
+        return policy
+
+
+class LatencyWindow:
+    """Sliding window of recent successful attempt latencies"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(pct / 100 * len(ordered)))
+        return ordered[index]
+
+
+_windows: Dict[str, LatencyWindow] = {}
+_windows_lock = threading.Lock()
+
+
+def latency_window(call: str) -> LatencyWindow:
+    with _windows_lock:
+        if call not in _windows:
+            _windows[call] = LatencyWindow()
+        return _windows[call]
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over the last `window` calls to one upstream.
+
+    Opens once at least min_calls of the window were seen and failure_rate
+    of them failed (calls slower than slow_call_s count as failures too).
+    While open, calls are rejected without touching the network; after
+    reset_timeout_s one probe call is let through (half-open), closing the
+    circuit if it succeeds and reopening it if it fails. State is per worker.
+    """
+
+    def __init__(self, call: str, failure_rate: float = 0.5, min_calls: int = 5, window: int = 20,
+                 reset_timeout_s: float = 30.0, slow_call_s: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.call = call
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout_s = reset_timeout_s
+        self.slow_call_s = slow_call_s  # 0 disables
+        self.clock = clock
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(call=call).set(0)
+
+    @classmethod
+    def from_env(cls, call: str, **defaults: Any) -> "CircuitBreaker":
+        """Build a breaker from <CALL>_BREAKER_FAILURE_RATE, <CALL>_BREAKER_MIN_CALLS, ... env vars"""
+        prefix = f"{call.upper()}_BREAKER"
+        for attr, cast in (
+            ("failure_rate", float),
+            ("min_calls", int),
+            ("window", int),
+            ("reset_timeout_s", float),
+            ("slow_call_s", float),
+        ):
+            value = os.getenv(f"{prefix}_{attr.upper()}")
+            if value is not None:
+                defaults[attr] = cast(value)
+        return cls(call, **defaults)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        CIRCUIT_STATE.labels(call=self.call).set(_STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(call=self.call, state=state).inc()
+        log = logger.warning if state == OPEN else logger.info
+        log(f"{self.call} circuit {state.replace('_', '-')}")
+
+    def before_call(self) -> None:
+        """Raise CircuitOpen unless a call may go out now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            waited = self.clock() - self._opened_at
+            if self.state == OPEN and waited >= self.reset_timeout_s:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            CIRCUIT_REJECTED.labels(call=self.call).inc()
+            raise CircuitOpen(self.call, max(0.0, self.reset_timeout_s - waited))
+
+    def record(self, success: bool, duration_s: float = 0.0) -> None:
+        """Outcome of a call let through by before_call"""
+        if success and self.slow_call_s and duration_s > self.slow_call_s:
+            success = False
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures >= self.failure_rate * len(self._outcomes)):
+                self._open()
+
+    def _open(self) -> None:
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self._transition(OPEN)
+
+    def allows_calls(self) -> bool:
+        """Whether a call now would go out (without claiming the half-open probe)"""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() - self._opened_at >= self.reset_timeout_s
+            return self.state == CLOSED or not self._probing
+
+    def retry_after_s(self) -> float:
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(0.0, self.reset_timeout_s - (self.clock() - self._opened_at))
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(call: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if call not in _breakers:
+            _breakers[call] = CircuitBreaker.from_env(call)
+        return _breakers[call]
+
+
+def circuit_states() -> Dict[str, str]:
+    """State of every upstream circuit this worker has used"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.call: breaker.state for breaker in breakers}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, (openai.APIConnectionError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the upstream asked us to wait, from retry-after-ms or Retry-After"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # HTTP-date form of Retry-After; fall back to our own backoff
+        return None
+    return None
+
+
+def backoff_delay(attempt: int, policy: RetryPolicy, rng: Callable[[float, float], float] = random.uniform) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry"""
+    ceiling = min(policy.backoff_max_s, policy.backoff_base_s * (2 ** attempt))
+    return rng(0, ceiling)
+
+
+def _hedged_attempt(call: str, fn: Callable[[float], Any], timeout: float, policy: RetryPolicy) -> Any:
+    """Run fn, firing a duplicate if it outlives the configured latency percentile.
+
+    Sync HTTP calls cannot be interrupted, so the losing request is abandoned
+    rather than killed; its own per-attempt timeout bounds how long it lingers.
+    """
+    window = latency_window(call)
+    hedge_after = window.percentile(policy.hedge_percentile)
+    started = time.monotonic()
+
+    primary = _hedge_pool.submit(fn, timeout)
+    done, _ = wait([primary], timeout=min(hedge_after, timeout))
+    if done:
+        result = primary.result()
+        window.record(time.monotonic() - started)
+        return result
+
+    UPSTREAM_HEDGES.labels(call=call).inc()
+    remaining = max(0.0, timeout - (time.monotonic() - started))
+    hedge = _hedge_pool.submit(fn, remaining)
+    racers: Dict[Future, str] = {primary: "primary", hedge: "hedge"}
+    pending = set(racers)
+    first_error: Optional[BaseException] = None
+
+    while pending:
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()
+                UPSTREAM_HEDGE_WINS.labels(call=call, winner=racers[future]).inc()
+                window.record(time.monotonic() - started)
+                return future.result()
+            first_error = first_error or future.exception()
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+
+    if first_error is not None:
+        raise first_error
+    raise AttemptTimeout(f"{call} attempt exceeded {timeout:.1f}s")
+
+
+def call_with_resilience(
+    call: str,
+    fn: Callable[[float], Any],
+    policy: RetryPolicy,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
+    """Call fn(timeout) with retries, backoff, an overall deadline and optional hedging,
+    behind the call's circuit breaker (raises CircuitOpen while it is open).
+
+    fn receives the per-attempt timeout in seconds and must be safe to call
+    concurrently (each call should open its own file handles).
+    """
+    breaker = circuit_breaker(call)
+    breaker.before_call()
+    started = time.monotonic()
+    try:
+        result = _call_with_retries(call, fn, policy, sleep)
+    except Exception as e:
+        # Our own bad requests say nothing about the upstream's health
+        breaker.record(not (is_retryable(e) or isinstance(e, DeadlineExceeded)), time.monotonic() - started)
+        raise
+    breaker.record(True, time.monotonic() - started)
+    return result
+
+
+def _call_with_retries(
+    call: str,
+    fn: Callable[[float], Any],
+    policy: RetryPolicy,
+    sleep: Callable[[float], None],
+) -> Any:
+    started = time.monotonic()
+    deadline = started + policy.deadline_s
+    attempt = 0
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            UPSTREAM_LATENCY.labels(call=call, outcome="deadline").observe(time.monotonic() - started)
+            raise DeadlineExceeded(f"{call} exceeded its {policy.deadline_s:.0f}s deadline")
+        timeout = min(policy.attempt_timeout_s, remaining)
+
+        attempt_start = time.monotonic()
+        try:
+            if policy.hedge_percentile > 0 and len(latency_window(call)) >= policy.hedge_min_samples:
+                result = _hedged_attempt(call, fn, timeout, policy)
+            else:
+                result = fn(timeout)
+                latency_window(call).record(time.monotonic() - attempt_start)
+            UPSTREAM_LATENCY.labels(call=call, outcome="success").observe(time.monotonic() - started)
+            return result
+        except Exception as e:
+            if not is_retryable(e) or attempt >= policy.max_retries:
+                UPSTREAM_LATENCY.labels(call=call, outcome="error").observe(time.monotonic() - started)
+                raise
+
+            delay = max(backoff_delay(attempt, policy), retry_after(e) or 0.0)
+            if time.monotonic() + delay >= deadline:
+                UPSTREAM_LATENCY.labels(call=call, outcome="deadline").observe(time.monotonic() - started)
+                raise DeadlineExceeded(
+                    f"{call} failed and retrying in {delay:.1f}s would pass its deadline"
+                ) from e
+
+            reason = str(getattr(e, "status_code", None) or type(e).__name__)
+            UPSTREAM_RETRIES.labels(call=call, reason=reason).inc()
+            logger.warning(f"{call} attempt {attempt + 1} failed ({reason}), retrying in {delay:.2f}s")
+            sleep(delay)
+            attempt += 1
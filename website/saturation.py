@@ -0,0 +1,205 @@
+"""
+Pod saturation for autoscaling
+Every worker publishes its pipeline and per-stage occupancy into its own
+slot of a small shared-memory file; any worker can sum the slots into one
+pod-wide saturation figure for /metrics and /autoscaling
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from prometheus_client import Gauge
+
+from .processes import process_start
+
+HEADER = struct.Struct("<qqi")  # pid, its start time (clock ticks after boot, 0 if unknown), pipelines in flight
+STAGE_FIELDS = struct.Struct("<iii")  # in flight, queued, capacity
+
+
+class SaturationBoard:
+    """Per-worker slots of occupancy counters in a shared mmap.
+
+    Each worker writes only its own slot, so updates are plain stores with
+    no locking; the file lock is taken only to claim a slot. Slots of
+    workers that have exited are ignored on read and reused on claim; a slot
+    whose pid now belongs to a process started at another time (pid reuse
+    after a container restart) counts as exited.
+    """
+
+    def __init__(self, path: str, capacities: Dict[str, int], max_workers: int = 64):
+        self.path = path
+        # Each worker's concurrency per stage, written into its slot when claimed
+        self.capacities = dict(capacities)
+        self.stages = list(capacities)
+        self.max_workers = max_workers
+        self.slot_size = HEADER.size + STAGE_FIELDS.size * len(self.stages)
+        self._lock = threading.Lock()
+        self._pid = 0
+        self._start = 0
+        self._offset = -1
+        self._pipelines = 0
+        self._map: Optional[mmap.mmap] = None
+
+    def _mapped(self) -> mmap.mmap:
+        """The shared map, with this process's slot claimed (again, after a fork)"""
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        size = self.slot_size * self.max_workers
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            shared = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+            self._start = int(process_start(self._pid) or 0)
+            self._pipelines = 0
+            self._offset = self._claim(shared)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        self._map = shared
+        return shared
+
+    def _claim(self, shared: mmap.mmap) -> int:
+        free = -1
+        for slot in range(self.max_workers):
+            offset = slot * self.slot_size
+            pid, start, _ = HEADER.unpack_from(shared, offset)
+            if pid == self._pid:
+                free = offset
+                break
+            if free < 0 and not _alive(pid, start):
+                free = offset
+        if free < 0:
+            raise RuntimeError(f"No free saturation slot in {self.path} ({self.max_workers} workers)")
+        shared[free:free + self.slot_size] = bytes(self.slot_size)
+        HEADER.pack_into(shared, free, self._pid, self._start, 0)
+        for i, stage in enumerate(self.stages):
+            STAGE_FIELDS.pack_into(shared, free + HEADER.size + STAGE_FIELDS.size * i, 0, 0, self.capacities[stage])
+        return free
+
+    def join(self) -> None:
+        """Claim this worker's slot so its capacity counts before it runs a stage"""
+        with self._lock:
+            self._mapped()
+
+    def update_stage(self, stage: str, in_flight: int, queued: int) -> None:
+        if stage not in self.capacities:
+            return
+        with self._lock:
+            shared = self._mapped()
+            offset = self._offset + HEADER.size + STAGE_FIELDS.size * self.stages.index(stage)
+            STAGE_FIELDS.pack_into(shared, offset, in_flight, queued, self.capacities[stage])
+
+    def add_pipelines(self, delta: int) -> None:
+        with self._lock:
+            shared = self._mapped()
+            self._pipelines += delta
+            HEADER.pack_into(shared, self._offset, self._pid, self._start, self._pipelines)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pod-wide occupancy; saturation is the busiest stage's (in flight + queued) / capacity"""
+        with self._lock:
+            shared = self._mapped()
+            raw = shared[:]
+        stages = {stage: {"in_flight": 0, "queued": 0, "capacity": 0} for stage in self.stages}
+        workers = pipelines = 0
+        for slot in range(self.max_workers):
+            offset = slot * self.slot_size
+            pid, start, slot_pipelines = HEADER.unpack_from(raw, offset)
+            if not _alive(pid, start):
+                continue
+            workers += 1
+            pipelines += slot_pipelines
+            for i, stage in enumerate(self.stages):
+                in_flight, queued, capacity = STAGE_FIELDS.unpack_from(
+                    raw, offset + HEADER.size + STAGE_FIELDS.size * i
+                )
+                stages[stage]["in_flight"] += in_flight
+                stages[stage]["queued"] += queued
+                stages[stage]["capacity"] += capacity
+        for stats in stages.values():
+            stats["saturation"] = round((stats["in_flight"] + stats["queued"]) / stats["capacity"], 4) \
+                if stats["capacity"] else 0.0
+        return {
+            "saturation": max((stats["saturation"] for stats in stages.values()), default=0.0),
+            "workers": workers,
+            "pipelines_in_flight": pipelines,
+            "queued": sum(stats["queued"] for stats in stages.values()),
+            "stages": stages,
+        }
+
+
+def _alive(pid: int, start: int) -> bool:
+    """Whether the worker that wrote a slot still runs; a reused pid with another start time does not count"""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return not start or int(process_start(pid) or 0) in (start, 0)
+
+
+def track_pipeline(func: Callable) -> Callable:
+    """Decorator counting the wrapped view as one pipeline in flight"""
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        board = get_saturation_board()
+        board.add_pipelines(1)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            board.add_pipelines(-1)
+    return wrapper
+
+
+def pod_snapshot() -> Dict[str, Any]:
+    """Board occupancy plus the decode memory budget, which is already pod-wide"""
+    from .memory_budget import get_decode_budget
+
+    snapshot = get_saturation_board().snapshot()
+    budget = get_decode_budget()
+    memory = round(budget.reserved() / budget.capacity_bytes, 4) if budget.capacity_bytes else 0.0
+    snapshot["decode_memory"] = memory
+    snapshot["saturation"] = max(snapshot["saturation"], memory)
+    return snapshot
+
+
+POD_SATURATION = Gauge(
+    "dicto_pod_saturation", "Busiest stage's (in flight + queued) / capacity across this pod's workers; scale on this"
+)
+POD_SATURATION.set_function(lambda: pod_snapshot()["saturation"])
+POD_PIPELINES = Gauge("dicto_pod_pipelines_in_flight", "Audio pipelines running across this pod's workers")
+POD_PIPELINES.set_function(lambda: get_saturation_board().snapshot()["pipelines_in_flight"])
+POD_QUEUED = Gauge("dicto_pod_queued", "Requests waiting for a stage slot across this pod's workers")
+POD_QUEUED.set_function(lambda: get_saturation_board().snapshot()["queued"])
+
+
+_board: Optional[SaturationBoard] = None
+_board_lock = threading.Lock()
+
+
+def get_saturation_board() -> SaturationBoard:
+    global _board
+    with _board_lock:
+        if _board is None:
+            from .admission import stage_limiters
+
+            # /dev/shm keeps the counters in memory; any pod-local path works
+            default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            _board = SaturationBoard(
+                os.getenv("SATURATION_FILE", os.path.join(default_dir, "dicto_saturation")),
+                capacities={stage: limiter.max_concurrent for stage, limiter in stage_limiters.items()},
+                max_workers=int(os.getenv("SATURATION_MAX_WORKERS", "64")),
+            )
+        return _board
@@ -0,0 +1,310 @@
+"""
+Managed scratch space for temporary audio files
+Every temp file lives in one directory (point it at a tmpfs mount to keep
+audio off disk) under a byte quota shared by the pod's workers. Requests
+reserve their expected usage up front and are shed when it doesn't fit;
+files a request leaves behind are deleted when it ends, and files of dead
+workers or past their maximum age are reaped at startup and on a timer.
+Files are tagged with their worker's pid and process start time, so a pid
+reused after a container restart doesn't keep the old run's files alive
+"""
+
+import fcntl
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from .admission import Overloaded
+from .processes import process_start
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_REJECTED = Counter("dicto_scratch_rejected_total", "Requests shed because the scratch quota was full")
+SCRATCH_REAPED_FILES = Counter("dicto_scratch_reaped_files_total", "Orphaned scratch files deleted by the reaper")
+SCRATCH_REAPED_BYTES = Counter("dicto_scratch_reaped_bytes_total", "Bytes of orphaned scratch files reaped")
+
+MIB = 1024 * 1024
+LOCK_NAME = ".lock"
+RESERVATION_SUFFIX = ".reserve"
+# Reserved when a request doesn't say how big it is
+DEFAULT_RESERVATION_BYTES = 32 * MIB
+
+
+def estimate_scratch_bytes(upload_bytes: Optional[int]) -> int:
+    """Scratch needed for one upload: a spooled copy plus the decoder's output"""
+    if upload_bytes is None:
+        return DEFAULT_RESERVATION_BYTES
+    return 2 * upload_bytes
+
+
+class ScratchFull(Overloaded):
+    """Raised when a request's expected scratch usage does not fit the quota"""
+
+
+@dataclass
+class ScratchUsage:
+    files: int
+    used_bytes: int
+    accounted_bytes: int  # per request, the larger of its reservation and its files
+
+
+class ScratchScope:
+    """One request's reservation and the files it created"""
+
+    def __init__(self, space: "ScratchSpace", key: str, reserved_bytes: int):
+        self.space = space
+        self.key = key
+        self.reserved_bytes = reserved_bytes
+        self.paths: Set[str] = set()
+
+    def new_path(self, suffix: str) -> str:
+        path = self.space._create(f"{_process_tag()}-{self.key}-{len(self.paths)}{suffix}")
+        self.paths.add(path)
+        return path
+
+    def close(self) -> None:
+        """Delete whatever the request did not clean up, then its reservation"""
+        for path in self.paths:
+            _unlink(path)
+        _unlink(self.space._reservation_path(self.key))
+
+
+_current_scope: ContextVar[Optional[ScratchScope]] = ContextVar("scratch_scope", default=None)
+
+
+class ScratchSpace:
+    """Temp files in one directory under a byte quota shared through the filesystem.
+
+    File names start with the owning worker's pid.start-time tag and request key, and a
+    request's reservation is a small file holding its byte count, so any
+    worker can account for the whole directory (under a file lock when
+    admitting) and tell orphans from live files without shared state.
+    """
+
+    def __init__(self, directory: str, quota_bytes: int, max_age_s: float = 3600.0,
+                 reap_interval_s: float = 300.0, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.max_age_s = max_age_s
+        self.reap_interval_s = reap_interval_s  # 0 disables the timer
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._scopes: Dict[str, ScratchScope] = {}
+        self._pid = 0
+        self._reaper: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _reservation_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{_process_tag()}-{key}{RESERVATION_SUFFIX}")
+
+    def _create(self, name: str) -> str:
+        path = os.path.join(self.directory, name)
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        return path
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fd = os.open(os.path.join(self.directory, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _entries(self) -> Iterator[Tuple[os.DirEntry, str, str]]:
+        """(entry, owner process tag, request owner) for every managed file"""
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                tag, _, rest = entry.name.partition("-")
+                if entry.name == LOCK_NAME or not tag.partition(".")[0].isdigit():
+                    continue
+                key = rest.removesuffix(RESERVATION_SUFFIX).split("-")[0]
+                yield entry, tag, f"{tag}-{key}"
+
+    def usage(self) -> ScratchUsage:
+        files = used = 0
+        reserved: Dict[str, int] = {}
+        written: Dict[str, int] = {}
+        for entry, _, owner in self._entries():
+            try:
+                if entry.name.endswith(RESERVATION_SUFFIX):
+                    with open(entry.path) as f:
+                        reserved[owner] = int(f.read() or 0)
+                    continue
+                size = entry.stat().st_size
+            except (FileNotFoundError, ValueError):
+                continue
+            files += 1
+            used += size
+            written[owner] = written.get(owner, 0) + size
+        accounted = sum(max(reserved.get(owner, 0), written.get(owner, 0)) for owner in set(reserved) | set(written))
+        return ScratchUsage(files=files, used_bytes=used, accounted_bytes=accounted)
+
+    def filesystem_free_bytes(self) -> int:
+        stats = os.statvfs(self.directory)
+        return stats.f_bavail * stats.f_frsize
+
+    def admit(self, expected_bytes: int) -> ScratchScope:
+        """Reserve expected_bytes of the quota or raise ScratchFull.
+
+        A request bigger than the whole quota is admitted only into an empty
+        directory, so it can't be refused forever.
+        """
+        self._ensure_reaper()
+        key = secrets.token_hex(6)
+        with self._locked():
+            accounted = self.usage().accounted_bytes
+            if accounted and accounted + expected_bytes > self.quota_bytes:
+                SCRATCH_REJECTED.inc()
+                raise ScratchFull("scratch", 5.0, "scratch_quota")
+            with open(self._reservation_path(key), "w") as f:
+                f.write(str(expected_bytes))
+        scope = ScratchScope(self, key, expected_bytes)
+        with self._lock:
+            self._scopes[key] = scope
+        return scope
+
+    def release(self, scope: ScratchScope) -> None:
+        with self._lock:
+            self._scopes.pop(scope.key, None)
+        scope.close()
+
+    @contextmanager
+    def request_scope(self, expected_bytes: int) -> Iterator[ScratchScope]:
+        """Admit a request; temp files made inside are charged to it and deleted when it ends"""
+        scope = self.admit(expected_bytes)
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _current_scope.reset(token)
+            self.release(scope)
+
+    def new_path(self, suffix: str = "") -> str:
+        """An empty temp file for the current request (or, outside one, for this process)"""
+        scope = _current_scope.get()
+        if scope is not None:
+            return scope.new_path(suffix)
+        self._ensure_reaper()
+        return self._create(f"{_process_tag()}-{secrets.token_hex(6)}{suffix}")
+
+    def reap(self) -> int:
+        """Delete files of exited workers and any older than max_age_s; returns how many"""
+        now = self.clock()
+        with self._lock:
+            live = {f"{_process_tag()}-{key}" for key in self._scopes}
+        reaped: List[Tuple[str, int]] = []
+        for entry, tag, owner in self._entries():
+            if owner in live:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if _alive(tag) and now - stat.st_mtime < self.max_age_s:
+                continue
+            if _unlink(entry.path):
+                reaped.append((entry.name, stat.st_size))
+        if reaped:
+            SCRATCH_REAPED_FILES.inc(len(reaped))
+            SCRATCH_REAPED_BYTES.inc(sum(size for _, size in reaped))
+            logger.info(f"Reaped {len(reaped)} orphaned scratch files from {self.directory}")
+        return len(reaped)
+
+    def _ensure_reaper(self) -> None:
+        """Start the reaper thread in this process (again, after a fork)"""
+        if self.reap_interval_s <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._reaper is not None:
+                return
+            self._pid = os.getpid()
+            self._reaper = threading.Thread(target=self._reap_loop, name="dicto-scratch-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(self.reap_interval_s)
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("Scratch reaper failed")
+
+
+def _unlink(path: str) -> bool:
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+_process_tags: Dict[int, str] = {}
+
+
+def _process_tag() -> str:
+    """This process's file name tag: pid.start-time (just the pid without /proc)"""
+    pid = os.getpid()
+    if pid not in _process_tags:
+        start = process_start(pid)
+        _process_tags[pid] = f"{pid}.{start}" if start else str(pid)
+    return _process_tags[pid]
+
+
+def _alive(tag: str) -> bool:
+    """Whether the process that tagged a file still runs; a reused pid with another start time does not count"""
+    pid_text, _, start = tag.partition(".")
+    pid = int(pid_text)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return not start or process_start(pid) in (start, "")
+
+
+SCRATCH_USED = Gauge("dicto_scratch_used_bytes", "Bytes of temp audio in the scratch directory")
+SCRATCH_USED.set_function(lambda: get_scratch_space().usage().used_bytes)
+SCRATCH_ACCOUNTED = Gauge(
+    "dicto_scratch_accounted_bytes", "Scratch quota in use: each request's reservation or its files, if larger"
+)
+SCRATCH_ACCOUNTED.set_function(lambda: get_scratch_space().usage().accounted_bytes)
+SCRATCH_FILES = Gauge("dicto_scratch_files", "Temp audio files in the scratch directory")
+SCRATCH_FILES.set_function(lambda: get_scratch_space().usage().files)
+SCRATCH_QUOTA = Gauge("dicto_scratch_quota_bytes", "Scratch quota shared by this pod's workers")
+SCRATCH_QUOTA.set_function(lambda: get_scratch_space().quota_bytes)
+SCRATCH_FREE = Gauge("dicto_scratch_filesystem_free_bytes", "Free space on the filesystem holding the scratch directory")
+SCRATCH_FREE.set_function(lambda: get_scratch_space().filesystem_free_bytes())
+
+
+_scratch: Optional[ScratchSpace] = None
+_scratch_lock = threading.Lock()
+
+
+def get_scratch_space() -> ScratchSpace:
+    global _scratch
+    with _scratch_lock:
+        if _scratch is None:
+            _scratch = ScratchSpace(
+                os.getenv("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "dicto_scratch")),
+                quota_bytes=int(float(os.getenv("SCRATCH_QUOTA_MB", "1024")) * MIB),
+                max_age_s=float(os.getenv("SCRATCH_MAX_AGE_S", "3600")),
+                reap_interval_s=float(os.getenv("SCRATCH_REAP_INTERVAL_S", "300")),
+            )
+            # Startup: clear what crashed or killed workers left behind
+            _scratch.reap()
+        return _scratch
+
+
+def scratch_path(suffix: str = "") -> str:
+    return get_scratch_space().new_path(suffix)
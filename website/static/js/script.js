@@ -1,3 +1,7 @@
+// Long recordings are uploaded in segments of this length while recording,
+// so the server has folded most of the talk into notes by the time it stops
+const SEGMENT_MS = 60000;
+
 class AudioRecorder {
     constructor() {
         this.mediaRecorder = null;
@@ -7,6 +11,13 @@ class AudioRecorder {
         this.plainTextForCopy = '';
         this.currentTranscript = '';
         this.currentSummary = '';
+        this.currentNoteId = null;
+        this.segmentRecorder = null;
+        this.segmentTimer = null;
+        this.sessionId = null;
+        this.segmentSeq = 0;
+        this.segmentUploads = Promise.resolve(true);
+        this.lastSegment = null;
 
         this.recordBtn = document.getElementById('recordBtn');
         this.stopBtn = document.getElementById('stopBtn');
@@ -52,6 +63,7 @@ class AudioRecorder {
 
             this.mediaRecorder.start(100);
             this.isRecording = true;
+            this.startSegments();
 
             this.updateUI('recording');
             this.status.textContent = 'Recording... Click stop when finished';
@@ -62,8 +74,76 @@ class AudioRecorder {
         }
     }
 
+    newKey() {
+        if (crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        // randomUUID needs a secure context; ids must stay within the server's [A-Za-z0-9-]
+        return Array.from(crypto.getRandomValues(new Uint8Array(16)),
+            (byte) => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    startSegments() {
+        // A second recorder restarted every SEGMENT_MS, so each segment is a standalone file;
+        // the continuous recording above stays as the fallback if a segment upload fails
+        this.sessionId = this.newKey();
+        this.segmentSeq = 0;
+        this.segmentUploads = Promise.resolve(true);
+        this.lastSegment = this.recordSegment();
+        this.segmentTimer = setInterval(() => {
+            const current = this.segmentRecorder;
+            const finished = this.lastSegment;
+            this.lastSegment = this.recordSegment();
+            current.stop();
+            finished.then((blob) => this.queueSegment(blob));
+        }, SEGMENT_MS);
+    }
+
+    recordSegment() {
+        const recorder = new MediaRecorder(this.stream, { mimeType: 'audio/webm;codecs=opus' });
+        const chunks = [];
+        recorder.ondataavailable = (event) => {
+            if (event.data.size > 0) {
+                chunks.push(event.data);
+            }
+        };
+        const done = new Promise((resolve) => {
+            recorder.onstop = () => resolve(new Blob(chunks, { type: 'audio/webm' }));
+        });
+        recorder.start();
+        this.segmentRecorder = recorder;
+        return done;
+    }
+
+    queueSegment(blob) {
+        const seq = this.segmentSeq++;
+        this.segmentUploads = this.segmentUploads.then((ok) => ok && this.uploadSegment(seq, blob));
+    }
+
+    async uploadSegment(seq, blob) {
+        try {
+            const basePath = window.BASE_PATH || '';
+            const response = await fetch(`${basePath}/api/recordings/${this.sessionId}/segments/${seq}`, {
+                method: 'POST',
+                headers: { 'Content-Type': blob.type || 'audio/webm' },
+                body: blob
+            });
+            if (response.status === 409) {
+                // A retry of a segment the server already folded in
+                const result = await response.json();
+                return result.expected_seq > seq;
+            }
+            return response.ok;
+        } catch (error) {
+            console.error('Error uploading segment:', error);
+            return false;
+        }
+    }
+
     stopRecording() {
         if (this.mediaRecorder && this.isRecording) {
+            clearInterval(this.segmentTimer);
+            this.segmentRecorder.stop();
             this.mediaRecorder.stop();
             this.stream.getTracks().forEach(track => track.stop());
             this.isRecording = false;
@@ -84,7 +164,41 @@ class AudioRecorder {
 
         // Store the blob and auto-send
         this.recordedBlob = audioBlob;
+        // One key per recording, so resending it never runs the pipeline twice
+        this.idempotencyKey = this.newKey();
         this.status.textContent = 'Processing your recording...';
+        if (this.segmentSeq > 0) {
+            this.finishSegments();
+        } else {
+            // Shorter than one segment: a single upload is just as fast
+            this.sendAudio();
+        }
+    }
+
+    async finishSegments() {
+        this.status.textContent = 'Summarizing...';
+        const lastSegment = await this.lastSegment;
+        const uploaded = await this.segmentUploads;
+        if (uploaded) {
+            try {
+                const basePath = window.BASE_PATH || '';
+                const response = await fetch(`${basePath}/api/recordings/${this.sessionId}/finish/${this.segmentSeq}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': lastSegment.type || 'audio/webm' },
+                    body: lastSegment
+                });
+                if (response.ok) {
+                    const result = await response.json();
+                    this.currentNoteId = result.note_id || null;
+                    this.displaySummary(result.summary, result.plain_text, result.transcript);
+                    return;
+                }
+                console.error('Server error response:', await response.text());
+            } catch (error) {
+                console.error('Error finishing segmented recording:', error);
+            }
+        }
+        // Fall back to the whole recording in one upload
         this.sendAudio();
     }
 
@@ -117,18 +231,21 @@ class AudioRecorder {
 
         this.status.textContent = 'Transcribing and summarizing...';
 
-        const formData = new FormData();
-        formData.append('audio', this.recordedBlob, 'recording.webm');
-
         try {
             const basePath = window.BASE_PATH || '';
+            // Raw body rather than a form, so the server decodes while uploading
             const response = await fetch(`${basePath}/api/process-audio`, {
                 method: 'POST',
-                body: formData
+                headers: {
+                    'Content-Type': this.recordedBlob.type || 'audio/webm',
+                    'Idempotency-Key': this.idempotencyKey
+                },
+                body: this.recordedBlob
             });
 
             if (response.ok) {
                 const result = await response.json();
+                this.currentNoteId = result.note_id || null;
                 this.displaySummary(result.summary, result.plain_text, result.transcript);
             } else {
                 const errorText = await response.text();
@@ -146,13 +263,24 @@ class AudioRecorder {
         const summarySection = document.querySelector('.summary-section');
         const summaryOutput = document.getElementById('summaryOutput');
 
+        this.currentTranscript = transcript;
+        this.currentSummary = summary;
+        summarySection.style.display = 'block';
+
+        if (!summary) {
+            // Summarization is down: show the transcript, the note is summarized later
+            summaryOutput.textContent = transcript;
+            this.plainTextForCopy = transcript;
+            this.exportPdfBtn.style.display = 'none';
+            this.status.textContent = 'Summary unavailable right now. Your transcript is saved and will be summarized later.';
+            this.updateUI('ready');
+            return;
+        }
+
         // Use marked.js to parse the markdown summary for nice HTML formatting  
         summaryOutput.innerHTML = marked.parse(summary);
         this.plainTextForCopy = plainText;
-        this.currentTranscript = transcript;
-        this.currentSummary = summary;
         
-        summarySection.style.display = 'block';
         this.exportPdfBtn.style.display = 'inline-block';
         this.status.textContent = 'Summary complete! Record again anytime.';
 
@@ -200,19 +328,23 @@ class AudioRecorder {
         this.status.textContent = 'Generating PDF...';
 
         try {
-            const exportData = {
-                transcript: this.currentTranscript,
-                summary: this.currentSummary
-            };
-
             const basePath = window.BASE_PATH || '';
-            const response = await fetch(`${basePath}/api/export-pdf`, {
+            const requestPdf = (exportData) => fetch(`${basePath}/api/export-pdf`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify(exportData)
             });
+            const contentData = { transcript: this.currentTranscript, summary: this.currentSummary };
+
+            // Stored notes are rendered server-side from their id. The note store is
+            // per pod, so after a restart or on another replica the id is unknown:
+            // send the content instead
+            let response = await requestPdf(this.currentNoteId ? { note_id: this.currentNoteId } : contentData);
+            if (response.status === 404 && this.currentNoteId) {
+                response = await requestPdf(contentData);
+            }
 
             if (response.ok) {
                 // Create a blob from the response
@@ -0,0 +1,165 @@
+"""
+Map-reduce summarization for long transcripts
+Token-bounded chunking, parallel chunk summaries with a shared cache,
+and a final reduce into the usual ## Title summary
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from prometheus_client import Counter
+
+from .rate_limit import CHARS_PER_TOKEN, estimate_tokens
+
+SUMMARY_CHUNKS = Counter("dicto_summary_chunks_total", "Map-step chunk summaries", ["cache"])
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunk_transcript(transcript: str, max_tokens: int) -> List[str]:
+    """Split on sentence boundaries into chunks of at most ~max_tokens each"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks: List[str] = []
+    current = ""
+
+    for sentence in SENTENCE_BOUNDARY.split(transcript.strip()):
+        if not sentence:
+            continue
+        # A run-on sentence longer than a chunk gets hard-split on words
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class ChunkSummaryCache:
+    """Chunk summaries keyed by content hash, shared by workers through SQLite.
+
+    Entries expire after ttl_s, and each put prunes expired rows and the
+    oldest beyond max_rows, so the file in the shared tmpdir stays bounded.
+    """
+
+    def __init__(self, db_path: str, ttl_s: float = 7 * 24 * 3600, max_rows: int = 10_000,
+                 clock: Callable[[], float] = time.time):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.max_rows = max_rows
+        self.clock = clock
+        self._local = threading.local()
+        self._connect().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunk_summaries (
+                key TEXT PRIMARY KEY, summary TEXT NOT NULL, created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunk_summaries_created ON chunk_summaries (created);
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(namespace: str, chunk: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{chunk}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT summary FROM chunk_summaries WHERE key = ? AND created >= ?", (key, self.clock() - self.ttl_s)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, summary: str) -> None:
+        conn = self._connect()
+        now = self.clock()
+        conn.execute(
+            "INSERT OR REPLACE INTO chunk_summaries (key, summary, created) VALUES (?, ?, ?)",
+            (key, summary, now),
+        )
+        conn.execute("DELETE FROM chunk_summaries WHERE created < ?", (now - self.ttl_s,))
+        conn.execute(
+            "DELETE FROM chunk_summaries WHERE key IN ("
+            " SELECT key FROM chunk_summaries ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+
+def map_reduce_summary(
+    transcript: str,
+    summarize_chunk: Callable[[str], str],
+    reduce: Callable[[List[str]], str],
+    chunk_tokens: int,
+    max_workers: int = 4,
+    cache: Optional[ChunkSummaryCache] = None,
+    namespace: str = "",
+    cache_namespace: Optional[Callable[[], str]] = None,
+) -> str:
+    """Summarize chunks in parallel, then reduce the partial summaries.
+
+    `namespace` should change whenever the chunk prompt or model does, so
+    stale cached summaries are not reused. New summaries are cached under
+    `cache_namespace()` if given, called on the thread that just ran
+    summarize_chunk (e.g. to file them under the model that served it).
+    """
+    chunks = chunk_transcript(transcript, chunk_tokens)
+
+    def summarize(chunk: str) -> str:
+        key = ChunkSummaryCache.key(namespace, chunk)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                SUMMARY_CHUNKS.labels(cache="hit").inc()
+                return cached
+        SUMMARY_CHUNKS.labels(cache="miss").inc()
+        summary = summarize_chunk(chunk)
+        if cache is not None:
+            cache.put(ChunkSummaryCache.key(cache_namespace(), chunk) if cache_namespace else key, summary)
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        partials = list(pool.map(summarize, chunks))
+    return reduce(partials)
+
+
+def needs_map_reduce(transcript: str, threshold_tokens: int) -> bool:
+    return threshold_tokens > 0 and estimate_tokens(transcript) > threshold_tokens
+
+
+_cache: Optional[ChunkSummaryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_chunk_cache() -> ChunkSummaryCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChunkSummaryCache(
+                os.getenv("SUMMARY_CACHE_DB", os.path.join(tempfile.gettempdir(), "dicto_summary_cache.sqlite3")),
+                ttl_s=float(os.getenv("SUMMARY_CACHE_TTL_S", str(7 * 24 * 3600))),
+                max_rows=int(os.getenv("SUMMARY_CACHE_MAX_ROWS", "10000")),
+            )
+        return _cache
@@ -0,0 +1,125 @@
+"""
+Pluggable transcription backends
+Hosted OpenAI Whisper or a local CPU engine (faster-whisper / CTranslate2,
+int8 quantized) selected with TRANSCRIPTION_BACKEND
+"""
+
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, FrozenSet, Optional
+
+from .rate_limit import acquire_model_budget
+from .resilience import RetryPolicy, call_with_resilience
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionBackend(ABC):
+    """Turns an audio file into text"""
+
+    name = "base"
+    # Containers the backend takes as-is (None: anything ffmpeg decodes) and the largest upload it accepts
+    accepted_formats: Optional[FrozenSet[str]] = None
+    max_upload_bytes: Optional[int] = None
+
+    @abstractmethod
+    def transcribe(self, audio_file_path: str) -> str:
+        ...
+
+    def warm_up(self) -> None:
+        """Load anything expensive ahead of the first request"""
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    name = "openai"
+    accepted_formats = frozenset({"flac", "m4a", "mp3", "mp4", "ogg", "wav", "webm"})
+    max_upload_bytes = 25 * 1024 * 1024
+
+    def __init__(self, client: Any, policy: RetryPolicy, model: str = "whisper-1"):
+        self.client = client
+        self.policy = policy
+        self.model = model
+
+    def transcribe(self, audio_file_path: str) -> str:
+        def request_transcription(timeout: float) -> str:
+            acquire_model_budget(self.model)
+            # Each attempt opens its own handle so hedged requests don't share a file position
+            with open(audio_file_path, "rb") as audio:
+                return self.client.audio.transcriptions.create(
+                    model=self.model, file=audio, response_format="text", timeout=timeout
+                )
+
+        return call_with_resilience("transcription", request_transcription, self.policy)
+
+
+def _load_faster_whisper(model_size: str, compute_type: str, cpu_threads: int) -> Any:
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError as e:
+        raise RuntimeError(
+            "TRANSCRIPTION_BACKEND=local requires faster-whisper (pip install faster-whisper)"
+        ) from e
+    return WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """CPU transcription with an int8-quantized CTranslate2 Whisper model.
+
+    The model is loaded once per process and reused by every request. With
+    gunicorn --preload and TRANSCRIPTION_PRELOAD=true it is loaded in the
+    master before forking, so workers share its pages copy-on-write.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_size: str = "base",
+        compute_type: str = "int8",
+        cpu_threads: int = 0,
+        beam_size: int = 1,
+        model_factory: Callable[[str, str, int], Any] = _load_faster_whisper,
+    ):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.beam_size = beam_size
+        self.model_factory = model_factory
+        self._model: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        with self._lock:
+            if self._model is None:
+                logger.info(
+                    f"Loading local Whisper model {self.model_size} "
+                    f"({self.compute_type}, {self.cpu_threads or 'auto'} threads)"
+                )
+                self._model = self.model_factory(self.model_size, self.compute_type, self.cpu_threads)
+            return self._model
+
+    def warm_up(self) -> None:
+        self.model
+
+    def transcribe(self, audio_file_path: str) -> str:
+        segments, _ = self.model.transcribe(audio_file_path, beam_size=self.beam_size)
+        return " ".join(segment.text.strip() for segment in segments)
+
+
+def create_backend(name: str, client: Any = None, policy: Optional[RetryPolicy] = None) -> TranscriptionBackend:
+    if name == "openai":
+        if client is None or policy is None:
+            raise ValueError("The openai backend needs a client and retry policy")
+        return OpenAIWhisperBackend(client, policy)
+    if name == "local":
+        return LocalWhisperBackend(
+            model_size=os.getenv("LOCAL_WHISPER_MODEL", "base"),
+            compute_type=os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8"),
+            cpu_threads=int(os.getenv("LOCAL_WHISPER_THREADS", "0")),
+            beam_size=int(os.getenv("LOCAL_WHISPER_BEAM_SIZE", "1")),
+        )
+    raise ValueError(f"Unknown transcription backend: {name}")
+
@@ -0,0 +1,333 @@
+"""
+Semantic similarity index for notes
+Pluggable embedders and an append-only, memory-mapped float32 matrix scored
+with vectorized NumPy, plus an optional IVF (k-means cluster) index for
+large collections
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder(ABC):
+    """Maps texts to L2-normalised float32 vectors"""
+
+    name = "base"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder(Embedder):
+    """Local stand-in: signed feature hashing of word unigrams and bigrams.
+
+    No model or network needed, deterministic across processes, and good
+    enough to relate notes that share vocabulary.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = [w.lower() for w in WORD.findall(text)]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dim] += sign
+        return normalize(matrix)
+
+
+class OpenAIEmbedder(Embedder):
+    name = "openai"
+
+    def __init__(self, client: Any, model: str = "text-embedding-3-small", dim: int = 1536):
+        self.client = client
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.model, input=list(texts), dimensions=self.dim)
+        return normalize(np.array([item.embedding for item in response.data], dtype=np.float32))
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def create_embedder(name: str, client: Any = None) -> Embedder:
+    if name == "hashing":
+        return HashingEmbedder(int(os.getenv("EMBEDDING_DIM", "256")))
+    if name == "openai":
+        if client is None:
+            raise ValueError("The openai embedder needs a client")
+        return OpenAIEmbedder(client, dim=int(os.getenv("EMBEDDING_DIM", "1536")))
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means; returns (centroids, assignment per vector)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=clusters, replace=False)].copy()
+    assignment = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        for c in range(clusters):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids, assignment
+
+
+class VectorIndex:
+    """Append-only vector store shared by workers through files in `directory`.
+
+    vectors.f32 holds rows of `dim` float32 values and ids.txt the matching
+    note ids, both appended under an exclusive file lock. A writer that dies
+    between (or during) the two appends leaves one file longer than the other,
+    so both are cut back to their common length on open and before each
+    append. Readers memory-map the matrix and only remap when another process
+    has appended rows.
+    """
+
+    def __init__(self, directory: str, dim: int, ivf_min_vectors: int = 50_000, nprobe: int = 8):
+        self.directory = directory
+        self.dim = dim
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.ids_path = os.path.join(directory, "ids.txt")
+        self.ivf_path = os.path.join(directory, "ivf.npz")
+        self.lock_path = os.path.join(directory, ".lock")
+        self._check_dim()
+        with self._file_lock():
+            self._repair()
+
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._ivf: Optional[Dict[str, np.ndarray]] = None
+        self._ivf_mtime = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Event()
+
+    def _check_dim(self) -> None:
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)["dim"]
+            if stored != self.dim:
+                raise ValueError(f"Index at {self.directory} has dim {stored}, embedder has {self.dim}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"dim": self.dim}, f)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _repair(self) -> None:
+        """Truncate vectors.f32 and ids.txt to the rows both hold completely (call under the file lock)"""
+        if not os.path.exists(self.vectors_path):
+            return
+        row_bytes = self.dim * 4
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes
+        with open(self.ids_path, "ab+") as f:
+            f.seek(0)
+            ids = f.read()
+        # Ignore a partly written last id
+        complete = ids[:ids.rfind(b"\n") + 1]
+        rows = min(vector_rows, complete.count(b"\n"))
+        if os.path.getsize(self.vectors_path) != rows * row_bytes:
+            logger.warning(f"Truncating {self.vectors_path} to {rows} rows")
+            os.truncate(self.vectors_path, rows * row_bytes)
+        keep = sum(len(line) + 1 for line in complete.split(b"\n")[:rows])
+        if len(ids) != keep:
+            logger.warning(f"Truncating {self.ids_path} to {rows} ids")
+            os.truncate(self.ids_path, keep)
+
+    def add(self, note_id: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._file_lock():
+            self._repair()
+            with open(self.vectors_path, "ab") as f:
+                f.write(vector.tobytes())
+            with open(self.ids_path, "a") as f:
+                f.write(note_id + "\n")
+        self._maybe_rebuild_ivf()
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._ids)
+
+    def _refresh(self) -> None:
+        """Remap the matrix if rows were appended, and reload a rebuilt IVF index"""
+        if not os.path.exists(self.vectors_path):
+            return
+        rows_on_disk = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        ivf_mtime = os.path.getmtime(self.ivf_path) if os.path.exists(self.ivf_path) else 0.0
+        with self._lock:
+            if ivf_mtime != self._ivf_mtime:
+                self._ivf_mtime = ivf_mtime
+                self._ivf = None
+                if ivf_mtime:
+                    with np.load(self.ivf_path) as data:
+                        self._ivf = {key: data[key] for key in data.files}
+            if self._matrix is not None and len(self._matrix) == rows_on_disk:
+                return
+            with open(self.ids_path) as f:
+                ids = f.read().split()
+            rows = min(rows_on_disk, len(ids))
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) \
+                if rows else np.zeros((0, self.dim), dtype=np.float32)
+            self._ids = ids[:rows]
+            self._rows = {note_id: row for row, note_id in enumerate(self._ids)}
+
+    def vector(self, note_id: str) -> Optional[np.ndarray]:
+        self._refresh()
+        row = self._rows.get(note_id)
+        return None if row is None else np.array(self._matrix[row])
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows to score exactly: IVF lists nearest the query plus rows added after the build"""
+        if self._ivf is None:
+            return None
+        centroids, offsets, members, built = (
+            self._ivf["centroids"], self._ivf["offsets"], self._ivf["members"], int(self._ivf["built"])
+        )
+        probes = np.argsort(-(centroids @ query))[: self.nprobe]
+        parts = [members[offsets[c]:offsets[c + 1]] for c in probes]
+        parts.append(np.arange(built, len(self._ids)))
+        return np.concatenate(parts)
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Sequence[str] = (),
+               within: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """Top-k (note_id, cosine similarity) pairs, among the ids in `within` if given"""
+        self._refresh()
+        if not self._ids:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        candidates = self._candidate_rows(query)
+        if within is not None:
+            allowed = np.fromiter((self._rows[note_id] for note_id in within if note_id in self._rows),
+                                  dtype=np.int64)
+            candidates = allowed if candidates is None else np.intersect1d(candidates, allowed)
+        if candidates is not None and not len(candidates):
+            # e.g. only empty IVF lists were probed
+            return []
+        matrix = self._matrix if candidates is None else self._matrix[candidates]
+        scores = matrix @ query
+
+        wanted = min(len(scores), k + len(exclude))
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        top = top[np.argsort(-scores[top])]
+        rows = top if candidates is None else candidates[top]
+
+        excluded = set(exclude)
+        results = [(self._ids[row], float(scores[i])) for i, row in zip(top, rows)
+                   if self._ids[row] not in excluded]
+        return results[:k]
+
+    def build_ivf(self, iterations: int = 10) -> None:
+        """Cluster the current rows and write the inverted lists next to the matrix"""
+        self._refresh()
+        total = len(self._ids)
+        clusters = max(1, int(np.sqrt(total)))
+        vectors = np.asarray(self._matrix[:total])
+        centroids, assignment = kmeans(vectors, clusters, iterations)
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        counts = np.bincount(assignment, minlength=clusters)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        tmp_path = self.ivf_path + ".tmp.npz"
+        np.savez(tmp_path, centroids=centroids, offsets=offsets, members=order, built=np.int64(total))
+        os.replace(tmp_path, self.ivf_path)
+        logger.info(f"Built IVF index: {total} vectors in {clusters} clusters")
+
+    def _maybe_rebuild_ivf(self) -> None:
+        """Build the IVF index in the background once the collection is large,
+        and rebuild it when a quarter of the rows are newer than the last build"""
+        if self._rebuilding.is_set():
+            return
+        total = len(self)
+        if total < self.ivf_min_vectors:
+            return
+        built = int(self._ivf["built"]) if self._ivf is not None else 0
+        if built and total - built < built // 4:
+            return
+
+        self._rebuilding.set()
+
+        def rebuild() -> None:
+            try:
+                self.build_ivf()
+            except Exception as e:
+                logger.error(f"IVF rebuild failed: {str(e)}")
+            finally:
+                self._rebuilding.clear()
+
+        threading.Thread(target=rebuild, daemon=True).start()
+
+
+_index: Optional[VectorIndex] = None
+_embedder: Optional[Embedder] = None
+_index_lock = threading.Lock()
+
+
+def get_embedder(client: Any = None) -> Embedder:
+    global _embedder
+    with _index_lock:
+        if _embedder is None:
+            _embedder = create_embedder(os.getenv("EMBEDDER", "hashing"), client)
+        return _embedder
+
+
+def get_vector_index(client: Any = None) -> VectorIndex:
+    global _index
+    embedder = get_embedder(client)
+    with _index_lock:
+        if _index is None:
+            directory = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.getenv("DICTO_DATA_DIR", "data"), "vectors"))
+            _index = VectorIndex(
+                directory,
+                embedder.dim,
+                ivf_min_vectors=int(os.getenv("VECTOR_IVF_MIN_VECTORS", "50000")),
+                nprobe=int(os.getenv("VECTOR_IVF_NPROBE", "8")),
+            )
+        return _index
+
+
+def note_text(transcript: str, summary: str) -> str:
+    """Text embedded for a note: the summary carries the topic, the transcript the detail"""
+    return f"{summary}\n\n{transcript}"
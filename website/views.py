@@ -1,12 +1,29 @@
 import os
+import re
 import tempfile
 import time
-from typing import Dict, Any
-from flask import Blueprint, request, jsonify, current_app, render_template, Response
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Dict
+from flask import Blueprint, request, jsonify, current_app, render_template, Response, make_response
 from openai import OpenAI
 
-from .process_audio import transcribe, process_with_LLM, speed_up_audio
-from .pdf_generator import create_pdf_response
+from .process_audio import (
+    NoSpeechDetected, client, estimate_audio_seconds, fold_segment, ingest_audio_stream, process_with_LLM,
+    speed_up_audio, summarize_from_notes, transcribe,
+)
+from .admission import Job, Overloaded, scheduled_as
+from .audio_ingest import EmptyUpload, TranscodeError, UnsupportedFormat, UploadTooLarge
+from .dedup import FlightTimeout, IdempotencyConflict, StoredResponse, content_key, get_single_flight
+from .latency import get_latency_recorder
+from .model_routing import get_model_router
+from .note_store import Note, get_note_store
+from .owners import current_owner
+from .pdf_generator import create_dyslexia_friendly_pdf, create_pdf_response, pdf_response
+from .recording_sessions import SegmentOutOfOrder, SessionNotFound, get_session_store
+from .resilience import AttemptTimeout, CircuitOpen, DeadlineExceeded, circuit_states
+from .saturation import pod_snapshot, track_pipeline
+from .scratch import ScratchFull, ScratchScope, estimate_scratch_bytes, get_scratch_space
+from .vector_index import get_embedder, get_vector_index
 
 views = Blueprint("views", __name__)
 
@@ -14,6 +31,8 @@ views = Blueprint("views", __name__)
 @views.route("/")
 def home() -> str:
     """Serve the main page"""
+    # Issue the owner cookie before the first recording is sent
+    current_owner()
     return render_template("home.html")
 
 
@@ -34,6 +53,12 @@ def health() -> Response:
     except Exception as e:
         health_status["dependencies"]["openai"] = f"unhealthy: {str(e)}"
         health_status["status"] = "degraded"
+
+    # Upstream circuits as this worker sees them; open ones fail fast
+    health_status["circuits"] = circuit_states()
+    if any(state != "closed" for state in health_status["circuits"].values()):
+        health_status["status"] = "degraded"
+    health_status["models"] = get_model_router().health()
     
     return jsonify(health_status)
 
@@ -49,17 +74,50 @@ def metrics_dashboard() -> str:
         <style>
             body { font-family: monospace; margin: 20px; }
             pre { background: #f5f5f5; padding: 10px; border-radius: 5px; }
+            table { border-collapse: collapse; }
+            th, td { padding: 4px 12px; text-align: right; border-bottom: 1px solid #ddd; }
+            th:first-child, td:first-child { text-align: left; }
             .status-healthy { color: green; }
             .status-degraded { color: orange; }
             .status-unhealthy { color: red; }
+            .errors { color: red; }
         </style>
     </head>
     <body>
         <h1>Dicto Monitoring Dashboard</h1>
-        <p><a href="/health">Health Check JSON</a> | <a href="/metrics">Raw Metrics</a></p>
+        <p><a href="/health">Health Check JSON</a> | <a href="/metrics">Raw Metrics</a> |
+           <a href="/metrics-dashboard/latency">Latency JSON</a></p>
+        <h2>Latency <small id="latency-window"></small></h2>
+        <table>
+            <thead><tr><th>series</th><th>p50</th><th>p95</th><th>p99</th><th>max</th>
+                <th>req/s</th><th>errors</th><th>count</th></tr></thead>
+            <tbody id="latency"><tr><td colspan="8">Loading...</td></tr></tbody>
+        </table>
         <h2>Health Status</h2>
         <pre id="status">Loading...</pre>
         <script>
+            function ms(seconds) {
+                return seconds < 1 ? (seconds * 1000).toFixed(1) + ' ms' : seconds.toFixed(2) + ' s';
+            }
+            function updateLatency() {
+                fetch('/metrics-dashboard/latency')
+                    .then(r => r.json())
+                    .then(data => {
+                        document.getElementById('latency-window').textContent =
+                            '(last ' + data.window_s + 's, ' + data.workers + ' worker(s))';
+                        const rows = Object.entries(data.series).map(([name, s]) =>
+                            '<tr><td>' + name + '</td><td>' + ms(s.p50_s) + '</td><td>' + ms(s.p95_s) +
+                            '</td><td>' + ms(s.p99_s) + '</td><td>' + ms(s.max_s) + '</td><td>' +
+                            s.throughput_per_s.toFixed(2) + '</td><td class="' + (s.error_rate ? 'errors' : '') +
+                            '">' + (s.error_rate * 100).toFixed(1) + '%</td><td>' + s.count + '</td></tr>');
+                        document.getElementById('latency').innerHTML =
+                            rows.join('') || '<tr><td colspan="8">No requests in window</td></tr>';
+                    })
+                    .catch(e => {
+                        document.getElementById('latency').innerHTML =
+                            '<tr><td colspan="8">Error: ' + e.message + '</td></tr>';
+                    });
+            }
             function updateStatus() {
                 fetch('/health')
                     .then(r => r.json())
@@ -72,7 +130,9 @@ def metrics_dashboard() -> str:
                         document.getElementById('status').className = 'status-unhealthy';
                     });
             }
+            updateLatency();
             updateStatus();
+            setInterval(updateLatency, 2000);
             setInterval(updateStatus, 5000);
         </script>
     </body>
@@ -80,18 +140,127 @@ def metrics_dashboard() -> str:
     """
 
 
+@views.route("/metrics-dashboard/latency")
+def latency_summary() -> Response:
+    """Rolling p50/p95/p99, throughput and error rate per stage and endpoint, across this pod's workers"""
+    return jsonify(get_latency_recorder().summary())
+
+
+@views.route("/autoscaling")
+def autoscaling() -> Response:
+    """Pod-wide saturation for the autoscaler: cheap, no upstream calls"""
+    return jsonify(pod_snapshot())
+
+
 @views.route("/api/process-audio", methods=["POST"])
+@track_pipeline
 def process_audio() -> Response:
+    # Stages are scheduled fairly between clients, short recordings in the fast lane
+    job = Job.for_client(_client_id(), estimate_audio_seconds(request.content_length))
     try:
-        if "audio" not in request.files:
-            return jsonify({"error": "No audio file provided"}), 400
+        with scheduled_as(job), _scratch_scope():
+            return _process_audio()
+    except ScratchFull as e:
+        return _pipeline_error_response(e)
 
-        audio_file = request.files["audio"]
-        
-        if audio_file.filename == "":
-            return jsonify({"error": "No audio file selected"}), 400
-            
-        temp_path = speed_up_audio(audio_file) # creates temp file for sped up audio
+
+def _scratch_scope() -> ContextManager[ScratchScope]:
+    """Charge the request's temp files to the scratch quota, deleting any left when it ends"""
+    return get_scratch_space().request_scope(estimate_scratch_bytes(request.content_length))
+
+
+def _client_id() -> str:
+    """Who the request is for: CLIENT_ID_HEADER (e.g. X-Forwarded-For behind a proxy) or the peer address.
+
+    Proxies append to the header, so only its last CLIENT_ID_TRUSTED_HOPS
+    entries come from our own proxies; anything left of them is whatever the
+    client sent. The entry our outermost proxy appended is the client.
+    """
+    header = os.getenv("CLIENT_ID_HEADER")
+    hops = [hop.strip() for hop in request.headers.get(header, "").split(",")] if header else []
+    hops = [hop for hop in hops if hop]
+    if not hops:
+        return request.remote_addr or ""
+    trusted = max(1, int(os.getenv("CLIENT_ID_TRUSTED_HOPS", "1")))
+    return hops[-min(trusted, len(hops))]
+
+
+def _process_audio() -> Response:
+    # A raw audio body is decoded while it uploads; multipart forms are
+    # received in full by Werkzeug first
+    if request.mimetype.startswith("audio/") or request.mimetype == "application/octet-stream":
+        return _process_audio_stream()
+
+    if "audio" not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+
+    audio_file = request.files["audio"]
+
+    if audio_file.filename == "":
+        return jsonify({"error": "No audio file selected"}), 400
+
+    fingerprint = content_key(audio_file.stream.read())
+    audio_file.stream.seek(0)
+    return _deduplicated(fingerprint, lambda: _process_recording(lambda: speed_up_audio(audio_file)))
+
+
+def _process_audio_stream() -> Response:
+    """Pipe the request body into the decoder as it arrives"""
+    # The size cap is enforced while streaming by ingest_audio_stream
+    request.max_content_length = None
+    try:
+        upload = ingest_audio_stream(request.stream, request.content_length)
+    except Exception as e:
+        return _pipeline_error_response(e)
+
+    try:
+        return _deduplicated(f"sha256:{upload.sha256}", lambda: _process_recording(lambda: upload.path))
+    finally:
+        if os.path.exists(upload.path):
+            os.unlink(upload.path)
+
+
+def _deduplicated(fingerprint: str, compute: Callable[[], Response]) -> Response:
+    """Share one pipeline run between duplicate submissions (double clicks,
+    client or proxy retries), keyed by Idempotency-Key when sent, else by
+    content hash"""
+    idempotency_key = request.headers.get("Idempotency-Key", "").strip()
+    # Per owner, so an identical recording from someone else never replays their note
+    key = f"{current_owner()}:" + (f"idem:{idempotency_key}" if idempotency_key else fingerprint)
+
+    owner_response: Dict[str, Response] = {}
+
+    def run() -> StoredResponse:
+        response = make_response(compute())
+        owner_response["response"] = response
+        stored = StoredResponse(response.status_code, response.get_data(as_text=True))
+        if (response.get_json(silent=True) or {}).get("status") == "summary_pending":
+            # Hand it to duplicates already waiting, but let a later retry get the real summary
+            stored.ttl_s = float(os.getenv("DEDUP_PENDING_TTL_S", "5"))
+        return stored
+
+    try:
+        stored, outcome = get_single_flight().run(
+            key, fingerprint, run, wait_timeout_s=float(os.getenv("DEDUP_WAIT_S", "240"))
+        )
+    except IdempotencyConflict:
+        return jsonify({"error": "Idempotency-Key was already used for a different recording"}), 422
+    except FlightTimeout:
+        response = jsonify({"error": "An identical request is still being processed, please retry"})
+        response.headers["Retry-After"] = "5"
+        return response, 409
+
+    if outcome == "owner":
+        return owner_response["response"]
+    response = current_app.response_class(stored.body, status=stored.status, mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _process_recording(decode: Callable[[], str]) -> Response:
+    """Run the transcribe and summarize pipeline on the sped-up audio file from decode()"""
+    try:
+        temp_path = decode()
         
         try:
             transcript = transcribe(temp_path)
@@ -101,9 +270,128 @@ def process_audio() -> Response:
                 os.unlink(temp_path)
 
     except Exception as e:
-        current_app.logger.error(f"Error processing audio: {str(e)}")
-        return jsonify({"error": "Failed to process audio", "details": str(e)}), 500
+        return _pipeline_error_response(e)
+
+
+def _pipeline_error_response(e: Exception) -> Response:
+    if isinstance(e, Overloaded):
+        current_app.logger.warning(f"Shedding request: {str(e)}")
+        response = jsonify({"error": "Server busy, please retry", "details": str(e)})
+        response.headers["Retry-After"] = e.retry_after_header
+        return response, 429
+    if isinstance(e, EmptyUpload):
+        return jsonify({"error": "No audio file provided"}), 400
+    if isinstance(e, UploadTooLarge):
+        return jsonify({"error": "Recording too large", "details": str(e)}), 413
+    if isinstance(e, UnsupportedFormat):
+        return jsonify({"error": "Unsupported audio format", "details": str(e)}), 400
+    if isinstance(e, TranscodeError):
+        current_app.logger.warning(f"Could not decode upload: {str(e)}")
+        return jsonify({"error": "Could not decode audio", "details": str(e)}), 400
+    if isinstance(e, CircuitOpen):
+        current_app.logger.warning(f"Failing fast: {str(e)}")
+        response = jsonify({"error": "Upstream service unavailable, please retry", "details": str(e)})
+        response.headers["Retry-After"] = e.retry_after_header
+        return response, 503
+    if isinstance(e, (DeadlineExceeded, AttemptTimeout)):
+        current_app.logger.error(f"Upstream deadline exceeded: {str(e)}")
+        return jsonify({"error": "Upstream service timed out", "details": str(e)}), 504
+    current_app.logger.error(f"Error processing audio: {str(e)}")
+    return jsonify({"error": "Failed to process audio", "details": str(e)}), 500
     
+SESSION_ID = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+
+@views.route("/api/recordings/<session_id>/segments/<int:seq>", methods=["POST"])
+@track_pipeline
+def add_recording_segment(session_id: str, seq: int) -> Response:
+    """Transcribe the next segment of a recording in progress and fold it into its running notes"""
+    if not SESSION_ID.match(session_id):
+        return jsonify({"error": "Invalid session id"}), 400
+    if not _has_audio_body():
+        return jsonify({"error": "No audio provided"}), 400
+
+    store = get_session_store()
+    owner = current_owner()
+    job = Job.for_client(_client_id(), estimate_audio_seconds(request.content_length))
+    try:
+        session = store.check_next(session_id, seq, owner=owner)
+        with scheduled_as(job), _scratch_scope():
+            segment = _transcribe_body()
+            notes = session.notes if session else ""
+            if segment:
+                notes = fold_segment(notes, segment)
+        session = store.append(session_id, seq, segment, notes, owner=owner)
+    except SegmentOutOfOrder as e:
+        return _out_of_order(e)
+    except SessionNotFound:
+        return _session_not_found()
+    except Exception as e:
+        return _pipeline_error_response(e)
+
+    return jsonify({"session_id": session_id, "next_seq": session.next_seq, "notes": session.notes,
+                    "segment_transcript": segment})
+
+
+@views.route("/api/recordings/<session_id>/finish/<int:seq>", methods=["POST"])
+@track_pipeline
+def finish_recording(session_id: str, seq: int) -> Response:
+    """Summarize a segmented recording from its running notes and last segment (the body, if any)"""
+    if not SESSION_ID.match(session_id):
+        return jsonify({"error": "Invalid session id"}), 400
+    owner = current_owner()
+    job = Job.for_client(_client_id(), estimate_audio_seconds(request.content_length))
+
+    def compute() -> Response:
+        store = get_session_store()
+        try:
+            session = store.check_next(session_id, seq, owner=owner)
+            with scheduled_as(job), _scratch_scope():
+                last_segment = _transcribe_body() if _has_audio_body() else ""
+                transcript = f"{session.transcript if session else ''} {last_segment}".strip()
+                if not transcript:
+                    return jsonify({"error": "No speech detected in audio"}), 400
+                result = summarize_from_notes(session.notes if session else "", last_segment, transcript)
+        except SegmentOutOfOrder as e:
+            return _out_of_order(e)
+        except SessionNotFound:
+            return _session_not_found()
+        except Exception as e:
+            return _pipeline_error_response(e)
+        store.delete(session_id, owner=owner)
+        return jsonify(result)
+
+    # A retried finish replays the first one's response instead of finding the session gone;
+    # per owner, so nobody else can replay it
+    return _deduplicated(f"{owner}:recording:{session_id}:{seq}", compute)
+
+
+def _has_audio_body() -> bool:
+    return (request.mimetype.startswith("audio/") or request.mimetype == "application/octet-stream") \
+        and request.content_length != 0
+
+
+def _transcribe_body() -> str:
+    """Transcript of a raw audio request body; silence is an empty string"""
+    request.max_content_length = None
+    upload = ingest_audio_stream(request.stream, request.content_length)
+    try:
+        return transcribe(upload.path)
+    except NoSpeechDetected:
+        return ""
+    finally:
+        if os.path.exists(upload.path):
+            os.unlink(upload.path)
+
+
+def _out_of_order(e: SegmentOutOfOrder) -> Response:
+    return jsonify({"error": "Segment out of order", "expected_seq": e.expected_seq}), 409
+
+
+def _session_not_found() -> Response:
+    return jsonify({"error": "Recording session not found"}), 404
+
+
 @views.route("/api/export-pdf", methods=["POST"])
 def export_pdf() -> Response:
     """Export the current summary as a PDF"""
@@ -112,6 +400,14 @@ def export_pdf() -> Response:
         
         if not data:
             return jsonify({"error": "No data provided"}), 400
+
+        # Stored notes are rendered server-side, so the client only sends the id
+        note_id = data.get("note_id")
+        if note_id:
+            note = get_note_store().get(note_id, owner=current_owner())
+            if note is None:
+                return jsonify({"error": "Note not found"}), 404
+            return _note_pdf_response(note)
             
         transcript = data.get("transcript", "")
         summary = data.get("summary", "")
@@ -125,3 +421,95 @@ def export_pdf() -> Response:
     except Exception as e:
         current_app.logger.error(f"Error creating PDF: {str(e)}")
         return jsonify({"error": "Failed to create PDF", "details": str(e)}), 500
+
+
+@views.route("/api/notes/search")
+def search_notes() -> Response:
+    """Full-text search over the caller's stored transcripts and summaries"""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "No search query provided"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    try:
+        page = get_note_store().search(query, owner=current_owner(), limit=limit,
+                                       cursor=request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "results": [hit.to_dict() for hit in page.hits],
+        "next_cursor": page.next_cursor,
+    })
+
+
+@views.route("/api/notes/semantic-search")
+def semantic_search() -> Response:
+    """The caller's notes closest in meaning to a free-text query"""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "No search query provided"}), 400
+    k = min(max(request.args.get("k", 10, type=int), 1), 50)
+    try:
+        vector = get_embedder(client).embed([query])[0]
+    except Exception as e:
+        return _pipeline_error_response(e)
+    owned = get_note_store().note_ids(current_owner())
+    return jsonify({"results": _similar_notes(get_vector_index(client).search(vector, k, within=owned))})
+
+
+@views.route("/api/notes/<note_id>/related")
+def related_notes(note_id: str) -> Response:
+    """The caller's notes most similar to one of theirs"""
+    store = get_note_store()
+    index = get_vector_index(client)
+    vector = index.vector(note_id)
+    if vector is None or store.get(note_id, owner=current_owner()) is None:
+        return jsonify({"error": "Note not found"}), 404
+    k = min(max(request.args.get("k", 5, type=int), 1), 50)
+    owned = store.note_ids(current_owner())
+    return jsonify({"results": _similar_notes(index.search(vector, k, exclude=[note_id], within=owned))})
+
+
+def _similar_notes(matches: list) -> list:
+    """Attach titles to (note_id, score) matches, skipping notes since deleted"""
+    store = get_note_store()
+    results = []
+    for match_id, score in matches:
+        note = store.get(match_id, owner=current_owner())
+        if note is None:
+            continue
+        title = note.summary.strip().splitlines()[0].strip("# ") if note.summary.strip() else ""
+        results.append({"note_id": match_id, "score": round(score, 4), "title": title})
+    return results
+
+
+@views.route("/api/notes/<note_id>")
+def get_note(note_id: str) -> Response:
+    """Return one of the caller's stored notes for re-rendering"""
+    note = get_note_store().get(note_id, owner=current_owner())
+    if note is None:
+        return jsonify({"error": "Note not found"}), 404
+    return jsonify(note.to_dict())
+
+
+@views.route("/api/notes/<note_id>/pdf")
+def note_pdf(note_id: str) -> Response:
+    """Export a stored note as a PDF"""
+    try:
+        note = get_note_store().get(note_id, owner=current_owner())
+        if note is None:
+            return jsonify({"error": "Note not found"}), 404
+        return _note_pdf_response(note)
+    except Exception as e:
+        current_app.logger.error(f"Error creating PDF: {str(e)}")
+        return jsonify({"error": "Failed to create PDF", "details": str(e)}), 500
+
+
+def _note_pdf_response(note: Note) -> Response:
+    """Serve the note's PDF, rendering and caching it on first request"""
+    store = get_note_store()
+    timestamp = datetime.fromtimestamp(note.created)
+    pdf_content = store.get_artifact(note.id, "pdf")
+    if pdf_content is None:
+        pdf_content = create_dyslexia_friendly_pdf(note.transcript, note.summary, timestamp)
+        store.put_artifact(note.id, "pdf", pdf_content)
+    return pdf_response(pdf_content, timestamp)